@@ -57,7 +57,7 @@ export default function Chart() {
 
       try {
         const res = await fetch(
-          `${API_BASE}/stock-history?ticker=${ticker}&range=${timeRange}`
+          `${API_BASE}/stock-history?ticker=${ticker}&range=${timeRange}&format=columnar`
         );
         
         if (!res.ok) {
@@ -65,28 +65,25 @@ export default function Chart() {
         }
 
         const json = await res.json();
-        const history = json.history || [];
+        const times = json.t || [];
+        const prices = json.price || [];
+        const sentiments = json.sentiment || [];
 
-        // Transform data for the chart
-        const chartData = history.map((record) => ({
-          date: new Date(record.recorded_at).toLocaleString("en-US", {
+        // Transform columnar arrays (epoch ms, already oldest → newest) for the chart
+        const chartData = times.map((ms, i) => ({
+          date: new Date(ms).toLocaleString("en-US", {
             month: "short",
             day: "numeric",
             hour: "2-digit",
             minute: "2-digit",
             timeZone: "America/New_York", // Force EST
           }),
-          price: parseFloat(record.price) || 0,
-          sentiment: parseFloat(record.avg_sentiment) || 0,
-          timestamp: record.recorded_at,
+          price: prices[i] || 0,
+          sentiment: sentiments[i] || 0,
+          timestamp: ms,
         }));
 
-        // Sort data by timestamp (oldest → newest)
-        const sortedData = chartData.sort(
-          (a, b) => new Date(a.timestamp) - new Date(b.timestamp)
-        );
-
-        setData(sortedData);
+        setData(chartData);
       } catch (err) {
         console.error("Failed to load stock history:", err);
         setError(err.message);
@@ -1,4 +1,4 @@
-import {useEffect, useState, useCallback} from "react";
+import {useEffect, useState, useCallback, useRef} from "react";
 import {getWatchlist, saveWatchlist } from "../utils/storage";
 import "./Watchlist.css"
 
@@ -7,10 +7,15 @@ const API_BASE = process.env.REACT_APP_API_BASE_URL;
 
 const USER_ID = 1; // until Cognito is hooked up
 
+// How often to poll for changed quotes once the watchlist has loaded
+const QUOTE_POLL_MS = 60000;
+
 export default function Watchlist({ onWatchlistChange }) {
     // Track ticker list, input value, and user error message. 
     const [items, setItems] = useState([]);
     const [quotes, setQuotes] = useState([]);
+    // Delta-sync mark from the last watchlist response (?since=)
+    const sinceRef = useRef(null);
     const count = items.length;
 
     // Fetch quotes for a list of tickers and update state
@@ -45,7 +50,8 @@ export default function Watchlist({ onWatchlistChange }) {
                 return;
             }
             try {
-                const res = await fetch(`${API_BASE}/watchlist?user_id=${encodeURIComponent(USER_ID)}`);
+                // One request returns the tickers together with their latest quotes
+                const res = await fetch(`${API_BASE}/watchlist?user_id=${encodeURIComponent(USER_ID)}&include=quotes`);
                 if (!res.ok) {
                     throw new Error("bad status");
                 }
@@ -53,7 +59,8 @@ export default function Watchlist({ onWatchlistChange }) {
                 const tickers = data.tickers || [];
                 setItems(tickers);
                 saveWatchlist(tickers);
-                await fetchQuotesFor(tickers);
+                setQuotes(data.quotes || []);
+                sinceRef.current = data.next_since || null;
                 if (onWatchlistChange) {
                     onWatchlistChange(tickers);
                 }
@@ -74,14 +81,48 @@ export default function Watchlist({ onWatchlistChange }) {
         return () => window.removeEventListener('watchlist-updated', handleUpdate);
     }, [fetchQuotesFor, onWatchlistChange]);
 
-    async function syncRemove(ticker) {
+    // Poll for quotes that changed since the last response; only those come back
+    useEffect(() => {
         if (!API_BASE) {
             return;
         }
+        const poll = async () => {
+            if (!sinceRef.current) {
+                return;
+            }
+            try {
+                const res = await fetch(
+                    `${API_BASE}/watchlist?user_id=${encodeURIComponent(USER_ID)}&include=quotes&since=${encodeURIComponent(sinceRef.current)}`
+                );
+                if (!res.ok) throw new Error(`watchlist ${res.status}`);
+                const data = await res.json();
+                sinceRef.current = data.next_since || sinceRef.current;
+                const tickers = data.tickers || [];
+                setItems(tickers);
+                if (data.changed) {
+                    setQuotes((prev) => {
+                        const changed = new Map((data.quotes || []).map((q) => [q.ticker, q]));
+                        const kept = prev.filter((q) => !changed.has(q.ticker) && tickers.includes(q.ticker));
+                        return [...kept, ...changed.values()];
+                    });
+                }
+            } catch (e) {
+                console.warn("Polling quotes failed:", e);
+            }
+        };
+        const id = setInterval(poll, QUOTE_POLL_MS);
+        return () => clearInterval(id);
+    }, []);
+
+    // Remove one or more tickers on the backend in a single request
+    async function syncRemove(tickers) {
+        if (!API_BASE || !tickers.length) {
+            return;
+        }
         await fetch(`${API_BASE}/watchlist`, {
             method: "DELETE",
             headers: { "Content-Type": "application/json" },
-            body: JSON.stringify({ user_id: USER_ID, ticker }),
+            body: JSON.stringify({ user_id: USER_ID, tickers }),
         });
     }     
 
@@ -90,7 +131,7 @@ export default function Watchlist({ onWatchlistChange }) {
         const next = items.filter((t) => t !== symbol);
         setItems(next);
         saveWatchlist(next);
-        try { await syncRemove(symbol); } catch (err) { console.error(err); }
+        try { await syncRemove([symbol]); } catch (err) { console.error(err); }
         await fetchQuotesFor(next);
         if (onWatchlistChange) {
             onWatchlistChange(next);
@@ -106,7 +147,7 @@ export default function Watchlist({ onWatchlistChange }) {
         }
 
         // best effort clear on backend
-        items.forEach((t) => syncRemove(t).catch(() => {}));
+        syncRemove(items).catch(() => {});
         setItems([]);
         saveWatchlist([]);
         setQuotes([]);
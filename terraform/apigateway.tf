@@ -4,6 +4,11 @@
 resource "aws_api_gateway_rest_api" "stock-news-analyzer-api" {
   name        = "stock-news-analyzer-rest-api"
   description = "REST API for Stock News Analyzer"
+
+  # Lets get_stocks return gzip/brotli bodies via isBase64Encoded. Request
+  # bodies then reach the proxy Lambdas base64-encoded (both decode them),
+  # and the MOCK preflight integrations convert theirs back to text.
+  binary_media_types = ["*/*"]
 }
 
 # ========================================
@@ -208,7 +213,7 @@ resource "aws_lambda_function" "init_db_lambda" {
   role          = aws_iam_role.lambda_role.arn
   handler       = "handler.lambda_handler"
   runtime       = "python3.12"
-  timeout = 60 
+  timeout = 900 # online index builds on history tables can take minutes
   filename         = data.archive_file.init_rds_zip.output_path
   source_code_hash = data.archive_file.init_rds_zip.output_base64sha256
 
@@ -246,6 +251,10 @@ resource "aws_api_gateway_integration" "stocks_options" {
   resource_id = aws_api_gateway_resource.stocks.id
   http_method = aws_api_gateway_method.stocks_options.http_method
   type        = "MOCK"
+
+  # binary_media_types is */*, so without this the preflight body arrives as
+  # binary, the template below is skipped and the OPTIONS call fails
+  content_handling = "CONVERT_TO_TEXT"
   
   request_templates = {
     "application/json" = "{\"statusCode\": 200}"
@@ -287,6 +296,8 @@ resource "aws_api_gateway_integration" "watchlist_options" {
   resource_id = aws_api_gateway_resource.watchlist.id
   http_method = aws_api_gateway_method.watchlist_options.http_method
   type        = "MOCK"
+
+  content_handling = "CONVERT_TO_TEXT"
   
   request_templates = {
     "application/json" = "{\"statusCode\": 200}"
@@ -310,6 +321,8 @@ resource "aws_api_gateway_integration" "quotes_options" {
   resource_id = aws_api_gateway_resource.quotes.id
   http_method = aws_api_gateway_method.quotes_options.http_method
   type        = "MOCK"
+
+  content_handling = "CONVERT_TO_TEXT"
   
   request_templates = {
     "application/json" = "{\"statusCode\": 200}"
@@ -333,6 +346,8 @@ resource "aws_api_gateway_integration" "notify_options" {
   resource_id = aws_api_gateway_resource.notify.id
   http_method = aws_api_gateway_method.notify_options.http_method
   type        = "MOCK"
+
+  content_handling = "CONVERT_TO_TEXT"
   
   request_templates = {
     "application/json" = "{\"statusCode\": 200}"
@@ -521,19 +536,27 @@ resource "aws_api_gateway_deployment" "api_deployment" {
       aws_api_gateway_resource.watchlist.id,
       aws_api_gateway_resource.quotes.id,
       aws_api_gateway_resource.stock_history.id,  # ADD THIS
+      aws_api_gateway_resource.stock_history_batch.id,
       aws_api_gateway_resource.notify.id,
+      aws_api_gateway_resource.alerts.id,
       aws_api_gateway_method.get_stocks.id,
       aws_api_gateway_method.get_watchlist.id,
       aws_api_gateway_method.post_watchlist.id,
       aws_api_gateway_method.delete_watchlist.id,
       aws_api_gateway_method.get_quotes.id,
       aws_api_gateway_method.get_stock_history.id,  # ADD THIS
+      aws_api_gateway_method.get_stock_history_batch.id,
       aws_api_gateway_method.post_notify.id,
+      aws_api_gateway_method.get_alerts.id,
+      aws_api_gateway_method.post_alerts.id,
+      aws_api_gateway_method.delete_alerts.id,
       aws_api_gateway_method.stocks_options.id,
       aws_api_gateway_method.watchlist_options.id,
       aws_api_gateway_method.quotes_options.id,
       aws_api_gateway_method.stock_history_options.id,  # ADD THIS
+      aws_api_gateway_method.stock_history_batch_options.id,
       aws_api_gateway_method.notify_options.id,
+      aws_api_gateway_method.alerts_options.id,
       aws_api_gateway_method_response.post_notify_200.id,
       aws_api_gateway_method_response.post_notify_500.id,
       aws_api_gateway_integration.get_stocks_lambda_integration.id,
@@ -542,12 +565,18 @@ resource "aws_api_gateway_deployment" "api_deployment" {
       aws_api_gateway_integration.delete_watchlist_lambda_integration.id,
       aws_api_gateway_integration.get_quotes_lambda_integration.id,
       aws_api_gateway_integration.get_stock_history_lambda_integration.id,  # ADD THIS
+      aws_api_gateway_integration.get_stock_history_batch_lambda_integration.id,
       aws_api_gateway_integration.post_notify_lambda_integration.id,
+      aws_api_gateway_integration.get_alerts_lambda_integration.id,
+      aws_api_gateway_integration.post_alerts_lambda_integration.id,
+      aws_api_gateway_integration.delete_alerts_lambda_integration.id,
       aws_api_gateway_integration.notify_options.id,
       aws_api_gateway_integration.stocks_options.id,
       aws_api_gateway_integration.watchlist_options.id,
       aws_api_gateway_integration.quotes_options.id,
       aws_api_gateway_integration.stock_history_options.id,  # ADD THIS
+      aws_api_gateway_integration.stock_history_batch_options.id,
+      aws_api_gateway_integration.alerts_options.id,
     ]))
   }
 
@@ -562,17 +591,25 @@ resource "aws_api_gateway_deployment" "api_deployment" {
     aws_api_gateway_integration.delete_watchlist_lambda_integration,
     aws_api_gateway_integration.get_quotes_lambda_integration,
     aws_api_gateway_integration.get_stock_history_lambda_integration,  # ADD THIS
+    aws_api_gateway_integration.get_stock_history_batch_lambda_integration,
     aws_api_gateway_integration.post_notify_lambda_integration,
+    aws_api_gateway_integration.get_alerts_lambda_integration,
+    aws_api_gateway_integration.post_alerts_lambda_integration,
+    aws_api_gateway_integration.delete_alerts_lambda_integration,
     aws_api_gateway_integration.stocks_options,
     aws_api_gateway_integration.watchlist_options,
     aws_api_gateway_integration.quotes_options,
     aws_api_gateway_integration.stock_history_options,  # ADD THIS
+    aws_api_gateway_integration.stock_history_batch_options,
     aws_api_gateway_integration.notify_options,
+    aws_api_gateway_integration.alerts_options,
     aws_api_gateway_integration_response.stocks_options,
     aws_api_gateway_integration_response.watchlist_options,
     aws_api_gateway_integration_response.quotes_options,
     aws_api_gateway_integration_response.stock_history_options,  # ADD THIS
+    aws_api_gateway_integration_response.stock_history_batch_options,
     aws_api_gateway_integration_response.notify_options,
+    aws_api_gateway_integration_response.alerts_options,
     aws_api_gateway_method_response.post_notify_200,
     aws_api_gateway_method_response.post_notify_500,
   ]
@@ -625,6 +662,8 @@ resource "aws_api_gateway_integration" "stock_history_options" {
   resource_id = aws_api_gateway_resource.stock_history.id
   http_method = aws_api_gateway_method.stock_history_options.http_method
   type        = "MOCK"
+
+  content_handling = "CONVERT_TO_TEXT"
   
   request_templates = {
     "application/json" = "{\"statusCode\": 200}"
@@ -660,4 +699,184 @@ resource "aws_api_gateway_integration_response" "stock_history_options" {
   }
   
   depends_on = [aws_api_gateway_integration.stock_history_options]
-}
\ No newline at end of file
+}
+
+# ========================================
+# API Gateway Resource - /stock-history/batch
+# ========================================
+resource "aws_api_gateway_resource" "stock_history_batch" {
+  rest_api_id = aws_api_gateway_rest_api.stock-news-analyzer-api.id
+  parent_id   = aws_api_gateway_resource.stock_history.id
+  path_part   = "batch"
+}
+
+# GET /stock-history/batch?tickers=AAPL,MSFT&range=30d
+resource "aws_api_gateway_method" "get_stock_history_batch" {
+  rest_api_id   = aws_api_gateway_rest_api.stock-news-analyzer-api.id
+  resource_id   = aws_api_gateway_resource.stock_history_batch.id
+  http_method   = "GET"
+  authorization = "NONE"
+}
+
+resource "aws_api_gateway_method" "stock_history_batch_options" {
+  rest_api_id   = aws_api_gateway_rest_api.stock-news-analyzer-api.id
+  resource_id   = aws_api_gateway_resource.stock_history_batch.id
+  http_method   = "OPTIONS"
+  authorization = "NONE"
+}
+
+resource "aws_api_gateway_integration" "get_stock_history_batch_lambda_integration" {
+  rest_api_id             = aws_api_gateway_rest_api.stock-news-analyzer-api.id
+  resource_id             = aws_api_gateway_resource.stock_history_batch.id
+  http_method             = aws_api_gateway_method.get_stock_history_batch.http_method
+  integration_http_method = "POST"
+  type                    = "AWS_PROXY"
+  uri                     = aws_lambda_function.get_stocks_lambda.invoke_arn
+}
+
+resource "aws_api_gateway_integration" "stock_history_batch_options" {
+  rest_api_id = aws_api_gateway_rest_api.stock-news-analyzer-api.id
+  resource_id = aws_api_gateway_resource.stock_history_batch.id
+  http_method = aws_api_gateway_method.stock_history_batch_options.http_method
+  type        = "MOCK"
+
+  content_handling = "CONVERT_TO_TEXT"
+
+  request_templates = {
+    "application/json" = "{\"statusCode\": 200}"
+  }
+}
+
+resource "aws_api_gateway_method_response" "stock_history_batch_options_200" {
+  rest_api_id = aws_api_gateway_rest_api.stock-news-analyzer-api.id
+  resource_id = aws_api_gateway_resource.stock_history_batch.id
+  http_method = aws_api_gateway_method.stock_history_batch_options.http_method
+  status_code = "200"
+
+  response_parameters = {
+    "method.response.header.Access-Control-Allow-Headers" = true
+    "method.response.header.Access-Control-Allow-Methods" = true
+    "method.response.header.Access-Control-Allow-Origin"  = true
+  }
+}
+
+resource "aws_api_gateway_integration_response" "stock_history_batch_options" {
+  rest_api_id = aws_api_gateway_rest_api.stock-news-analyzer-api.id
+  resource_id = aws_api_gateway_resource.stock_history_batch.id
+  http_method = aws_api_gateway_method.stock_history_batch_options.http_method
+  status_code = "200"
+
+  response_parameters = {
+    "method.response.header.Access-Control-Allow-Headers" = "'Content-Type,Authorization'"
+    "method.response.header.Access-Control-Allow-Methods" = "'GET,OPTIONS'"
+    "method.response.header.Access-Control-Allow-Origin"  = "'*'"
+  }
+
+  depends_on = [aws_api_gateway_integration.stock_history_batch_options]
+}
+
+# ========================================
+# API Gateway Resource - /alerts
+# ========================================
+resource "aws_api_gateway_resource" "alerts" {
+  rest_api_id = aws_api_gateway_rest_api.stock-news-analyzer-api.id
+  parent_id   = aws_api_gateway_rest_api.stock-news-analyzer-api.root_resource_id
+  path_part   = "alerts"
+}
+
+# GET /alerts?user_id=1, POST/DELETE /alerts with a JSON body
+resource "aws_api_gateway_method" "get_alerts" {
+  rest_api_id   = aws_api_gateway_rest_api.stock-news-analyzer-api.id
+  resource_id   = aws_api_gateway_resource.alerts.id
+  http_method   = "GET"
+  authorization = "NONE"
+}
+
+resource "aws_api_gateway_method" "post_alerts" {
+  rest_api_id   = aws_api_gateway_rest_api.stock-news-analyzer-api.id
+  resource_id   = aws_api_gateway_resource.alerts.id
+  http_method   = "POST"
+  authorization = "NONE"
+}
+
+resource "aws_api_gateway_method" "delete_alerts" {
+  rest_api_id   = aws_api_gateway_rest_api.stock-news-analyzer-api.id
+  resource_id   = aws_api_gateway_resource.alerts.id
+  http_method   = "DELETE"
+  authorization = "NONE"
+}
+
+resource "aws_api_gateway_method" "alerts_options" {
+  rest_api_id   = aws_api_gateway_rest_api.stock-news-analyzer-api.id
+  resource_id   = aws_api_gateway_resource.alerts.id
+  http_method   = "OPTIONS"
+  authorization = "NONE"
+}
+
+resource "aws_api_gateway_integration" "get_alerts_lambda_integration" {
+  rest_api_id             = aws_api_gateway_rest_api.stock-news-analyzer-api.id
+  resource_id             = aws_api_gateway_resource.alerts.id
+  http_method             = aws_api_gateway_method.get_alerts.http_method
+  integration_http_method = "POST"
+  type                    = "AWS_PROXY"
+  uri                     = aws_lambda_function.get_stocks_lambda.invoke_arn
+}
+
+resource "aws_api_gateway_integration" "post_alerts_lambda_integration" {
+  rest_api_id             = aws_api_gateway_rest_api.stock-news-analyzer-api.id
+  resource_id             = aws_api_gateway_resource.alerts.id
+  http_method             = aws_api_gateway_method.post_alerts.http_method
+  integration_http_method = "POST"
+  type                    = "AWS_PROXY"
+  uri                     = aws_lambda_function.get_stocks_lambda.invoke_arn
+}
+
+resource "aws_api_gateway_integration" "delete_alerts_lambda_integration" {
+  rest_api_id             = aws_api_gateway_rest_api.stock-news-analyzer-api.id
+  resource_id             = aws_api_gateway_resource.alerts.id
+  http_method             = aws_api_gateway_method.delete_alerts.http_method
+  integration_http_method = "POST"
+  type                    = "AWS_PROXY"
+  uri                     = aws_lambda_function.get_stocks_lambda.invoke_arn
+}
+
+resource "aws_api_gateway_integration" "alerts_options" {
+  rest_api_id = aws_api_gateway_rest_api.stock-news-analyzer-api.id
+  resource_id = aws_api_gateway_resource.alerts.id
+  http_method = aws_api_gateway_method.alerts_options.http_method
+  type        = "MOCK"
+
+  content_handling = "CONVERT_TO_TEXT"
+
+  request_templates = {
+    "application/json" = "{\"statusCode\": 200}"
+  }
+}
+
+resource "aws_api_gateway_method_response" "alerts_options_200" {
+  rest_api_id = aws_api_gateway_rest_api.stock-news-analyzer-api.id
+  resource_id = aws_api_gateway_resource.alerts.id
+  http_method = aws_api_gateway_method.alerts_options.http_method
+  status_code = "200"
+
+  response_parameters = {
+    "method.response.header.Access-Control-Allow-Headers" = true
+    "method.response.header.Access-Control-Allow-Methods" = true
+    "method.response.header.Access-Control-Allow-Origin"  = true
+  }
+}
+
+resource "aws_api_gateway_integration_response" "alerts_options" {
+  rest_api_id = aws_api_gateway_rest_api.stock-news-analyzer-api.id
+  resource_id = aws_api_gateway_resource.alerts.id
+  http_method = aws_api_gateway_method.alerts_options.http_method
+  status_code = "200"
+
+  response_parameters = {
+    "method.response.header.Access-Control-Allow-Headers" = "'Content-Type,Authorization'"
+    "method.response.header.Access-Control-Allow-Methods" = "'GET,POST,DELETE,OPTIONS'"
+    "method.response.header.Access-Control-Allow-Origin"  = "'*'"
+  }
+
+  depends_on = [aws_api_gateway_integration.alerts_options]
+}
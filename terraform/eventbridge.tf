@@ -9,7 +9,8 @@ resource "null_resource" "package_lambda_scheduler" {
     command = <<EOT
       rm -rf ${path.module}/build/scheduler
       mkdir -p ${path.module}/build/scheduler
-      cp ${path.module}/lambda/scheduler/handler.py ${path.module}/build/scheduler/
+      cp ${path.module}/lambda/scheduler/handler.py ${path.module}/lambda/scheduler/retention.py ${path.module}/lambda/scheduler/alerts.py ${path.module}/build/scheduler/
+      cp ${path.module}/lambda/shared/query_profiler.py ${path.module}/lambda/shared/partitions.py ${path.module}/build/scheduler/
       if [ -f ${path.module}/lambda/scheduler/requirements.txt ]; then
         pip install -r ${path.module}/lambda/scheduler/requirements.txt -t ${path.module}/build/scheduler/
       fi
@@ -39,6 +40,9 @@ resource "aws_lambda_function" "scheduler_lambda" {
       DB_NAME           = "stocknewsanalyzerdb"
       TIINGO_API_KEY    = var.tiingo_api_key
       ALPHA_VANTAGE_KEY = var.alpha_vantage_key
+      # Alert rules come from /alerts; matches are emailed after each run
+      ALERTS_ENABLED = "true"
+      ALERTS_SENDER  = var.notification_sender
     }
   }
 
@@ -107,3 +111,29 @@ resource "aws_scheduler_schedule" "lambda_hourly_schedule" {
     })
   }
 }
+
+# EventBridge Scheduler - Daily retention/compaction, off-peak
+resource "aws_scheduler_schedule" "lambda_retention_schedule" {
+  name        = "stock-news-analyzer-retention"
+  description = "Triggers scheduler Lambda daily to compact and expire history"
+
+  flexible_time_window {
+    mode = "OFF"
+  }
+
+  schedule_expression = "cron(30 3 * * ? *)"
+
+  target {
+    arn      = aws_lambda_function.scheduler_lambda.arn
+    role_arn = aws_iam_role.scheduler_role.arn
+
+    input = jsonencode({
+      source = "eventbridge-scheduler"
+      action = "retention"
+      policy = {
+        history_raw_days    = 30
+        article_detail_days = 180
+      }
+    })
+  }
+}
@@ -1,33 +1,181 @@
 import os
 import json
+import gzip
+import base64
+import hashlib
+import time
+import random
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
 # import pymysql
-import urllib.request, urllib.parse
 from decimal import Decimal
 from datetime import datetime, date
-import boto3
-import traceback  # <--- added for debugging unexpected errors
 try:
     import pymysql
 except ImportError:
     pymysql = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    # lambda/shared/query_profiler.py, copied in at packaging time
+    from query_profiler import QueryProfiler
+except ImportError:
+    QueryProfiler = None
 from datetime import datetime, timedelta
 
 
-comprehend = boto3.client('comprehend')
+# recorded_at comes back as a naive UTC datetime; columnar responses send epoch ms
+_EPOCH = datetime(1970, 1, 1)
+_ONE_MS = timedelta(milliseconds=1)
+
 DB_HOST = os.environ['DB_HOST']
 DB_USER = os.environ['DB_USER']
 DB_PASS = os.environ['DB_PASS']
 DB_NAME = os.environ['DB_NAME']
 ALPHA_VANTAGE_KEY = os.environ.get('ALPHA_VANTAGE_KEY')  
 
-def get_stock_history(conn, stock_id=None, ticker=None, time_range="24h"):
+# Bodies smaller than this are sent uncompressed
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+
+# Cache-Control per GET route; data only changes when the hourly scheduler runs
+CACHE_CONTROL = {
+    "/stocks": "public, max-age=300",
+    "/quotes": "public, max-age=60",
+    "/stock-history": "public, max-age=300",
+    "/stock-history/batch": "public, max-age=300",
+    "/watchlist": "private, no-cache",
+}
+
+# In-container response cache; CACHE_ENABLED=false turns it off entirely
+CACHE_ENABLED = os.environ.get('CACHE_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+# Seconds a data version is trusted before it is re-read from RDS
+DATA_VERSION_TTL = int(os.environ.get('DATA_VERSION_TTL', '60'))
+# TTL per cached route. /watchlist is left out: it is per user and written
+# through other containers, whose invalidations this container never sees.
+CACHE_TTL = {
+    "/stocks": 300,
+    "/quotes": 60,
+    "/stock-history": 300,
+    "/stock-history/batch": 300,
+}
+
+
+class ResponseCache:
     """
-    Get stock history records for a specific time range
-    time_range options: '24h', '7d', '30d', '90d', '1y', 'all'
+    Size-bounded LRU of serialized response bodies keyed by (route, normalized params).
+    Each entry remembers the data version it was built from and is dropped once
+    the version moves on, so expiry follows scheduler runs rather than just the TTL.
     """
-    
-    # Calculate the start time based on range
-    now = datetime.now()
+
+    def __init__(self, max_bytes, ttls, enabled=True, clock=time.monotonic):
+        self.max_bytes = max_bytes
+        self.ttls = ttls
+        self.enabled = enabled
+        self._clock = clock
+        self._entries = OrderedDict()  # (route, key) -> (expires_at, version, text)
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, route, key, version):
+        if not self.enabled or route not in self.ttls:
+            return None
+        entry = self._entries.get((route, key))
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, entry_version, text = entry
+        if entry_version != version or expires_at <= self._clock():
+            self._drop((route, key))
+            self.misses += 1
+            return None
+        self._entries.move_to_end((route, key))
+        self.hits += 1
+        return text
+
+    def put(self, route, key, version, text):
+        if not self.enabled or route not in self.ttls or len(text) > self.max_bytes:
+            return
+        self._drop((route, key))
+        self._entries[(route, key)] = (self._clock() + self.ttls[route], version, text)
+        self._bytes += len(text)
+        while self._bytes > self.max_bytes:
+            _, (_, _, evicted) = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.evictions += 1
+
+    def invalidate(self, *routes):
+        """Drop every entry for the given routes (all routes when none are given)"""
+        for entry_key in [k for k in self._entries if not routes or k[0] in routes]:
+            self._drop(entry_key)
+            self.invalidations += 1
+
+    def _drop(self, entry_key):
+        entry = self._entries.pop(entry_key, None)
+        if entry is not None:
+            self._bytes -= len(entry[2])
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+# Module scope so it survives across warm invocations of the same container
+_cache = ResponseCache(CACHE_MAX_BYTES, CACHE_TTL, enabled=CACHE_ENABLED)
+_data_version = {"value": None, "checked_at": 0.0}
+
+# Per-ticker in-memory history series behind ?format=columnar
+SERIES_ENABLED = os.environ.get('SERIES_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+SERIES_MAX_BYTES = int(os.environ.get('SERIES_MAX_BYTES', str(32 * 1024 * 1024)))
+SERIES_MAX_POINTS = int(os.environ.get('SERIES_MAX_POINTS', '100000'))
+
+# Row-format /stock-history is paged; ?limit= may ask for up to HISTORY_MAX_PAGE_SIZE rows
+HISTORY_PAGE_SIZE = int(os.environ.get('HISTORY_PAGE_SIZE', '2000'))
+HISTORY_MAX_PAGE_SIZE = int(os.environ.get('HISTORY_MAX_PAGE_SIZE', '10000'))
+
+# /stock-history/batch: grid step per range (overridable with ?interval=) and ticker cap
+BATCH_MAX_TICKERS = int(os.environ.get('BATCH_MAX_TICKERS', '20'))
+GRID_INTERVALS = {"1h": 3600 * 1000, "4h": 4 * 3600 * 1000, "1d": 24 * 3600 * 1000}
+# Cap on grid points x tickers in one batch response (keeps it well under
+# Lambda's 6 MB response limit and the 29s API Gateway timeout)
+BATCH_MAX_POINTS = int(os.environ.get('BATCH_MAX_POINTS', '50000'))
+# Cap on tickers in one POST/DELETE /watchlist body
+WATCHLIST_MAX_TICKERS = int(os.environ.get('WATCHLIST_MAX_TICKERS', '100'))
+# /alerts: rule kinds the scheduler evaluates (scheduler/alerts.py RULE_KINDS)
+# and a cap on rules per user
+ALERT_RULE_KINDS = ("sentiment_above", "sentiment_below", "price_move_pct", "label_change")
+ALERTS_MAX_RULES = int(os.environ.get('ALERTS_MAX_RULES', '50'))
+
+# Fraction of requests that get per-route metrics (EMF log line), 0 disables
+METRICS_SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', '0.1'))
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'StockNewsAnalyzer/Api')
+# Also attach a Server-Timing header to sampled responses (visible in browser devtools)
+SERVER_TIMING = os.environ.get('SERVER_TIMING', 'false').lower() in ('1', 'true', 'yes')
+
+# Fingerprint every statement and log a per-request query report (N+1 loops,
+# EXPLAIN of slow statements); see query_profiler.py for its knobs
+QUERY_PROFILE = os.environ.get('QUERY_PROFILE', 'false').lower() in ('1', 'true', 'yes')
+
+DEFAULT_GRID_INTERVAL = {"24h": "1h", "7d": "1h", "30d": "4h", "90d": "1d", "1y": "1d", "all": "1d"}
+
+def _range_start(time_range):
+    """Map a time_range option ('24h', '7d', '30d', '90d', '1y', 'all') to a start datetime"""
+    # Floor to the hour so a range returns the same rows (and ETag) until the next snapshot
+    now = datetime.now().replace(minute=0, second=0, microsecond=0)
     time_ranges = {
         '24h': now - timedelta(hours=24),
         '7d': now - timedelta(days=7),
@@ -37,29 +185,419 @@ def get_stock_history(conn, stock_id=None, ticker=None, time_range="24h"):
         'all': datetime(2000, 1, 1)  # Very old date for "all time"
     }
     
-    start_time = time_ranges.get(time_range, time_ranges['24h'])
-    
-    with conn.cursor() as cursor:
-        if stock_id:
-            cursor.execute("""
-                SELECT sh.id, sh.stock_id, s.ticker, sh.price, sh.avg_sentiment, sh.recorded_at
-                FROM stock_history sh
-                JOIN stocks s ON sh.stock_id = s.id
-                WHERE sh.stock_id = %s AND sh.recorded_at >= %s
-                ORDER BY sh.recorded_at ASC
-            """, (stock_id, start_time))
-        elif ticker:
-            cursor.execute("""
-                SELECT sh.id, sh.stock_id, s.ticker, sh.price, sh.avg_sentiment, sh.recorded_at
-                FROM stock_history sh
-                JOIN stocks s ON sh.stock_id = s.id
-                WHERE s.ticker = %s AND sh.recorded_at >= %s
-                ORDER BY sh.recorded_at ASC
-            """, (ticker.upper(), start_time))
+    return time_ranges.get(time_range, time_ranges['24h'])
+
+def encode_history_cursor(recorded_at, row_id):
+    """Opaque keyset token for the row after (recorded_at, id)"""
+    raw = f"{(recorded_at - _EPOCH) // _ONE_MS}:{row_id}".encode("ascii")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_history_cursor(token):
+    """Inverse of encode_history_cursor; raises ValueError on a malformed token"""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode("ascii")
+        ms, row_id = raw.split(":")
+        return _EPOCH + int(ms) * _ONE_MS, int(row_id)
+    except (ValueError, TypeError, UnicodeDecodeError) as e:
+        raise ValueError("invalid cursor") from e
+
+def stream_stock_history_page(conn, stock_id=None, ticker=None, time_range="24h",
+                              after=None, limit=HISTORY_PAGE_SIZE):
+    """
+    One keyset page of stock history, ordered by (recorded_at, id), returned as
+    the serialized JSON body. Rows come off an unbuffered cursor and are encoded
+    one at a time, so memory is bounded by the page rather than the range.
+    after is a decoded cursor (recorded_at, id) or None for the first page.
+    """
+    start_time = _range_start(time_range)
+
+    if stock_id:
+        where, params = ["sh.stock_id = %s"], [stock_id]
+    elif ticker:
+        where, params = ["s.ticker = %s"], [ticker.upper()]
+    else:
+        return None
+    where.append("sh.recorded_at >= %s")
+    params.append(start_time)
+    if after:
+        where.append("(sh.recorded_at > %s OR (sh.recorded_at = %s AND sh.id > %s))")
+        params.extend([after[0], after[0], after[1]])
+    params.append(limit + 1)
+
+    encode = CustomJSONEncoder().encode
+    chunks = []
+    count = 0
+    last = None
+    has_more = False
+    with conn.cursor(pymysql.cursors.SSCursor) as cursor:
+        cursor.execute(f"""
+            SELECT sh.id, sh.stock_id, s.ticker, sh.price, sh.avg_sentiment, sh.recorded_at
+            FROM stock_history sh
+            JOIN stocks s ON sh.stock_id = s.id
+            WHERE {' AND '.join(where)}
+            ORDER BY sh.recorded_at ASC, sh.id ASC
+            LIMIT %s
+        """, params)
+        for row_id, row_stock_id, row_ticker, price, sentiment, recorded_at in cursor:
+            if count == limit:
+                # The (limit + 1)th row only signals that another page exists
+                has_more = True
+                break
+            chunks.append(encode({
+                "id": row_id,
+                "stock_id": row_stock_id,
+                "ticker": row_ticker,
+                "price": price,
+                "avg_sentiment": sentiment,
+                "recorded_at": recorded_at,
+            }))
+            count += 1
+            last = (recorded_at, row_id)
+
+    next_cursor = encode_history_cursor(*last) if has_more else None
+    return (
+        '{"ticker": ' + encode(ticker.upper() if ticker else None)
+        + ', "time_range": ' + encode(time_range)
+        + ', "history": [' + ", ".join(chunks) + "]"
+        + ', "count": ' + str(count)
+        + ', "next_cursor": ' + encode(next_cursor) + "}"
+    )
+
+def get_stock_history_columnar(conn, stock_id=None, ticker=None, time_range="24h"):
+    """
+    Get stock history as parallel arrays instead of one dict per row.
+
+    stock_id/ticker are sent once, timestamps are epoch milliseconds and
+    price/sentiment are plain floats, so the payload needs no custom encoding.
+    Rows are read through a tuple cursor to skip per-row dict allocation.
+    """
+    start_time = _range_start(time_range)
+
+    if stock_id:
+        where, param = "sh.stock_id = %s", stock_id
+    elif ticker:
+        where, param = "s.ticker = %s", ticker.upper()
+    else:
+        return None
+
+    with conn.cursor(pymysql.cursors.Cursor) as cursor:
+        cursor.execute(f"""
+            SELECT s.id, s.ticker, sh.recorded_at, sh.price, sh.avg_sentiment
+            FROM stock_history sh
+            JOIN stocks s ON sh.stock_id = s.id
+            WHERE {where} AND sh.recorded_at >= %s
+            ORDER BY sh.recorded_at ASC
+        """, (param, start_time))
+        rows = cursor.fetchall()
+
+    timestamps, prices, sentiments = [], [], []
+    add_t, add_p, add_s = timestamps.append, prices.append, sentiments.append
+    for _, _, recorded_at, price, sentiment in rows:
+        add_t((recorded_at - _EPOCH) // _ONE_MS)
+        add_p(float(price) if price is not None else None)
+        add_s(float(sentiment) if sentiment is not None else None)
+
+    return {
+        "stock_id": rows[0][0] if rows else stock_id,
+        "ticker": rows[0][1] if rows else (ticker.upper() if ticker else None),
+        "time_range": time_range,
+        "format": "columnar",
+        "count": len(rows),
+        "t": timestamps,
+        "price": prices,
+        "sentiment": sentiments,
+    }
+
+def _nan_to_none(values):
+    return [None if v != v else v for v in values]
+
+
+class TickerSeries:
+    """
+    One stock's history as parallel arrays (ids, epoch-ms timestamps, prices,
+    sentiments) sorted by recorded_at. NULLs are stored as NaN. loaded_from is
+    the earliest timestamp the arrays are known to be complete from.
+    """
+
+    __slots__ = ("stock_id", "ticker", "ids", "t", "price", "sentiment",
+                 "max_id", "loaded_from", "truncated", "seen_version")
+
+    def __init__(self, stock_id, ticker, loaded_from):
+        self.stock_id = stock_id
+        self.ticker = ticker
+        self.ids = array('q')
+        self.t = array('q')
+        self.price = array('d')
+        self.sentiment = array('d')
+        self.max_id = 0
+        self.loaded_from = loaded_from
+        self.truncated = False
+        self.seen_version = None
+
+    def __len__(self):
+        return len(self.t)
+
+    def nbytes(self):
+        return sum(a.itemsize * len(a) for a in (self.ids, self.t, self.price, self.sentiment))
+
+    def append_rows(self, rows):
+        """Append (id, recorded_at, price, sentiment) rows; False if one lands before the tail"""
+        last_t = self.t[-1] if self.t else None
+        nan = float("nan")
+        for row_id, recorded_at, price, sentiment in rows:
+            ms = (recorded_at - _EPOCH) // _ONE_MS
+            if last_t is not None and ms < last_t:
+                return False
+            last_t = ms
+            self.ids.append(row_id)
+            self.t.append(ms)
+            self.price.append(float(price) if price is not None else nan)
+            self.sentiment.append(float(sentiment) if sentiment is not None else nan)
+            if row_id > self.max_id:
+                self.max_id = row_id
+        return True
+
+    def trim(self, max_points):
+        """Drop the oldest points beyond max_points"""
+        excess = len(self.t) - max_points
+        if excess <= 0:
+            return
+        for a in (self.ids, self.t, self.price, self.sentiment):
+            del a[:excess]
+        self.loaded_from = self.t[0]
+        self.truncated = True
+
+    def columnar(self, start_ms, time_range):
+        """Same shape as get_stock_history_columnar, sliced by binary search"""
+        i = bisect_left(self.t, start_ms)
+        return {
+            "stock_id": self.stock_id,
+            "ticker": self.ticker,
+            "time_range": time_range,
+            "format": "columnar",
+            "count": len(self.t) - i,
+            "t": self.t[i:].tolist(),
+            "price": _nan_to_none(self.price[i:]),
+            "sentiment": _nan_to_none(self.sentiment[i:]),
+        }
+
+
+class SeriesStore:
+    """
+    Per-ticker TickerSeries kept across warm invocations. Each request fetches
+    only rows newer than the series' high-water mark and appends them, then
+    answers the range by slicing. Bounded per ticker (max_points) and in total
+    (max_bytes, least recently used series evicted first).
+    """
+
+    _COLUMNS = "SELECT id, recorded_at, price, avg_sentiment FROM stock_history"
+
+    def __init__(self, max_bytes, max_points, enabled=True):
+        self.max_bytes = max_bytes
+        self.max_points = max_points
+        self.enabled = enabled
+        self._series = OrderedDict()  # stock_id -> TickerSeries
+        self._ticker_ids = {}
+        self.loads = 0
+        self.refreshes = 0
+        self.evictions = 0
+
+    def get_columnar(self, conn, stock_id=None, ticker=None, time_range="24h"):
+        stock = self._resolve(conn, stock_id, ticker)
+        if stock is None:
+            return get_stock_history_columnar(conn, stock_id=stock_id, ticker=ticker, time_range=time_range)
+
+        start_ms = (_range_start(time_range) - _EPOCH) // _ONE_MS
+        series = self._series.get(stock[0])
+        if series is not None and start_ms < series.loaded_from and not series.truncated:
+            series = None
+        if series is None:
+            series = self._load(conn, stock, start_ms)
         else:
-            return []
-        
-        return cursor.fetchall()
+            series = self._refresh(conn, series)
+
+        self._series.move_to_end(series.stock_id)
+        self._enforce_budget()
+        if start_ms < series.loaded_from:
+            # Older than the per-ticker budget allows; answer straight from SQL
+            return get_stock_history_columnar(conn, stock_id=stock[0], time_range=time_range)
+        return series.columnar(start_ms, time_range)
+
+    def _resolve(self, conn, stock_id, ticker):
+        if ticker:
+            ticker = ticker.upper()
+            if ticker in self._ticker_ids:
+                return self._ticker_ids[ticker], ticker
+        elif stock_id in self._series:
+            return stock_id, self._series[stock_id].ticker
+        with conn.cursor(pymysql.cursors.Cursor) as cursor:
+            if ticker:
+                cursor.execute("SELECT id, ticker FROM stocks WHERE ticker = %s", (ticker,))
+            else:
+                cursor.execute("SELECT id, ticker FROM stocks WHERE id = %s", (stock_id,))
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        self._ticker_ids[row[1]] = row[0]
+        return row[0], row[1]
+
+    def _load(self, conn, stock, start_ms):
+        series = TickerSeries(stock[0], stock[1], start_ms)
+        series.seen_version = current_data_version(conn)
+        with conn.cursor(pymysql.cursors.Cursor) as cursor:
+            cursor.execute(
+                self._COLUMNS + " WHERE stock_id = %s AND recorded_at >= %s ORDER BY recorded_at, id",
+                (series.stock_id, _EPOCH + start_ms * _ONE_MS),
+            )
+            series.append_rows(cursor.fetchall())
+        series.trim(self.max_points)
+        self._series[series.stock_id] = series
+        self.loads += 1
+        return series
+
+    def _refresh(self, conn, series):
+        # Nothing can be new until the data version moves
+        version = current_data_version(conn)
+        if version == series.seen_version:
+            return series
+        if _history_revision(version) != _history_revision(series.seen_version):
+            # Rows were rewritten or deleted in place; id > max_id can't see that
+            self._series.pop(series.stock_id)
+            return self._load(conn, (series.stock_id, series.ticker), series.loaded_from)
+        series.seen_version = version
+        # The high-water mark is the newest row id rather than recorded_at, so
+        # backfilled rows (new ids, old timestamps) are noticed too
+        with conn.cursor(pymysql.cursors.Cursor) as cursor:
+            cursor.execute(
+                self._COLUMNS + " WHERE stock_id = %s AND id > %s ORDER BY recorded_at, id",
+                (series.stock_id, series.max_id),
+            )
+            rows = cursor.fetchall()
+        self.refreshes += 1
+        if not series.append_rows(rows):
+            # Rows landed inside the cached window; rebuild from where we started
+            self._series.pop(series.stock_id)
+            return self._load(conn, (series.stock_id, series.ticker), series.loaded_from)
+        series.trim(self.max_points)
+        return series
+
+    def _enforce_budget(self):
+        total = sum(s.nbytes() for s in self._series.values())
+        while total > self.max_bytes and len(self._series) > 1:
+            _, evicted = self._series.popitem(last=False)
+            total -= evicted.nbytes()
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "bytes": sum(s.nbytes() for s in self._series.values()),
+            "max_bytes": self.max_bytes,
+            "max_points_per_ticker": self.max_points,
+            "loads": self.loads,
+            "refreshes": self.refreshes,
+            "evictions": self.evictions,
+            "tickers": {
+                s.ticker: {"points": len(s), "bytes": s.nbytes(), "truncated": s.truncated}
+                for s in self._series.values()
+            },
+        }
+
+
+_series = SeriesStore(SERIES_MAX_BYTES, SERIES_MAX_POINTS, enabled=SERIES_ENABLED)
+
+def _asof_fill(grid, times, values):
+    """
+    As-of join of one sorted series onto the grid: each grid point takes the
+    latest non-null value recorded at or before it (forward fill), None before
+    the first observation. A single merge pass, O(len(grid) + len(times)).
+    """
+    out = []
+    append = out.append
+    n = len(times)
+    j = 0
+    last = None
+    for g in grid:
+        while j < n and times[j] <= g:
+            if values[j] is not None:
+                last = values[j]
+            j += 1
+        append(last)
+    return out
+
+def get_aligned_history(conn, tickers, time_range="24h", interval=None):
+    """
+    History for several tickers in one query, aligned on a shared regular time
+    grid so comparison charts need no client-side joining. Returns a columnar
+    matrix: t is the grid (epoch ms) and price/sentiment hold one row per ticker.
+    """
+    interval = interval or DEFAULT_GRID_INTERVAL.get(time_range, "1h")
+    step = GRID_INTERVALS[interval]
+    start_time = _range_start(time_range)
+
+    series = {t: ([], [], []) for t in tickers}
+    placeholders = ",".join(["%s"] * len(tickers))
+    with conn.cursor(pymysql.cursors.Cursor) as cursor:
+        cursor.execute(f"""
+            SELECT s.ticker, sh.recorded_at, sh.price, sh.avg_sentiment
+            FROM stock_history sh
+            JOIN stocks s ON sh.stock_id = s.id
+            WHERE s.ticker IN ({placeholders}) AND sh.recorded_at >= %s
+            ORDER BY s.ticker, sh.recorded_at, sh.id
+        """, (*tickers, start_time))
+        for ticker, recorded_at, price, sentiment in cursor.fetchall():
+            times, prices, sentiments = series[ticker]
+            times.append((recorded_at - _EPOCH) // _ONE_MS)
+            prices.append(float(price) if price is not None else None)
+            sentiments.append(float(sentiment) if sentiment is not None else None)
+
+    firsts = [times[0] for times, _, _ in series.values() if times]
+    grid = []
+    requested, truncated = interval, False
+    if firsts:
+        # Start at the first observation (not the range start) so 'all' has no empty prefix
+        start_ms = max((start_time - _EPOCH) // _ONE_MS, min(firsts))
+        end_ms = (datetime.now() - _EPOCH) // _ONE_MS
+        # Over BATCH_MAX_POINTS (only 'all' can get there; the route rejects
+        # fixed ranges that would): step up to coarser intervals, and at the
+        # coarsest keep just the newest points that fit
+        max_points = max(1, BATCH_MAX_POINTS // max(1, len(tickers)))
+        coarser = list(GRID_INTERVALS)[list(GRID_INTERVALS).index(interval):]
+        for interval in coarser:
+            step = GRID_INTERVALS[interval]
+            if (end_ms - start_ms) // step + 1 <= max_points:
+                break
+        first = start_ms - start_ms % step
+        last = end_ms - end_ms % step
+        if (last - first) // step + 1 > max_points:
+            first = last - (max_points - 1) * step
+            truncated = True
+        grid = list(range(first, last + 1, step))
+
+    out = {
+        "tickers": tickers,
+        "time_range": time_range,
+        "interval": interval,
+        "format": "columnar",
+        "count": len(grid),
+        "t": grid,
+        "price": [_asof_fill(grid, series[t][0], series[t][1]) for t in tickers],
+        "sentiment": [_asof_fill(grid, series[t][0], series[t][2]) for t in tickers],
+    }
+    if interval != requested:
+        out["requested_interval"] = requested
+    if truncated:
+        out["truncated"] = True
+    return out
+
+_QUOTE_FIELDS = ("ticker", "price", "sentiment_score", "sentiment_label", "updated_at", "error")
+
+def _quotes_columnar(quotes):
+    """Transpose a list of quote dicts into one array per field"""
+    out = {field: [q.get(field) for q in quotes] for field in _QUOTE_FIELDS}
+    out["format"] = "columnar"
+    out["count"] = len(quotes)
+    return out
 
 # Custom JSON encoder to handle Decimal and datetime objects
 class CustomJSONEncoder(json.JSONEncoder):
@@ -70,18 +608,317 @@ class CustomJSONEncoder(json.JSONEncoder):
             return obj.isoformat()
         return super().default(obj)
 
-def _resp(status, body):
-    return {
+def _resp(status, body, headers=None):
+    return _text_resp(status, json.dumps(body, cls=CustomJSONEncoder) if body is not None else "", headers)
+
+
+def _text_resp(status, text, headers=None):
+    """Build the proxy response around an already-serialized JSON body"""
+    resp = {
         "isBase64Encoded": False,
         "statusCode": status,
         "headers": {
             "Content-Type": "application/json",
             "Access-Control-Allow-Origin": "*",
             "Access-Control-Allow-Methods": "GET,POST,DELETE,OPTIONS",
-            "Access-Control-Allow-Headers": "Content-Type",            
+            "Access-Control-Allow-Headers": "Content-Type,If-None-Match",
+            "Access-Control-Expose-Headers": "ETag,X-Cache",
         },
-        "body": json.dumps(body, cls=CustomJSONEncoder),
-    } 
+        "body": text,
+    }
+    if headers:
+        resp["headers"].update(headers)
+    return resp
+
+
+def _header(event, name):
+    """Case-insensitive request header lookup (API Gateway keeps the client's casing)"""
+    name = name.lower()
+    for key, value in (event.get("headers") or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _request_body(event):
+    """Parse the JSON request body, decoding it first if API Gateway passed it as base64"""
+    raw = event.get("body")
+    if not raw:
+        return {}
+    try:
+        if event.get("isBase64Encoded"):
+            raw = base64.b64decode(raw)
+        return json.loads(raw)
+    except (ValueError, TypeError):
+        return {}
+
+
+def get_data_version(conn):
+    """
+    Cheap data version for ETags: the newest stocks/stock_history ids, plus
+    history_revision, which retention and the backfill bump when they
+    rewrite or delete existing rows (something MAX(id) can't see). MAX(id)
+    on a primary key is resolved from the index, so this never scans history.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT (SELECT MAX(id) FROM stocks) AS stocks_v,
+                   (SELECT MAX(id) FROM stock_history) AS history_v,
+                   (SELECT revision FROM history_revision WHERE id = 1) AS revision_v
+        """)
+        row = cursor.fetchone()
+    return f"{row['stocks_v'] or 0}.{row['history_v'] or 0}.{row['revision_v'] or 0}"
+
+
+def _history_revision(version):
+    """The history_revision part of a data version"""
+    return version.rsplit(".", 1)[-1] if version else None
+
+
+def current_data_version(conn):
+    """get_data_version, re-read from RDS at most every DATA_VERSION_TTL seconds"""
+    now = time.monotonic()
+    if _data_version["value"] is None or now - _data_version["checked_at"] >= DATA_VERSION_TTL:
+        _data_version["value"] = get_data_version(conn)
+        _data_version["checked_at"] = now
+    return _data_version["value"]
+
+
+def _invalidate_after_write():
+    """A watchlist write may have created stocks; drop what depends on them"""
+    _cache.invalidate("/stocks", "/quotes")
+    _data_version["value"] = None
+
+
+class RequestMetrics:
+    """
+    Timings and DB counters for one sampled request. Emitted as a CloudWatch
+    Embedded Metric Format log line, so CloudWatch extracts per-route metrics
+    without any PutMetricData calls.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.route = "unmatched"
+        self.db_connect_ms = 0.0
+        self.db_ms = 0.0
+        self.queries = 0
+        self.rows = 0
+
+    def finish(self, resp, body_bytes):
+        """Emit the EMF record for resp and, if enabled, add its Server-Timing header"""
+        total_ms = (time.perf_counter() - self.started) * 1000
+        body = resp.get("body") or ""
+        wire_bytes = len(body) * 3 // 4 if resp.get("isBase64Encoded") else body_bytes
+        print(json.dumps({
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": METRICS_NAMESPACE,
+                    "Dimensions": [["Route"]],
+                    "Metrics": [
+                        {"Name": "Latency", "Unit": "Milliseconds"},
+                        {"Name": "DbConnectTime", "Unit": "Milliseconds"},
+                        {"Name": "DbTime", "Unit": "Milliseconds"},
+                        {"Name": "Queries", "Unit": "Count"},
+                        {"Name": "RowsFetched", "Unit": "Count"},
+                        {"Name": "ResponseBytes", "Unit": "Bytes"},
+                        {"Name": "WireBytes", "Unit": "Bytes"},
+                    ],
+                }],
+            },
+            "Route": self.route,
+            "Latency": round(total_ms, 3),
+            "DbConnectTime": round(self.db_connect_ms, 3),
+            "DbTime": round(self.db_ms, 3),
+            "Queries": self.queries,
+            "RowsFetched": self.rows,
+            "ResponseBytes": body_bytes,
+            "WireBytes": wire_bytes,
+            "StatusCode": resp.get("statusCode"),
+            "Cache": resp["headers"].get("X-Cache"),
+            "SampleRate": METRICS_SAMPLE_RATE,
+        }))
+        if SERVER_TIMING:
+            resp["headers"]["Server-Timing"] = (
+                f"total;dur={total_ms:.1f}, db-connect;dur={self.db_connect_ms:.1f}, "
+                f'db;dur={self.db_ms:.1f};desc="{self.queries} queries, {self.rows} rows"'
+            )
+            resp["headers"]["Timing-Allow-Origin"] = "*"
+
+
+class MeteredCursor:
+    """Cursor proxy that counts queries and fetched rows into a RequestMetrics"""
+
+    def __init__(self, cursor, metrics):
+        self._cursor = cursor
+        self._metrics = metrics
+
+    def __enter__(self):
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._cursor.__exit__(*exc)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def _timed(self, fn, *args):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self._metrics.db_ms += (time.perf_counter() - t0) * 1000
+
+    def execute(self, *args):
+        self._metrics.queries += 1
+        return self._timed(self._cursor.execute, *args)
+
+    def executemany(self, *args):
+        self._metrics.queries += 1
+        return self._timed(self._cursor.executemany, *args)
+
+    def fetchone(self):
+        row = self._timed(self._cursor.fetchone)
+        if row is not None:
+            self._metrics.rows += 1
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._timed(self._cursor.fetchmany, *args)
+        self._metrics.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(self._cursor.fetchall)
+        self._metrics.rows += len(rows)
+        return rows
+
+    def __iter__(self):
+        # Unbuffered cursors fetch while iterating; only rows are counted here
+        for row in self._cursor:
+            self._metrics.rows += 1
+            yield row
+
+
+class LazyConnection:
+    """Opens the pymysql connection on first use, so cache hits and 304s never touch RDS"""
+
+    def __init__(self, factory, metrics=None):
+        self._factory = factory
+        self._conn = None
+        self._metrics = metrics
+
+    def _connect(self):
+        if self._conn is None:
+            t0 = time.perf_counter()
+            try:
+                self._conn = self._factory()
+            except Exception as e:
+                raise RuntimeError(f"DB connection failed: {str(e)}") from e
+            finally:
+                if self._metrics is not None:
+                    self._metrics.db_connect_ms += (time.perf_counter() - t0) * 1000
+        return self._conn
+
+    def __getattr__(self, name):
+        return getattr(self._connect(), name)
+
+    def cursor(self, *args):
+        cursor = self._connect().cursor(*args)
+        return MeteredCursor(cursor, self._metrics) if self._metrics is not None else cursor
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+
+
+def _etag(*parts):
+    """
+    Weak ETag from the route, its cache key and the data version. Weak
+    because the same tag goes out on identity, gzip and br bodies (_compress
+    runs after it), which are the same data but not byte-identical.
+    """
+    digest = hashlib.sha1("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+    return f'W/"{digest[:24]}"'
+
+
+def _normalized_qs(qs):
+    return "&".join(f"{k}={qs[k]}" for k in sorted(qs))
+
+
+def _etag_matches(event, etag):
+    header = _header(event, "If-None-Match")
+    if not header:
+        return False
+    # Weak comparison, as If-None-Match calls for: W/"x" and "x" match
+    candidates = [c.strip() for c in header.split(",")]
+    return "*" in candidates or any(
+        (c[2:] if c.startswith("W/") else c) == etag[2:] for c in candidates
+    )
+
+
+def _cached_resp(event, route, key, version, body):
+    """
+    304 with no body when the client already holds the ETag, else 200 with
+    validators, served from the response cache when possible. body may be a
+    callable so the DB query is skipped entirely on a 304 or a cache hit, and
+    may produce an already-serialized JSON string instead of a dict.
+    """
+    etag = _etag(route, key, version)
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL[route]}
+    if _etag_matches(event, etag):
+        return _resp(304, None, headers)
+
+    text = _cache.get(route, key, version)
+    if route in CACHE_TTL:
+        headers["X-Cache"] = "HIT" if text is not None else "MISS"
+    if text is None:
+        text = body() if callable(body) else body
+        if not isinstance(text, str):
+            text = json.dumps(text, cls=CustomJSONEncoder)
+        _cache.put(route, key, version, text)
+    return _text_resp(200, text, headers)
+
+
+def _accepted_encodings(event):
+    accepted = set()
+    for token in (_header(event, "Accept-Encoding") or "").split(","):
+        coding, _, params = token.partition(";")
+        coding = coding.strip().lower()
+        q = params.strip()
+        try:
+            weight = float(q[2:]) if q.startswith("q=") else 1.0
+        except ValueError:
+            weight = 1.0
+        if coding and weight > 0:
+            accepted.add(coding)
+    return accepted
+
+
+def _compress(event, resp):
+    """Brotli/gzip the body when the client accepts it and it is worth the CPU"""
+    # Any route's body may be compressed for some clients, so caches must key
+    # on Accept-Encoding even for this response's 304s and identity bodies
+    resp.setdefault("headers", {})["Vary"] = "Accept-Encoding"
+    body = resp.get("body") or ""
+    if resp.get("isBase64Encoded") or len(body) < COMPRESS_MIN_BYTES:
+        return resp
+
+    accepted = _accepted_encodings(event)
+    raw = body.encode("utf-8")
+    if brotli is not None and "br" in accepted:
+        encoding, data = "br", brotli.compress(raw, quality=5)
+    elif "gzip" in accepted or "*" in accepted:
+        encoding, data = "gzip", gzip.compress(raw, compresslevel=6)
+    else:
+        return resp
+
+    resp["headers"]["Content-Encoding"] = encoding
+    resp["body"] = base64.b64encode(data).decode("ascii")
+    resp["isBase64Encoded"] = True
+    return resp
 
 
 def get_db_connection():
@@ -128,61 +965,300 @@ def get_watchlist(conn, user_id):
         rows = cursor.fetchall()
     return [r["ticker"] for r in rows]
 
-def ensure_stock(conn, ticker):
-    with conn.cursor() as cursor:
-        cursor.execute("SELECT id FROM stocks WHERE ticker = %s;", (ticker,))
-        row = cursor.fetchone()
-        if row:
-            return row["id"]
-        
-        cursor.execute("INSERT INTO stocks(ticker) VALUES (%s);", (ticker,))
-        conn.commit()
-        return cursor.lastrowid
-
-def add_to_watchlist(conn, user_id, ticker):
+def add_to_watchlist(conn, user_id, tickers):
+    """
+    Add tickers to a user's watchlist in one transaction and three statements,
+    however many tickers there are. Unknown tickers are created in stocks.
+    Returns the number of watchlist rows actually inserted.
+    """
     # Convert user_id to string if it's an integer (for backward compatibility)
     user_id_str = str(user_id)
-    
-    # Ensure user exists in database (create if doesn't exist for demo purposes)
-    with conn.cursor() as cursor:
-        cursor.execute("SELECT id FROM users WHERE id = %s;", (user_id_str,))
-        user = cursor.fetchone()
-        if not user:
+    placeholders = ",".join(["%s"] * len(tickers))
+
+    try:
+        with conn.cursor() as cursor:
             # Create a temporary user for demo (in production, this should come from Cognito)
-            cursor.execute("INSERT IGNORE INTO users (id, email) VALUES (%s, %s);", 
-                         (user_id_str, f"demo-user-{user_id_str}@example.com"))
-            conn.commit()
-    
-    stock_id = ensure_stock(conn, ticker)
+            cursor.execute("INSERT IGNORE INTO users (id, email) VALUES (%s, %s);",
+                           (user_id_str, f"demo-user-{user_id_str}@example.com"))
+            cursor.execute(
+                f"INSERT IGNORE INTO stocks (ticker) VALUES {','.join(['(%s)'] * len(tickers))};",
+                tickers,
+            )
+            # Resolve ids and insert in the same statement; existing pairs hit unique_user_stock
+            cursor.execute(
+                f"""
+                INSERT IGNORE INTO watchlist (user_id, stock_id)
+                SELECT %s, id FROM stocks WHERE ticker IN ({placeholders});
+                """,
+                (user_id_str, *tickers),
+            )
+            added = cursor.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return added
+
+def remove_from_watchlist(conn, user_id, tickers):
+    """Remove tickers from a user's watchlist in a single DELETE; returns rows removed"""
+    placeholders = ",".join(["%s"] * len(tickers))
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f"""
+                DELETE w FROM watchlist w
+                JOIN stocks s ON w.stock_id = s.id
+                WHERE w.user_id = %s AND s.ticker IN ({placeholders});
+                """,
+                (str(user_id), *tickers),
+            )
+            removed = cursor.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return removed
+
+def _watchlist_tickers(body):
+    """
+    Normalized tickers from a POST/DELETE body, which carries either a single
+    "ticker" or a "tickers" list. Raises ValueError on anything unusable.
+    """
+    raw = body.get("tickers")
+    if raw is None:
+        raw = [body["ticker"]] if body.get("ticker") else []
+    if not isinstance(raw, list) or not all(isinstance(t, str) for t in raw):
+        raise ValueError("tickers must be a list of strings")
+    tickers = list(dict.fromkeys(t.strip().upper() for t in raw if t.strip()))
+    if not tickers:
+        raise ValueError("user_id and ticker (or tickers) are required")
+    if len(tickers) > WATCHLIST_MAX_TICKERS:
+        raise ValueError(f"at most {WATCHLIST_MAX_TICKERS} tickers per request")
+    too_long = [t for t in tickers if len(t) > 10]
+    if too_long:
+        raise ValueError(f"invalid ticker(s): {', '.join(too_long)}")
+    return tickers
+
+
+def _sentiment_label(sentiment_score):
+    """Generate sentiment label based on score"""
+    if sentiment_score >= 0.35:
+        return "Bullish"
+    elif sentiment_score >= 0.15:
+        return "Somewhat-Bullish"
+    elif sentiment_score > -0.15:
+        return "Neutral"
+    elif sentiment_score > -0.35:
+        return "Somewhat-Bearish"
+    return "Bearish"
+
+def get_quotes(conn, tickers):
+    """Latest price and sentiment from stock_history for each ticker"""
+    quotes = []
+
+    with conn.cursor() as cursor:
+        for ticker in tickers:
+            # Get the latest sentiment from stock_history
+            cursor.execute("""
+                SELECT 
+                    s.ticker,
+                    sh.price,
+                    sh.avg_sentiment,
+                    sh.recorded_at
+                FROM stocks s
+                LEFT JOIN stock_history sh ON sh.stock_id = s.id
+                WHERE s.ticker = %s
+                ORDER BY sh.recorded_at DESC
+                LIMIT 1
+            """, (ticker,))
+
+            quotes.append(_quote(ticker, cursor.fetchone()))
+
+    return quotes
+
+def _quote(ticker, row):
+    """Quote dict for /quotes and /watchlist?include=quotes from a latest-snapshot row"""
+    if row and row['avg_sentiment'] is not None:
+        sentiment_score = float(row['avg_sentiment'])
+        return {
+            "ticker": ticker,
+            "price": float(row['price']) if row['price'] else None,
+            "change_pct": None,  # Not tracking this in current schema
+            "sentiment_score": sentiment_score,
+            "sentiment_label": _sentiment_label(sentiment_score),
+            "error": None,
+            "updated_at": row['recorded_at'].isoformat() if row['recorded_at'] else None
+        }
+    # No data found in database
+    return {
+        "ticker": ticker,
+        "price": None,
+        "change_pct": None,
+        "sentiment_score": None,
+        "sentiment_label": "No Data",
+        "error": "No historical data available",
+    }
+
+def parse_since(value):
+    """
+    Parse a ?since= value: a "v<id>" token from a previous next_since (changes
+    after that stock_history id) or a timestamp, as epoch ms or ISO 8601
+    (snapshots recorded after it). Returns ("id", int) or ("time", datetime).
+    """
+    try:
+        if value.startswith("v"):
+            return "id", int(value[1:])
+        if value.isdigit():
+            return "time", _EPOCH + int(value) * _ONE_MS
+        return "time", datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+    except ValueError as e:
+        raise ValueError("since must be a v<version> token, epoch ms or ISO timestamp") from e
+
+def get_quotes_since(conn, tickers, since):
+    """
+    Quotes only for tickers whose latest snapshot changed after since (see
+    parse_since), plus the highest stock_history id seen. Each ticker costs one
+    seek on stock_history(stock_id, recorded_at) for its newest row, and
+    unchanged tickers are filtered out before anything else is read.
+    """
+    kind, mark = since
+    column = "sh.id" if kind == "id" else "sh.recorded_at"
+    placeholders = ",".join(["%s"] * len(tickers))
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT s.ticker, sh.id, sh.price, sh.avg_sentiment, sh.recorded_at
+            FROM stocks s
+            JOIN stock_history sh ON sh.id = (
+                SELECT sh2.id
+                FROM stock_history sh2
+                WHERE sh2.stock_id = s.id
+                ORDER BY sh2.recorded_at DESC, sh2.id DESC
+                LIMIT 1
+            )
+            WHERE s.ticker IN ({placeholders}) AND {column} > %s
+            ORDER BY s.ticker
+        """, (*tickers, mark))
+        rows = cursor.fetchall()
+    return [_quote(r["ticker"], r) for r in rows], max((r["id"] for r in rows), default=0)
+
+def _since_body(conn, tickers, since, version):
+    """Delta body for ?since=: changed quotes and the next_since token to poll with"""
+    history_v = int(version.split(".")[1])
+    if since[0] == "id" and since[1] >= history_v:
+        # Nothing has been written since the caller's mark; no query at all
+        return {"quotes": [], "changed": 0, "next_since": f"v{since[1]}"}
+    quotes, seen = get_quotes_since(conn, tickers, since)
+    return {"quotes": quotes, "changed": len(quotes), "next_since": f"v{max(history_v, seen)}"}
+
+def get_watchlist_with_quotes(conn, user_id):
+    """
+    A user's watchlist tickers and their latest quotes from one query:
+    watchlist -> stocks -> newest stock_history row per stock.
+    """
     with conn.cursor() as cursor:
         cursor.execute(
-            "SELECT id FROM watchlist WHERE user_id = %s AND stock_id = %s;",
-            (user_id_str, stock_id),
+            """
+            SELECT s.ticker, sh.price, sh.avg_sentiment, sh.recorded_at
+            FROM watchlist w
+            JOIN stocks s ON w.stock_id = s.id
+            LEFT JOIN stock_history sh ON sh.id = (
+                SELECT sh2.id
+                FROM stock_history sh2
+                WHERE sh2.stock_id = s.id
+                ORDER BY sh2.recorded_at DESC, sh2.id DESC
+                LIMIT 1
+            )
+            WHERE w.user_id = %s
+            ORDER BY s.ticker;
+            """,
+            (user_id,),
         )
-        row = cursor.fetchone()
-        if row:
-            return
-        cursor.execute(
-            "INSERT INTO watchlist(user_id, stock_id) VALUES (%s, %s);",
-            (user_id_str, stock_id),
-        )        
-    conn.commit()
+        rows = cursor.fetchall()
+    return [r["ticker"] for r in rows], [_quote(r["ticker"], r) for r in rows]
 
-def remove_from_watchlist(conn, user_id, ticker):
+
+def list_alert_rules(conn, user_id):
     with conn.cursor() as cursor:
-        cursor.execute("SELECT id FROM stocks WHERE ticker = %s;", (ticker,))        
-        row = cursor.fetchone()
-        if not row:
-            return
-        stock_id = row["id"]
         cursor.execute(
-            "DELETE FROM watchlist WHERE user_id = %s AND stock_id = %s;",
-            (user_id, stock_id),
-        )        
-    conn.commit()         
-       
+            """
+            SELECT r.id, s.ticker, r.kind, r.threshold, r.cooldown_minutes, r.last_fired_at, r.created_at
+            FROM alert_rules r
+            JOIN stocks s ON s.id = r.stock_id
+            WHERE r.user_id = %s
+            ORDER BY s.ticker, r.id;
+            """,
+            (user_id,),
+        )
+        return cursor.fetchall()
+
+def create_alert_rule(conn, user_id, ticker, kind, threshold, cooldown_minutes):
+    """
+    Insert an alert rule for a ticker already in stocks; returns the new id,
+    or None if the ticker is unknown. Raises ValueError at ALERTS_MAX_RULES.
+    """
+    try:
+        with conn.cursor() as cursor:
+            # Same demo user bootstrap as add_to_watchlist (alert_rules.user_id is a foreign key)
+            cursor.execute("INSERT IGNORE INTO users (id, email) VALUES (%s, %s);",
+                           (user_id, f"demo-user-{user_id}@example.com"))
+            cursor.execute("SELECT COUNT(*) AS n FROM alert_rules WHERE user_id = %s;", (user_id,))
+            if cursor.fetchone()["n"] >= ALERTS_MAX_RULES:
+                raise ValueError(f"at most {ALERTS_MAX_RULES} alert rules per user")
+            cursor.execute(
+                """
+                INSERT INTO alert_rules (user_id, stock_id, kind, threshold, cooldown_minutes)
+                SELECT %s, id, %s, %s, %s FROM stocks WHERE ticker = %s;
+                """,
+                (user_id, kind, threshold, cooldown_minutes, ticker),
+            )
+            rule_id = cursor.lastrowid if cursor.rowcount else None
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return rule_id
+
+def delete_alert_rule(conn, user_id, rule_id):
+    """Delete one of the user's rules (and its undelivered alerts); returns rules removed"""
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM alert_rules WHERE id = %s AND user_id = %s;", (rule_id, user_id))
+            removed = cursor.rowcount
+            if removed:
+                cursor.execute("DELETE FROM alert_queue WHERE rule_id = %s AND delivered_at IS NULL;", (rule_id,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return removed
+
+def _alert_rule(body):
+    """
+    (ticker, kind, threshold, cooldown_minutes) from a POST /alerts body.
+    Raises ValueError on anything unusable.
+    """
+    ticker = body.get("ticker")
+    if not isinstance(ticker, str) or not ticker.strip() or len(ticker.strip()) > 10:
+        raise ValueError("ticker is required")
+    kind = body.get("kind")
+    if kind not in ALERT_RULE_KINDS:
+        raise ValueError(f"kind must be one of {', '.join(ALERT_RULE_KINDS)}")
+    threshold = body.get("threshold")
+    if kind == "label_change":
+        threshold = None
+    elif isinstance(threshold, bool) or not isinstance(threshold, (int, float)):
+        raise ValueError(f"threshold is required for {kind}")
+    elif kind == "price_move_pct" and threshold <= 0:
+        raise ValueError("threshold must be a positive percent for price_move_pct")
+    cooldown = body.get("cooldown_minutes", 60)
+    if isinstance(cooldown, bool) or not isinstance(cooldown, int) or not 0 <= cooldown <= 7 * 24 * 60:
+        raise ValueError("cooldown_minutes must be a whole number of minutes, at most a week")
+    return ticker.strip().upper(), kind, threshold, cooldown
+
 
 def _http_get_json(url):
+    # Only the (unrouted) sentiment helpers use urllib; keep it off the cold-start path
+    import urllib.request
     with urllib.request.urlopen(url, timeout=8) as resp:
         return json.loads(resp.read().decode("utf-8"))
 
@@ -215,6 +1291,7 @@ def _fetch_alpha_vantage_news_sentiment(symbol: str):
     if not ALPHA_VANTAGE_KEY:
         return {"ticker": symbol, "error": "Missing ALPHA_VANTAGE_KEY"}
 
+    import urllib.parse
     base = "https://www.alphavantage.co/query"
     qs = urllib.parse.urlencode({
         "function": "NEWS_SENTIMENT",
@@ -337,168 +1414,323 @@ def _fetch_news_sentiment_for_tickers(tickers):
 #     ]
 
 
-def lambda_handler(event, context):
+def _query(event):
+    return event.get("queryStringParameters") or {}
+
+
+# GET /stocks
+def _route_stocks(event, conn):
+    return _cached_resp(
+        event, "/stocks", "", current_data_version(conn), lambda: {"stocks": list_stocks(conn)}
+    )
+
+
+# GET /watchlist?user_id=1[&include=quotes[&since=v123]]
+def _route_watchlist(event, conn):
+    qs = _query(event)
+    user_id = qs.get("user_id")
+    if not user_id:
+        return _resp(400, {"error": "user_id is required"})
+    if qs.get("include") == "quotes" and qs.get("since"):
+        # Full ticker list (so removals show up) but only the quotes that changed
+        try:
+            since = parse_since(qs["since"])
+        except ValueError as e:
+            return _resp(400, {"error": str(e)})
+        tickers = get_watchlist(conn, user_id)
+        version = current_data_version(conn)
+
+        def since_body():
+            # Only on a miss: a matching If-None-Match never runs the delta queries
+            body = {"user_id": int(user_id), "tickers": tickers}
+            body.update(_since_body(conn, tickers, since, version) if tickers else
+                        {"quotes": [], "changed": 0, "next_since": qs["since"]})
+            return body
+
+        return _cached_resp(
+            event, "/watchlist", f"{user_id}|since={qs['since']}|{','.join(tickers)}", version, since_body
+        )
+    if qs.get("include") == "quotes":
+        tickers, quotes = get_watchlist_with_quotes(conn, user_id)
+        version = current_data_version(conn)
+        # next_since lets the client switch to ?since= polling
+        return _cached_resp(
+            event, "/watchlist", f"{user_id}|quotes|{','.join(tickers)}", version,
+            {"user_id": int(user_id), "tickers": tickers, "quotes": quotes,
+             "next_since": f"v{version.split('.')[1]}"}
+        )
+    tickers = get_watchlist(conn, user_id)
+    # Watchlists change outside the data version, so validate on content
+    return _cached_resp(
+        event, "/watchlist", f"{user_id}|{','.join(tickers)}", None,
+        {"user_id": int(user_id), "tickers": tickers}
+    )
+
+
+# GET /stock-history/batch?tickers=AAPL,MSFT&range=30d[&interval=4h]
+def _route_history_batch(event, conn):
+    qs = _query(event)
+    tickers = list(dict.fromkeys(
+        t.strip().upper() for t in qs.get("tickers", "").split(",") if t.strip()
+    ))
+    time_range = qs.get("range", "24h")
+    interval = qs.get("interval")
+    if not tickers:
+        return _resp(400, {"error": "tickers query param required, e.g. ?tickers=AAPL,MSFT"})
+    if len(tickers) > BATCH_MAX_TICKERS:
+        return _resp(400, {"error": f"at most {BATCH_MAX_TICKERS} tickers per request"})
+    if interval and interval not in GRID_INTERVALS:
+        return _resp(400, {"error": f"interval must be one of {', '.join(GRID_INTERVALS)}"})
+    if time_range != "all":
+        effective = interval or DEFAULT_GRID_INTERVAL.get(time_range, "1h")
+        step = GRID_INTERVALS[effective]
+        span_ms = (datetime.now() - _range_start(time_range)) // _ONE_MS
+        points = (span_ms // step + 2) * len(tickers)
+        if points > BATCH_MAX_POINTS:
+            return _resp(400, {"error": f"range {time_range} at interval {effective} for {len(tickers)} ticker(s) "
+                                        f"is ~{points} points, over {BATCH_MAX_POINTS}; "
+                                        f"use a coarser interval or fewer tickers"})
+
+    key = f"{','.join(tickers)}|{interval}|{time_range}|{_range_start(time_range).isoformat()}"
+    return _cached_resp(
+        event, "/stock-history/batch", key, current_data_version(conn),
+        lambda: get_aligned_history(conn, tickers, time_range, interval)
+    )
+
+
+# GET /stock-history?ticker=AAPL&range=7d[&format=columnar][&limit=N&cursor=...]
+def _route_history(event, conn):
+    qs = _query(event)
+    stock_id = qs.get("stock_id")
+    ticker = qs.get("ticker")
+    time_range = qs.get("range", "24h")  # Default to 24 hours
+
+    if not stock_id and not ticker:
+        return _resp(400, {"error": "stock_id or ticker is required"})
+
+    key = f"{_normalized_qs(qs)}|{_range_start(time_range).isoformat()}"
+    version = current_data_version(conn)
+
+    # ?format=columnar returns parallel arrays instead of row dicts
+    if qs.get("format") == "columnar":
+        columnar = _series.get_columnar if _series.enabled else get_stock_history_columnar
+        return _cached_resp(event, "/stock-history", key, version, lambda: columnar(
+            conn,
+            stock_id=int(stock_id) if stock_id else None,
+            ticker=ticker,
+            time_range=time_range
+        ))
+
+    # Row format is keyset-paged: ?limit=N&cursor=<next_cursor from the previous page>
+    try:
+        limit = int(qs.get("limit") or HISTORY_PAGE_SIZE)
+        after = decode_history_cursor(qs["cursor"]) if qs.get("cursor") else None
+    except ValueError as e:
+        return _resp(400, {"error": str(e)})
+    if not 1 <= limit <= HISTORY_MAX_PAGE_SIZE:
+        return _resp(400, {"error": f"limit must be between 1 and {HISTORY_MAX_PAGE_SIZE}"})
+
+    return _cached_resp(event, "/stock-history", key, version, lambda: stream_stock_history_page(
+        conn,
+        stock_id=int(stock_id) if stock_id else None,
+        ticker=ticker,
+        time_range=time_range,
+        after=after,
+        limit=limit
+    ))
+
+
+# GET /quotes?tickers=AAPL,MSFT[&format=columnar][&since=v123]
+def _route_quotes(event, conn):
+    qs = _query(event)
+    tickers = [
+        t.strip().upper()
+        for t in (qs.get("tickers", "").split(","))
+        if t.strip()
+    ]
+    if not tickers:
+        return _resp(
+            400,
+            {"error": "tickers query param required, e.g. ?tickers=AAPL,MSFT"},
+        )
+
+    try:
+        since = parse_since(qs["since"]) if qs.get("since") else None
+    except ValueError as e:
+        return _resp(400, {"error": str(e)})
+
+    key = f"{','.join(tickers)}|{qs.get('format')}|{qs.get('since')}"
+    version = current_data_version(conn)
+
+    def quotes_body():
+        if since:
+            body = _since_body(conn, tickers, since, version)
+            quotes = body.pop("quotes")
+        else:
+            quotes = get_quotes(conn, tickers)
+            # Hand out a mark so the client can switch to ?since= polling
+            body = {"next_since": f"v{version.split('.')[1]}"}
+        if qs.get("format") == "columnar":
+            return {**_quotes_columnar(quotes), **body}
+        return {"quotes": quotes, **body}
+
+    return _cached_resp(event, "/quotes", key, version, quotes_body)
+
+
+# POST/DELETE /watchlist with {"user_id", "ticker"} or {"user_id", "tickers": [...]}
+def _route_watchlist_write(event, conn):
+    body = _request_body(event)
+    user_id = body.get("user_id")
+    if not user_id:
+        return _resp(400, {"error": "user_id and ticker are required"})
+    try:
+        tickers = _watchlist_tickers(body)
+    except ValueError as e:
+        return _resp(400, {"error": str(e)})
+
+    if event.get("httpMethod") == "POST":
+        # Convert user_id to string
+        changed = add_to_watchlist(conn, str(user_id), tickers)
+        message = "added"
+    else:
+        changed = remove_from_watchlist(conn, str(user_id), tickers)
+        message = "removed"
+    _invalidate_after_write()
+
+    if "tickers" in body:
+        return _resp(200, {"message": message, "tickers": tickers, "changed": changed})
+    return _resp(200, {"message": message, "ticker": tickers[0]})
+
+
+# GET /alerts?user_id=1
+def _route_alerts(event, conn):
+    user_id = _query(event).get("user_id")
+    if not user_id:
+        return _resp(400, {"error": "user_id is required"})
+    return _resp(200, {"user_id": user_id, "rules": list_alert_rules(conn, str(user_id))})
+
+
+# POST /alerts with {"user_id", "ticker", "kind", "threshold", "cooldown_minutes"};
+# DELETE /alerts with {"user_id", "id"}
+def _route_alerts_write(event, conn):
+    body = _request_body(event)
+    user_id = body.get("user_id")
+    if not user_id:
+        return _resp(400, {"error": "user_id is required"})
+
+    if event.get("httpMethod") == "DELETE":
+        rule_id = body.get("id")
+        if isinstance(rule_id, bool) or not isinstance(rule_id, int):
+            return _resp(400, {"error": "id of the rule to delete is required"})
+        if not delete_alert_rule(conn, str(user_id), rule_id):
+            return _resp(404, {"error": "no such alert rule"})
+        return _resp(200, {"message": "removed", "id": rule_id})
+
+    try:
+        ticker, kind, threshold, cooldown = _alert_rule(body)
+        rule_id = create_alert_rule(conn, str(user_id), ticker, kind, threshold, cooldown)
+    except ValueError as e:
+        return _resp(400, {"error": str(e)})
+    if rule_id is None:
+        return _resp(404, {"error": f"unknown ticker {ticker}; add it to a watchlist first"})
+    return _resp(201, {
+        "message": "added", "id": rule_id, "ticker": ticker, "kind": kind,
+        "threshold": threshold, "cooldown_minutes": cooldown,
+    })
+
+
+# (method, resource path) -> (handler, needs_db). Handlers take (event, conn);
+# conn is None for routes that don't touch the database.
+ROUTES = {
+    ("GET", "/stocks"): (_route_stocks, True),
+    ("GET", "/watchlist"): (_route_watchlist, True),
+    ("POST", "/watchlist"): (_route_watchlist_write, True),
+    ("DELETE", "/watchlist"): (_route_watchlist_write, True),
+    ("GET", "/stock-history"): (_route_history, True),
+    ("GET", "/stock-history/batch"): (_route_history_batch, True),
+    ("GET", "/quotes"): (_route_quotes, True),
+    ("GET", "/alerts"): (_route_alerts, True),
+    ("POST", "/alerts"): (_route_alerts_write, True),
+    ("DELETE", "/alerts"): (_route_alerts_write, True),
+}
+_ROUTE_PATHS = frozenset(path for _, path in ROUTES)
+
+
+def _route_path(event):
+    """
+    Resource path for the ROUTES lookup. API Gateway's "resource" is already
+    the bare route; otherwise strip a stage/base-path prefix (/prod/stocks).
+    """
+    resource = event.get("resource")
+    if resource in _ROUTE_PATHS:
+        return resource
+    path = event.get("path", "/").rstrip("/") or "/"
+    if path in _ROUTE_PATHS:
+        return path
+    parts = path.split("/", 2)
+    return "/" + parts[2] if len(parts) == 3 else path
+
+
+def _handle(event, metrics=None, profiler=None):
     try:
         if event.get("httpMethod") == "OPTIONS":
+            if metrics is not None:
+                metrics.route = "OPTIONS"
             return _resp(200, {"ok": True})
 
         path = event.get("path", "/")
         method = event.get("httpMethod", "GET")
 
-        conn = None
-        try:
-            conn = get_db_connection()
-        except Exception as e:
-            return _resp(500, {"error": f"DB connection failed: {str(e)}"})
+        if event.get("action") == "cache_stats":
+            return _resp(200, {
+                "cache": _cache.stats(),
+                "series": _series.stats(),
+                "data_version": _data_version["value"],
+            })
+
+        route_path = _route_path(event)
+        route = ROUTES.get((method, route_path))
+        if route is None:
+            return _resp(404, {"error": "not found", "path": path, "method": method})
+        fn, needs_db = route
+        if metrics is not None:
+            metrics.route = f"{method} {route_path}"
 
+        factory = get_db_connection
+        if profiler is not None:
+            factory = lambda: profiler.wrap(get_db_connection())
+        conn = LazyConnection(factory, metrics) if needs_db else None
         try:
-            # GET /stocks
-            if path.endswith("/stocks") and method == "GET":
-                rows = list_stocks(conn)
-                return _resp(200, {"stocks": rows})
-
-            # GET /watchlist?user_id=1
-            if path.endswith("/watchlist") and method == "GET":
-                qs = event.get("queryStringParameters") or {}
-                user_id = qs.get("user_id")
-                if not user_id:
-                    return _resp(400, {"error": "user_id is required"})
-                tickers = get_watchlist(conn, user_id)
-                return _resp(200, {"user_id": int(user_id), "tickers": tickers})
-            # GET /stock-history?ticker=AAPL&range=7d
-            if path.endswith("/stock-history") and method == "GET":
-                qs = event.get("queryStringParameters") or {}
-                stock_id = qs.get("stock_id")
-                ticker = qs.get("ticker")
-                time_range = qs.get("range", "24h")  # Default to 24 hours
-                
-                if not stock_id and not ticker:
-                    return _resp(400, {"error": "stock_id or ticker is required"})
-                
-                history = get_stock_history(
-                    conn, 
-                    stock_id=int(stock_id) if stock_id else None,
-                    ticker=ticker,
-                    time_range=time_range
-                )
-                
-                return _resp(200, {
-                    "ticker": ticker.upper() if ticker else None,
-                    "time_range": time_range,
-                    "history": history,
-                    "count": len(history)
-                })
-
-          # Replace your /quotes endpoint handler with this:
-
-            # GET /quotes?tickers=AAPL,MSFT
-            if path.endswith("/quotes") and method == "GET":
-                qs = event.get("queryStringParameters") or {}
-                tickers = [
-                    t.strip().upper()
-                    for t in (qs.get("tickers", "").split(","))
-                    if t.strip()
-                ]
-                if not tickers:
-                    return _resp(
-                        400,
-                        {"error": "tickers query param required, e.g. ?tickers=AAPL,MSFT"},
-                    )
-
-                quotes = []
-                
-                with conn.cursor() as cursor:
-                    for ticker in tickers:
-                        # Get the latest sentiment from stock_history
-                        cursor.execute("""
-                            SELECT 
-                                s.ticker,
-                                sh.price,
-                                sh.avg_sentiment,
-                                sh.recorded_at
-                            FROM stocks s
-                            LEFT JOIN stock_history sh ON sh.stock_id = s.id
-                            WHERE s.ticker = %s
-                            ORDER BY sh.recorded_at DESC
-                            LIMIT 1
-                        """, (ticker,))
-                        
-                        row = cursor.fetchone()
-                        
-                        if row and row['avg_sentiment'] is not None:
-                            sentiment_score = float(row['avg_sentiment'])
-                            
-                            # Generate sentiment label based on score
-                            if sentiment_score >= 0.35:
-                                sentiment_label = "Bullish"
-                            elif sentiment_score >= 0.15:
-                                sentiment_label = "Somewhat-Bullish"
-                            elif sentiment_score > -0.15:
-                                sentiment_label = "Neutral"
-                            elif sentiment_score > -0.35:
-                                sentiment_label = "Somewhat-Bearish"
-                            else:
-                                sentiment_label = "Bearish"
-                            
-                            quotes.append({
-                                "ticker": ticker,
-                                "price": float(row['price']) if row['price'] else None,
-                                "change_pct": None,  # Not tracking this in current schema
-                                "sentiment_score": sentiment_score,
-                                "sentiment_label": sentiment_label,
-                                "error": None,
-                                "updated_at": row['recorded_at'].isoformat() if row['recorded_at'] else None
-                            })
-                        else:
-                            # No data found in database
-                            quotes.append({
-                                "ticker": ticker,
-                                "price": None,
-                                "change_pct": None,
-                                "sentiment_score": None,
-                                "sentiment_label": "No Data",
-                                "error": "No historical data available",
-                            })
-
-                return _resp(200, {"quotes": quotes})
-            # body for POST/DELETE
-            body = {}
-            if event.get("body"):
-                try:
-                    body = json.loads(event["body"])
-                except json.JSONDecodeError:
-                    body = {}
-            
-            # POST /watchlist
-            if path.endswith("/watchlist") and method == "POST":
-                user_id = body.get("user_id")
-                ticker = body.get("ticker")
-                if not user_id or not ticker:
-                    return _resp(400, {"error": "user_id and ticker are required"})
-                ticker = ticker.strip().upper()
-                # Convert user_id to string
-                add_to_watchlist(conn, str(user_id), ticker)
-                return _resp(200, {"message": "added", "ticker": ticker})
-            
-            # DELETE /watchlist
-            if path.endswith("/watchlist") and method == "DELETE":
-                user_id = body.get("user_id")
-                ticker = body.get("ticker")
-                if not user_id or not ticker:
-                    return _resp(400, {"error": "user_id and ticker are required"})
-                ticker = ticker.strip().upper()
-                remove_from_watchlist(conn, str(user_id), ticker)
-                return _resp(200, {"message": "removed", "ticker": ticker})
-            
-            return _resp(404, {"error": "not found", "path": path, "method": method})             
-        
+            return fn(event, conn)
         except Exception as e:
             return _resp(500, {"error": str(e)})
-        
         finally:
-            if conn:
+            if conn is not None:
                 conn.close()
 
     except Exception as e:
+        import traceback
         # Catch any unexpected error and ensure valid Lambda proxy response
-        return _resp(500, {"error": "Unhandled exception", "trace": traceback.format_exc()})
\ No newline at end of file
+        return _resp(500, {"error": "Unhandled exception", "trace": traceback.format_exc()})
+
+
+def _profiled_handle(event, metrics=None):
+    if not QUERY_PROFILE or QueryProfiler is None:
+        return _handle(event, metrics)
+    profiler = QueryProfiler.from_env()
+    resp = _handle(event, metrics, profiler)
+    if profiler.stats:
+        print(json.dumps({"query_profile": profiler.report(), "path": event.get("path")}, cls=CustomJSONEncoder))
+    return resp
+
+
+def lambda_handler(event, context):
+    if not METRICS_SAMPLE_RATE or random.random() >= METRICS_SAMPLE_RATE:
+        return _compress(event, _profiled_handle(event))
+
+    metrics = RequestMetrics()
+    resp = _profiled_handle(event, metrics)
+    body_bytes = len(resp["body"].encode("utf-8"))
+    resp = _compress(event, resp)
+    metrics.finish(resp, body_bytes)
+    return resp
@@ -1,5 +1,8 @@
 import os
+import json
 import pymysql
+# lambda/shared/migrate.py and migrations/, copied in at packaging time
+from migrate import run_migrations
 
 def get_connection():
     """Establish a connection to the RDS MySQL instance."""
@@ -14,37 +17,19 @@ def get_connection():
         cursorclass=pymysql.cursors.DictCursor
     )
 
-def execute_sql_file(conn, filepath):
-    """Execute SQL commands from a file."""
-    with open(filepath, "r") as file:
-        sql_commands = file.read()
-
-    # Split statements by semicolon and execute each
-    with conn.cursor() as cur:
-        for statement in sql_commands.split(";"):
-            stmt = statement.strip()
-            if stmt:
-                cur.execute(stmt)
-        conn.commit()
-
 def lambda_handler(event, context):
-    """Lambda entry point for database initialization."""
+    """
+    Lambda entry point for database initialization: brings the schema up to
+    the latest migration (or {"target": N}) without touching existing data.
+    """
     print("Starting MySQL database initialization...")
 
     try:
         conn = get_connection()
         print("Connected to MySQL database.")
 
-        sql_dir = os.path.join(os.path.dirname(__file__), "sql")
-
-        # Example: Execute multiple SQL scripts in sequence
-        for script in ["init_tables.sql", "seed_data.sql"]:
-            filepath = os.path.join(sql_dir, script)
-            if os.path.exists(filepath):
-                print(f"Running {script}...")
-                execute_sql_file(conn, filepath)
-            else:
-                print(f"Warning: {filepath} not found.")
+        target = (event or {}).get("target")
+        applied = run_migrations(conn, target=int(target) if target is not None else None)
 
         print("Database initialization complete.")
         return {
@@ -56,7 +41,10 @@ def lambda_handler(event, context):
             "Access-Control-Allow-Methods": "GET,POST,DELETE,OPTIONS",
             "Access-Control-Allow-Headers": "Content-Type",
             },
-        "body": '{"status":"success"}'
+        "body": json.dumps({
+            "status": "success",
+            "applied": [f"{version:04d}_{name}" for version, name in applied],
+        })
         }
 
     except Exception as e:
@@ -1,9 +0,0 @@
-INSERT INTO stocks (ticker)
-    VALUES
-        ('AAPL'),
-        ('NFLX'),
-        ('AMZN'),
-        ('NVDA'),
-        ('META'),
-        ('MSFT'),
-        ('AMD');
\ No newline at end of file
@@ -0,0 +1,234 @@
+"""
+Per-user threshold alerts, evaluated incrementally by the scheduler Lambda
+right after it writes new stock_history snapshots.
+
+Rule kinds (alert_rules.kind):
+  sentiment_above  average sentiment crosses from <= threshold to > threshold
+  sentiment_below  average sentiment crosses from >= threshold to < threshold
+  price_move_pct   price moved by at least threshold percent since the
+                   previous snapshot (either direction)
+  label_change     the sentiment label shown by the API changed
+
+Only the rules attached to tickers that got a new snapshot are read, through
+the alert_rules (stock_id) index (the ticker -> rules reverse index), so a
+run costs O(changed tickers + their rules), whatever the number of users.
+
+Fired alerts go to alert_queue for delivery. dedup_key is rule + snapshot
+id, so re-evaluating the same snapshot (a retried run) never queues twice,
+and a rule that fired within its cooldown_minutes stays quiet.
+
+Rules are created through the API (GET/POST/DELETE /alerts in get_stocks).
+deliver_alerts drains alert_queue after each evaluation: one email per user
+with everything pending for them, marked delivered_at once SES accepts it.
+"""
+import time
+from datetime import datetime, timedelta
+
+RULE_KINDS = ("sentiment_above", "sentiment_below", "price_move_pct", "label_change")
+THROTTLE_CODES = {"Throttling", "ThrottlingException", "TooManyRequestsException"}
+ALERT_SUBJECT = "Your Stock Watchlist Alerts"
+
+
+def sentiment_label(score):
+    """Same buckets as the API's quote labels (get_stocks _sentiment_label)"""
+    if score >= 0.35:
+        return "Bullish"
+    elif score >= 0.15:
+        return "Somewhat-Bullish"
+    elif score > -0.15:
+        return "Neutral"
+    elif score > -0.35:
+        return "Somewhat-Bearish"
+    return "Bearish"
+
+
+def latest_snapshots(conn, stock_ids):
+    """{stock_id: {"price", "avg_sentiment"}} from each stock's newest stock_history row"""
+    if not stock_ids:
+        return {}
+    placeholders = ",".join(["%s"] * len(stock_ids))
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT s.id AS stock_id, sh.price, sh.avg_sentiment
+            FROM stocks s
+            JOIN stock_history sh ON sh.id = (
+                SELECT sh2.id
+                FROM stock_history sh2
+                WHERE sh2.stock_id = s.id
+                ORDER BY sh2.recorded_at DESC, sh2.id DESC
+                LIMIT 1
+            )
+            WHERE s.id IN ({placeholders})
+        """, tuple(stock_ids))
+        return {row["stock_id"]: row for row in cursor.fetchall()}
+
+
+def rules_for(conn, stock_ids):
+    """{stock_id: [rule, ...]} for just these stocks"""
+    if not stock_ids:
+        return {}
+    placeholders = ",".join(["%s"] * len(stock_ids))
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT id, user_id, stock_id, kind, threshold, cooldown_minutes, last_fired_at
+            FROM alert_rules
+            WHERE stock_id IN ({placeholders})
+        """, tuple(stock_ids))
+        rules = {}
+        for row in cursor.fetchall():
+            rules.setdefault(row["stock_id"], []).append(row)
+        return rules
+
+
+def check_rule(rule, ticker, prev, new):
+    """Alert message if the move from prev to new trips the rule, else None"""
+    kind = rule["kind"]
+    threshold = float(rule["threshold"]) if rule["threshold"] is not None else None
+    if threshold is None and kind != "label_change":
+        return None
+    old_s, new_s = prev.get("avg_sentiment"), new.get("avg_sentiment")
+    old_p, new_p = prev.get("price"), new.get("price")
+
+    if kind in ("sentiment_above", "sentiment_below", "label_change"):
+        if old_s is None or new_s is None:
+            return None
+        old_s, new_s = float(old_s), float(new_s)
+        if kind == "sentiment_above" and old_s <= threshold < new_s:
+            return f"{ticker} sentiment rose above {threshold:.3f} ({old_s:.3f} -> {new_s:.3f})"
+        if kind == "sentiment_below" and old_s >= threshold > new_s:
+            return f"{ticker} sentiment fell below {threshold:.3f} ({old_s:.3f} -> {new_s:.3f})"
+        if kind == "label_change" and sentiment_label(old_s) != sentiment_label(new_s):
+            return f"{ticker} sentiment changed from {sentiment_label(old_s)} to {sentiment_label(new_s)}"
+        return None
+
+    if kind == "price_move_pct":
+        if not old_p or new_p is None:
+            return None
+        old_p, new_p = float(old_p), float(new_p)
+        move = (new_p - old_p) / old_p * 100
+        if abs(move) >= threshold:
+            return f"{ticker} price {'up' if move > 0 else 'down'} {abs(move):.1f}% (${old_p:.2f} -> ${new_p:.2f})"
+    return None
+
+
+def evaluate_alerts(conn, changes, now=None, log=print):
+    """
+    changes: [{"stock_id", "ticker", "history_id", "prev": snapshot or None,
+    "new": {"price", "avg_sentiment"}}] for the snapshots this run wrote.
+    Queues every alert that fires and returns counts for the run summary.
+    """
+    now = now or datetime.utcnow()
+    changes = [c for c in changes if c.get("prev") and c.get("history_id")]
+    rules = rules_for(conn, [c["stock_id"] for c in changes])
+
+    queued, fired_rule_ids = [], []
+    checked = cooled_down = 0
+    for change in changes:
+        for rule in rules.get(change["stock_id"], []):
+            checked += 1
+            message = check_rule(rule, change["ticker"], change["prev"], change["new"])
+            if message is None:
+                continue
+            last = rule["last_fired_at"]
+            if last and last > now - timedelta(minutes=rule["cooldown_minutes"]):
+                cooled_down += 1
+                continue
+            queued.append((
+                rule["id"], rule["user_id"], rule["stock_id"], message[:500],
+                f"{rule['id']}:{change['history_id']}",
+            ))
+            fired_rule_ids.append(rule["id"])
+
+    inserted = 0
+    if queued:
+        with conn.cursor() as cursor:
+            cursor.executemany("""
+                INSERT IGNORE INTO alert_queue (rule_id, user_id, stock_id, message, dedup_key)
+                VALUES (%s, %s, %s, %s, %s)
+            """, queued)
+            inserted = cursor.rowcount
+            placeholders = ",".join(["%s"] * len(fired_rule_ids))
+            cursor.execute(
+                f"UPDATE alert_rules SET last_fired_at = %s WHERE id IN ({placeholders})",
+                (now, *fired_rule_ids),
+            )
+        conn.commit()
+        log(f"Queued {inserted} alert(s) for {len(changes)} changed ticker(s)")
+
+    return {
+        "tickers": len(changes),
+        "rules_checked": checked,
+        "queued": inserted,
+        "cooled_down": cooled_down,
+    }
+
+
+def _error_code(exc):
+    response = getattr(exc, "response", None) or {}
+    return response.get("Error", {}).get("Code")
+
+
+def pending_alerts(conn, limit, max_attempts):
+    """{email: [alert_queue row, ...]} oldest first, through idx_alert_queue_pending"""
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT q.id, q.message, u.email
+            FROM alert_queue q
+            JOIN users u ON u.id = q.user_id
+            WHERE q.delivered_at IS NULL AND q.attempts < %s
+            ORDER BY q.id
+            LIMIT %s
+        """, (max_attempts, limit))
+        by_email = {}
+        for row in cursor.fetchall():
+            by_email.setdefault(row["email"], []).append(row)
+        return by_email
+
+
+def deliver_alerts(conn, ses, sender=None, limit=500, max_attempts=5, send_rate=1.0,
+                   now=None, log=print, sleep=time.sleep):
+    """
+    Email each user their pending alerts (one send_email per user, paced to
+    send_rate per second) and record the outcome per user as it happens:
+    delivered_at on success, attempts/last_error on a rejection. A throttled
+    send stops the run; what's left goes out on the next one. Without a
+    sender each email is sent from its recipient, like the digest.
+    """
+    now = now or datetime.utcnow()
+    by_email = pending_alerts(conn, limit, max_attempts)
+    delivered = failed = 0
+    for i, (email, rows) in enumerate(by_email.items()):
+        if i:
+            sleep(1.0 / send_rate)
+        ids = [row["id"] for row in rows]
+        placeholders = ",".join(["%s"] * len(ids))
+        text = "\n".join(f"- {row['message']}" for row in rows)
+        try:
+            ses.send_email(
+                Source=sender or email,
+                Destination={"ToAddresses": [email]},
+                Message={
+                    "Subject": {"Data": ALERT_SUBJECT},
+                    "Body": {"Text": {"Data": f"Hello,\n\n{text}\n\nBest regards,\nStock News Analyzer"}},
+                },
+            )
+        except Exception as e:
+            if _error_code(e) in THROTTLE_CODES:
+                log(f"Alert delivery throttled; {len(by_email) - i} user(s) left for the next run")
+                break
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    f"UPDATE alert_queue SET attempts = attempts + 1, last_error = %s WHERE id IN ({placeholders})",
+                    (str(e)[:500], *ids),
+                )
+            conn.commit()
+            failed += len(ids)
+            continue
+        with conn.cursor() as cursor:
+            cursor.execute(f"UPDATE alert_queue SET delivered_at = %s WHERE id IN ({placeholders})", (now, *ids))
+        conn.commit()
+        delivered += len(ids)
+
+    if delivered or failed:
+        log(f"Delivered {delivered} alert(s), {failed} failed")
+    return {"delivered": delivered, "failed": failed}
@@ -7,9 +7,30 @@ from decimal import Decimal
 import boto3
 import time
 import requests
+try:
+    # lambda/shared/query_profiler.py, copied in at packaging time
+    from query_profiler import QueryProfiler
+except ImportError:
+    QueryProfiler = None
+try:
+    # lambda/shared/partitions.py, copied in at packaging time
+    from partitions import ensure_future_partitions
+except ImportError:
+    ensure_future_partitions = None
+try:
+    # scheduler/retention.py; needs partitions.py alongside it
+    from retention import RETENTION_MAX_SECONDS, run_retention
+except ImportError:
+    run_retention = None
+try:
+    # scheduler/alerts.py
+    from alerts import deliver_alerts, evaluate_alerts, latest_snapshots
+except ImportError:
+    evaluate_alerts = None
 
 # AWS Clients
 comprehend = boto3.client('comprehend', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
+ses = boto3.client('ses', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
 
 # Configuration from environment variables
 DB_HOST = os.environ.get('DB_HOST')
@@ -19,6 +40,18 @@ DB_NAME = os.environ.get('DB_NAME', 'stocknewsanalyzerdb')
 TIINGO_API_KEY = os.environ.get('TIINGO_API_KEY')
 ALPHA_VANTAGE_KEY = os.environ.get('ALPHA_VANTAGE_KEY')  # Keep for news
 AWS_REGION = os.environ.get('AWS_REGION', 'us-east-1')
+# Per-user threshold alerts (alerts.py): evaluated against each run's new
+# snapshots, then alert_queue is delivered by email. Set in eventbridge.tf.
+ALERTS_ENABLED = os.environ.get('ALERTS_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+# Verified SES address alerts are sent from (empty = from the recipient, like the digest)
+ALERTS_SENDER = os.environ.get('ALERTS_SENDER', '')
+# Alert emails per second (SES sandbox accounts get 1/s) and per run
+ALERTS_SEND_RATE = float(os.environ.get('ALERTS_SEND_RATE', '1'))
+ALERTS_DELIVERY_BATCH = int(os.environ.get('ALERTS_DELIVERY_BATCH', '500'))
+# A queued alert SES rejected this many times is left undelivered
+ALERTS_MAX_ATTEMPTS = int(os.environ.get('ALERTS_MAX_ATTEMPTS', '5'))
+# Per-run query report (fingerprints, N+1 loops, EXPLAIN of slow statements) in the summary
+QUERY_PROFILE = os.environ.get('QUERY_PROFILE', 'true').lower() not in ('0', 'false', 'no')
 
 def get_db_connection():
     return pymysql.connect(
@@ -34,6 +67,25 @@ def _http_get_json(url):
     with urllib.request.urlopen(url, timeout=10) as resp:
         return json.loads(resp.read().decode("utf-8"))
 
+# Monthly-partitioned by recorded_at (migration 0004)
+HISTORY_TABLES = ("stock_history", "article_history")
+
+def maintain_partitions(conn):
+    """Split pmax so the next few months have partitions before rows arrive"""
+    added = {}
+    if ensure_future_partitions is None:
+        return added
+    for table in HISTORY_TABLES:
+        try:
+            names = ensure_future_partitions(conn, table)
+        except Exception as e:
+            print(f"Error adding partitions to {table}: {str(e)}")
+            continue
+        if names:
+            print(f"Added partitions to {table}: {', '.join(names)}")
+            added[table] = names
+    return added
+
 def get_all_stocks(conn):
     with conn.cursor() as cursor:
         cursor.execute("SELECT id, ticker FROM stocks ORDER BY ticker")
@@ -144,19 +196,20 @@ def store_article(conn, stock_id, title, keywords, sentiment_score):
         return False
 
 def store_stock_history(conn, stock_id, price, avg_sentiment):
-    """Store stock history snapshot"""
+    """Store stock history snapshot; returns the new row's id (None on failure)"""
     try:
         with conn.cursor() as cursor:
             cursor.execute("""
                 INSERT INTO stock_history (stock_id, price, avg_sentiment)
                 VALUES (%s, %s, %s)
             """, (stock_id, price, avg_sentiment))
+            history_id = cursor.lastrowid
         conn.commit()
-        return True
+        return history_id
     except Exception as e:
         print(f"Error storing stock history: {str(e)}")
         conn.rollback()
-        return False
+        return None
 
 def process_stock(conn, stock_id, ticker):
     """Process a single stock"""
@@ -211,23 +264,73 @@ def process_stock(conn, stock_id, ticker):
         print(f"Average sentiment: {avg_sentiment:.3f}")
     
     # 5. Store stock history
-    store_stock_history(conn, stock_id, price, avg_sentiment)
+    history_id = store_stock_history(conn, stock_id, price, avg_sentiment)
     
     return {
+        'stock_id': stock_id,
+        'history_id': history_id,
         'ticker': ticker,
         'price': price,
         'articles_stored': articles_stored,
         'avg_sentiment': avg_sentiment
     }
 
+def retention_handler(event):
+    """
+    Daily retention run: compact/expire history per the event's policy.
+    Stops at max_seconds and resumes from its checkpoints on the next run.
+    """
+    if run_retention is None:
+        return {
+            "statusCode": 500,
+            "body": json.dumps({"error": "retention module not packaged"})
+        }
+    try:
+        profiler = QueryProfiler.from_env() if QUERY_PROFILE and QueryProfiler else None
+        conn = get_db_connection()
+        if profiler:
+            conn = profiler.wrap(conn)
+        try:
+            summary = run_retention(
+                conn,
+                policy=event.get("policy"),
+                max_seconds=event.get("max_seconds", RETENTION_MAX_SECONDS),
+            )
+        finally:
+            conn.close()
+        summary["timestamp"] = datetime.now().isoformat()
+        if profiler:
+            summary["query_profile"] = profiler.report()
+            print(profiler.format_report())
+
+        print(json.dumps(summary, indent=2, default=str))
+
+        return {
+            "statusCode": 200,
+            "body": json.dumps(summary, default=str)
+        }
+
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return {
+            "statusCode": 500,
+            "body": json.dumps({"error": str(e)})
+        }
+
 def lambda_handler(event, context):
     """
     Hourly Lambda: Collect prices and news, analyze sentiment
     """
     print(f"Started at {datetime.now().isoformat()}")
+    if (event or {}).get("action") == "retention":
+        return retention_handler(event)
     
     try:
+        profiler = QueryProfiler.from_env() if QUERY_PROFILE and QueryProfiler else None
         conn = get_db_connection()
+        if profiler:
+            conn = profiler.wrap(conn)
+        partitions_added = maintain_partitions(conn)
         stocks = get_all_stocks(conn)
         
         if not stocks:
@@ -238,6 +341,9 @@ def lambda_handler(event, context):
         
         print(f"Processing {len(stocks)} stocks")
         
+        # Each ticker's snapshot before this run, for alert rules that compare against it
+        alerts_on = ALERTS_ENABLED and evaluate_alerts is not None
+        previous = latest_snapshots(conn, [s['id'] for s in stocks]) if alerts_on else {}
         results = []
         
         for stock in stocks:
@@ -249,20 +355,50 @@ def lambda_handler(event, context):
                 print(f"Error processing {stock['ticker']}: {str(e)}")
                 continue
         
+        alerts = None
+        if alerts_on:
+            changes = [
+                {
+                    "stock_id": r['stock_id'],
+                    "ticker": r['ticker'],
+                    "history_id": r['history_id'],
+                    "prev": previous.get(r['stock_id']),
+                    "new": {"price": r['price'], "avg_sentiment": r['avg_sentiment']},
+                }
+                for r in results
+            ]
+            try:
+                alerts = evaluate_alerts(conn, changes)
+            except Exception as e:
+                print(f"Error evaluating alerts: {str(e)}")
+            # Also picks up anything an earlier run queued but didn't get out
+            try:
+                alerts = dict(alerts or {}, delivery=deliver_alerts(
+                    conn, ses, sender=ALERTS_SENDER, limit=ALERTS_DELIVERY_BATCH,
+                    max_attempts=ALERTS_MAX_ATTEMPTS, send_rate=ALERTS_SEND_RATE,
+                ))
+            except Exception as e:
+                print(f"Error delivering alerts: {str(e)}")
+        
         conn.close()
         
         summary = {
             "message": "Collection complete",
             "stocks_processed": len(results),
             "results": results,
+            "partitions_added": partitions_added,
+            "alerts": alerts,
             "timestamp": datetime.now().isoformat()
         }
+        if profiler:
+            summary["query_profile"] = profiler.report()
+            print(profiler.format_report())
         
-        print(json.dumps(summary, indent=2))
+        print(json.dumps(summary, indent=2, default=str))
         
         return {
             "statusCode": 200,
-            "body": json.dumps(summary)
+            "body": json.dumps(summary, default=str)
         }
     
     except Exception as e:
@@ -0,0 +1,285 @@
+"""
+Retention and compaction for the history tables, run by the scheduler Lambda
+for {"action": "retention"} events.
+
+Policies (env defaults, overridable per event under "policy"):
+  history_raw_days     stock_history older than this is compacted to one row
+                       per ticker per day: the day's last snapshot (closing
+                       price) carrying the day's average sentiment
+  article_detail_days  article_history older than this keeps title and score
+                       only (keywords cleared)
+  history_max_days     stock_history older than this is removed (0 = keep)
+  article_max_days     article_history older than this is removed (0 = keep)
+
+Work is done in small pieces so no statement holds locks on a hot table for
+long: whole monthly partitions are compacted by building the compacted month
+in a side table and swapping it in with EXCHANGE PARTITION (writes wait on a
+table lock for that one month's copy, so none land in between and get
+swapped out), and expired months are dropped as partitions; anything else
+goes a day at a time, one transaction per day. Progress is checkpointed in maintenance_checkpoints, so
+a run that hits its time budget picks up where it stopped on the next run.
+Compaction is idempotent, so redoing a day after a crash is harmless.
+
+Compaction and expiry change stock_history without adding rows, so the
+API's MAX(id)-based data version can't see them; a run that touched the
+table bumps history_revision (migration 0010) for it.
+"""
+import os
+import time
+from datetime import datetime, timedelta
+
+# lambda/shared/partitions.py, copied in at packaging time
+from partitions import add_months, drop_partitions, list_partitions, month_start
+
+JOB = "retention"
+
+DEFAULT_POLICY = {
+    "history_raw_days": int(os.environ.get("RETENTION_HISTORY_RAW_DAYS", "30")),
+    "article_detail_days": int(os.environ.get("RETENTION_ARTICLE_DETAIL_DAYS", "180")),
+    "history_max_days": int(os.environ.get("RETENTION_HISTORY_MAX_DAYS", "0")),
+    "article_max_days": int(os.environ.get("RETENTION_ARTICLE_MAX_DAYS", "0")),
+}
+# Leave headroom under the scheduler Lambda's 300s timeout
+RETENTION_MAX_SECONDS = int(os.environ.get("RETENTION_MAX_SECONDS", "240"))
+DELETE_CHUNK_ROWS = 5000
+
+
+def _day(dt):
+    return datetime(dt.year, dt.month, dt.day)
+
+
+def _scalar(conn, sql, params=None):
+    with conn.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    return next(iter(row.values())) if isinstance(row, dict) else row[0]
+
+
+def get_checkpoint(conn, item):
+    value = _scalar(conn, "SELECT value FROM maintenance_checkpoints WHERE job = %s AND item = %s", (JOB, item))
+    return datetime.fromisoformat(value) if value else None
+
+
+def set_checkpoint(conn, item, when):
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO maintenance_checkpoints (job, item, value) VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE value = VALUES(value)
+        """, (JOB, item, when.isoformat()))
+    conn.commit()
+
+
+def bump_history_revision(conn):
+    """Tell readers (ETags, response caches, warm series) that stock_history changed in place"""
+    with conn.cursor() as cursor:
+        cursor.execute("UPDATE history_revision SET revision = revision + 1 WHERE id = 1")
+    conn.commit()
+
+
+def _stock_ids(conn):
+    # stock_id IN (...) lets day windows seek the (stock_id, recorded_at) key
+    # instead of scanning for recorded_at alone
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT id FROM stocks ORDER BY id")
+        return [r["id"] if isinstance(r, dict) else r[0] for r in cursor.fetchall()]
+
+
+def _month_partitions(conn, table):
+    return [(name, month) for name, month, _ in list_partitions(conn, table) if month is not None]
+
+
+def _compact_partition(conn, name, log):
+    """Replace one monthly partition of stock_history with its daily-compacted rows"""
+    with conn.cursor() as cursor:
+        cursor.execute("DROP TABLE IF EXISTS stock_history_compact")
+        cursor.execute("CREATE TABLE stock_history_compact LIKE stock_history")
+        cursor.execute("ALTER TABLE stock_history_compact REMOVE PARTITIONING")
+        # Held from the copy through the swap: a row written (or upserted) into
+        # this month in between would otherwise be exchanged out with the raw
+        # rows and dropped. The copy reads stock_history through the alias sh
+        # and by name, so both need a lock.
+        cursor.execute("LOCK TABLES stock_history WRITE, stock_history AS sh READ, stock_history_compact WRITE")
+        try:
+            cursor.execute(f"""
+                INSERT INTO stock_history_compact (id, stock_id, price, avg_sentiment, recorded_at)
+                SELECT sh.id, sh.stock_id, sh.price, d.avg_sentiment, sh.recorded_at
+                FROM stock_history PARTITION ({name}) sh
+                JOIN (
+                    SELECT stock_id, MAX(recorded_at) AS last_at, AVG(avg_sentiment) AS avg_sentiment
+                    FROM stock_history PARTITION ({name})
+                    GROUP BY stock_id, DATE(recorded_at)
+                ) d ON sh.stock_id = d.stock_id AND sh.recorded_at = d.last_at
+            """)
+            kept = cursor.rowcount
+            conn.commit()
+            # Metadata swap: the partition now holds the compacted rows, the side
+            # table the raw ones. Rows came out of this partition, so they fit it.
+            cursor.execute(
+                f"ALTER TABLE stock_history EXCHANGE PARTITION {name} WITH TABLE stock_history_compact WITHOUT VALIDATION"
+            )
+        finally:
+            cursor.execute("UNLOCK TABLES")
+        raw = _scalar(conn, "SELECT COUNT(*) FROM stock_history_compact")
+        cursor.execute("DROP TABLE stock_history_compact")
+    log(f"  stock_history {name}: {raw} rows -> {kept}")
+    return raw - kept
+
+
+def _compact_day(conn, stock_ids, day):
+    """Keep each ticker's last snapshot of the day, with the day's average sentiment"""
+    placeholders = ",".join(["%s"] * len(stock_ids))
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT stock_id, MAX(recorded_at) AS last_at, AVG(avg_sentiment) AS avg_sentiment, COUNT(*) AS n
+            FROM stock_history
+            WHERE stock_id IN ({placeholders}) AND recorded_at >= %s AND recorded_at < %s
+            GROUP BY stock_id
+            HAVING n > 1
+        """, (*stock_ids, day, day + timedelta(days=1)))
+        groups = [r if isinstance(r, dict) else dict(zip(("stock_id", "last_at", "avg_sentiment", "n"), r))
+                  for r in cursor.fetchall()]
+        deleted = 0
+        for g in groups:
+            cursor.execute(
+                "UPDATE stock_history SET avg_sentiment = %s WHERE stock_id = %s AND recorded_at = %s",
+                (g["avg_sentiment"], g["stock_id"], g["last_at"]),
+            )
+            cursor.execute(
+                "DELETE FROM stock_history WHERE stock_id = %s AND recorded_at >= %s AND recorded_at < %s",
+                (g["stock_id"], day, g["last_at"]),
+            )
+            deleted += cursor.rowcount
+    conn.commit()
+    return deleted
+
+
+def compact_history(conn, stock_ids, cutoff, deadline, log):
+    """
+    Compact stock_history up to cutoff. A whole month whose partition is
+    entirely before cutoff is swapped in compacted; otherwise a day at a time.
+    """
+    item = "stock_history_compacted_through"
+    partitions = {month: name for name, month in _month_partitions(conn, "stock_history")}
+    through = get_checkpoint(conn, item)
+    if through is None:
+        oldest = _scalar(conn, "SELECT MIN(recorded_at) FROM stock_history")
+        if oldest is None:
+            return {"through": None, "partitions": [], "days": 0, "rows_removed": 0, "complete": True}
+        through = month_start(oldest) if partitions else _day(oldest)
+
+    result = {"partitions": [], "days": 0, "rows_removed": 0}
+    while through < cutoff and time.monotonic() < deadline:
+        name = partitions.get(through)
+        if name and add_months(through, 1) <= cutoff:
+            result["rows_removed"] += _compact_partition(conn, name, log)
+            result["partitions"].append(name)
+            through = add_months(through, 1)
+        else:
+            result["rows_removed"] += _compact_day(conn, stock_ids, through)
+            result["days"] += 1
+            through += timedelta(days=1)
+        set_checkpoint(conn, item, through)
+
+    result["through"] = through.isoformat()
+    result["complete"] = through >= cutoff
+    return result
+
+
+def trim_articles(conn, stock_ids, cutoff, deadline):
+    """Clear keywords on articles older than cutoff, a day at a time"""
+    item = "article_history_trimmed_through"
+    through = get_checkpoint(conn, item)
+    if through is None:
+        oldest = _scalar(conn, "SELECT MIN(recorded_at) FROM article_history")
+        if oldest is None:
+            return {"through": None, "days": 0, "rows_trimmed": 0, "complete": True}
+        through = _day(oldest)
+
+    placeholders = ",".join(["%s"] * len(stock_ids))
+    result = {"days": 0, "rows_trimmed": 0}
+    while through < cutoff and time.monotonic() < deadline:
+        with conn.cursor() as cursor:
+            cursor.execute(f"""
+                UPDATE article_history SET keywords = NULL
+                WHERE stock_id IN ({placeholders}) AND recorded_at >= %s AND recorded_at < %s
+                  AND keywords IS NOT NULL
+            """, (*stock_ids, through, through + timedelta(days=1)))
+            result["rows_trimmed"] += cursor.rowcount
+        conn.commit()
+        result["days"] += 1
+        through += timedelta(days=1)
+        set_checkpoint(conn, item, through)
+
+    result["through"] = through.isoformat()
+    result["complete"] = through >= cutoff
+    return result
+
+
+def expire(conn, table, stock_ids, cutoff, deadline, log):
+    """Remove rows older than cutoff: whole partitions where possible, then chunked deletes"""
+    partitions = _month_partitions(conn, table)
+    # Never drop the newest month partition or pmax
+    expired = [name for name, month in partitions[:-1] if add_months(month, 1) <= cutoff]
+    if expired:
+        drop_partitions(conn, table, expired)
+        log(f"  {table}: dropped partitions {', '.join(expired)}")
+
+    placeholders = ",".join(["%s"] * len(stock_ids))
+    deleted = 0
+    while time.monotonic() < deadline:
+        with conn.cursor() as cursor:
+            cursor.execute(f"""
+                DELETE FROM {table}
+                WHERE stock_id IN ({placeholders}) AND recorded_at < %s
+                LIMIT {DELETE_CHUNK_ROWS}
+            """, (*stock_ids, cutoff))
+            n = cursor.rowcount
+        conn.commit()
+        deleted += n
+        if n < DELETE_CHUNK_ROWS:
+            return {"partitions_dropped": expired, "rows_deleted": deleted, "complete": True}
+    return {"partitions_dropped": expired, "rows_deleted": deleted, "complete": False}
+
+
+def run_retention(conn, policy=None, max_seconds=RETENTION_MAX_SECONDS, now=None, log=print):
+    policy = {**DEFAULT_POLICY, **(policy or {})}
+    deadline = time.monotonic() + max_seconds
+    today = _day(now or datetime.utcnow())
+    stock_ids = _stock_ids(conn)
+    summary = {"policy": policy, "complete": True}
+    if not stock_ids:
+        return summary
+
+    if policy["history_max_days"]:
+        summary["history_expired"] = expire(
+            conn, "stock_history", stock_ids, today - timedelta(days=policy["history_max_days"]), deadline, log
+        )
+    if policy["article_max_days"]:
+        summary["articles_expired"] = expire(
+            conn, "article_history", stock_ids, today - timedelta(days=policy["article_max_days"]), deadline, log
+        )
+    if policy["history_raw_days"]:
+        summary["history_compacted"] = compact_history(
+            conn, stock_ids, today - timedelta(days=policy["history_raw_days"]), deadline, log
+        )
+    if policy["article_detail_days"]:
+        summary["articles_trimmed"] = trim_articles(
+            conn, stock_ids, today - timedelta(days=policy["article_detail_days"]), deadline
+        )
+
+    expired = summary.get("history_expired") or {}
+    compacted = summary.get("history_compacted") or {}
+    if expired.get("partitions_dropped") or expired.get("rows_deleted") \
+            or compacted.get("partitions") or compacted.get("days"):
+        bump_history_revision(conn)
+        summary["history_revised"] = True
+
+    # Ran out of time budget somewhere: the next run resumes from the checkpoints
+    summary["complete"] = all(
+        summary[k]["complete"]
+        for k in ("history_expired", "articles_expired", "history_compacted", "articles_trimmed")
+        if k in summary
+    )
+    return summary
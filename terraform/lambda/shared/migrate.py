@@ -0,0 +1,224 @@
+"""
+Versioned schema migrations, shared by the init_rds Lambda and the backfill
+script (packaging copies this file and migrations/ next to each of them).
+
+Migrations are migrations/NNNN_description.sql, applied in version order and
+recorded in schema_migrations. Data migrations that need a loop (chunked
+copies) are migrations/NNNN_description.py defining migrate(conn, log).
+Nothing is ever dropped to get to a version: each file is written to be safe
+to re-run, because MySQL DDL commits implicitly and a migration interrupted
+halfway can't be rolled back. "Already exists" errors from re-running DDL are
+treated as done (see _ALREADY_APPLIED).
+Index changes use online DDL (ALGORITHM=INPLACE, LOCK=NONE) so reads and
+writes keep flowing while they build.
+A run holds the MySQL named lock schema_migrations (GET_LOCK) throughout, so
+init_rds and a backfill starting together apply each migration once: the
+second runner waits, then finds everything recorded and does nothing.
+
+    applied = run_migrations(conn)  # -> [(version, name), ...] newly applied
+"""
+import hashlib
+import importlib.util
+import os
+import re
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+_FILENAME = re.compile(r"^(\d+)_([\w-]+)\.(sql|py)$")
+
+# MySQL errors that mean a statement's effect is already in place:
+# 1050 table exists, 1060 duplicate column, 1061 duplicate key name,
+# 1091 can't drop (already gone), 1826 duplicate foreign key name
+_ALREADY_APPLIED = {1050, 1060, 1061, 1091, 1826}
+
+# Named lock serialising runners; the wait covers a long data migration
+# (0004's chunked copy) running in the other one
+LOCK_NAME = "schema_migrations"
+LOCK_TIMEOUT_SECONDS = int(os.environ.get("MIGRATION_LOCK_TIMEOUT_SECONDS", "600"))
+
+_VERSION_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INT PRIMARY KEY NOT NULL,
+        name VARCHAR(255) NOT NULL,
+        checksum CHAR(64) NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+class MigrationError(RuntimeError):
+    pass
+
+
+def split_statements(sql):
+    """
+    Split a SQL script into statements on ';', ignoring semicolons inside
+    quotes, backticks and comments. Comments are dropped from the output.
+    """
+    statements = []
+    buf = []
+    i, n = 0, len(sql)
+    while i < n:
+        c = sql[i]
+        if c in ("'", '"', "`"):
+            # Quoted run; a doubled quote or backslash escape stays inside it
+            j = i + 1
+            while j < n:
+                if sql[j] == "\\" and c != "`":
+                    j += 2
+                    continue
+                if sql[j] == c:
+                    if j + 1 < n and sql[j + 1] == c:
+                        j += 2
+                        continue
+                    break
+                j += 1
+            buf.append(sql[i:j + 1])
+            i = j + 1
+        elif sql.startswith("--", i) or c == "#":
+            j = sql.find("\n", i)
+            i = n if j == -1 else j
+        elif sql.startswith("/*", i):
+            j = sql.find("*/", i + 2)
+            i = n if j == -1 else j + 2
+            buf.append(" ")
+        elif c == ";":
+            statements.append("".join(buf).strip())
+            buf = []
+            i += 1
+        else:
+            buf.append(c)
+            i += 1
+    statements.append("".join(buf).strip())
+    return [s for s in statements if s]
+
+
+def discover(directory=MIGRATIONS_DIR):
+    """[(version, name, path)] sorted by version; rejects duplicate versions"""
+    found = {}
+    for filename in os.listdir(directory):
+        match = _FILENAME.match(filename)
+        if not match:
+            continue
+        version = int(match.group(1))
+        if version in found:
+            raise MigrationError(f"duplicate migration version {version}: {filename}, {found[version][1]}")
+        found[version] = (version, match.group(2), os.path.join(directory, filename))
+    return [found[v] for v in sorted(found)]
+
+
+def applied_versions(conn):
+    """{version: checksum} already recorded in schema_migrations"""
+    with conn.cursor() as cursor:
+        cursor.execute(_VERSION_TABLE)
+        cursor.execute("SELECT version, checksum FROM schema_migrations")
+        rows = cursor.fetchall()
+    conn.commit()
+    return {
+        (r["version"] if isinstance(r, dict) else r[0]): (r["checksum"] if isinstance(r, dict) else r[1])
+        for r in rows
+    }
+
+
+def _scalar(row):
+    if row is None:
+        return None
+    return next(iter(row.values())) if isinstance(row, dict) else row[0]
+
+
+def acquire_lock(conn, timeout=LOCK_TIMEOUT_SECONDS):
+    """Take the migration lock for this session, waiting up to timeout seconds"""
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (LOCK_NAME, timeout))
+        got = _scalar(cursor.fetchone())
+    if got != 1:
+        raise MigrationError(f"could not take the {LOCK_NAME} lock within {timeout}s; is another migration run stuck?")
+
+
+def release_lock(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+        cursor.fetchone()
+
+
+def _error_code(exc):
+    return exc.args[0] if exc.args and isinstance(exc.args[0], int) else None
+
+
+def _run_python(conn, path, log):
+    spec = importlib.util.spec_from_file_location(f"migration_{os.path.basename(path)[:-3]}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.migrate(conn, log)
+
+
+def _run_sql(conn, sql, label, log):
+    with conn.cursor() as cursor:
+        for statement in split_statements(sql):
+            try:
+                cursor.execute(statement)
+            except Exception as e:
+                if _error_code(e) not in _ALREADY_APPLIED:
+                    conn.rollback()
+                    raise MigrationError(f"migration {label} failed: {e}\n{statement}") from e
+                log(f"  {label}: already applied, skipping: {str(e)}")
+
+
+def apply_migration(conn, version, name, path, log=print):
+    with open(path, "r") as f:
+        source = f.read()
+    checksum = hashlib.sha256(source.encode("utf-8")).hexdigest()
+    label = f"{version:04d}_{name}"
+
+    if path.endswith(".py"):
+        try:
+            _run_python(conn, path, log)
+        except Exception as e:
+            conn.rollback()
+            raise MigrationError(f"migration {label} failed: {e}") from e
+    else:
+        _run_sql(conn, source, label, log)
+
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO schema_migrations (version, name, checksum) VALUES (%s, %s, %s)",
+            (version, name, checksum),
+        )
+    conn.commit()
+    return checksum
+
+
+def run_migrations(conn, directory=MIGRATIONS_DIR, target=None, log=print, lock_timeout=LOCK_TIMEOUT_SECONDS):
+    """
+    Apply every migration in directory newer than what schema_migrations
+    records, up to target (inclusive) if given. Returns [(version, name)]
+    applied this run. Edited files that were already applied are reported,
+    not re-run: write a new migration instead. Holds the migration lock for
+    the whole run; raises MigrationError if it can't be had in lock_timeout.
+    """
+    acquire_lock(conn, lock_timeout)
+    try:
+        # Read under the lock: a runner we waited for may have applied everything
+        applied = applied_versions(conn)
+        newly_applied = []
+        for version, name, path in discover(directory):
+            if target is not None and version > target:
+                break
+            if version in applied:
+                with open(path, "r") as f:
+                    checksum = hashlib.sha256(f.read().encode("utf-8")).hexdigest()
+                if checksum != applied[version]:
+                    log(f"  warning: {version:04d}_{name} changed after it was applied; not re-running it")
+                continue
+            log(f"Applying migration {version:04d}_{name}...")
+            apply_migration(conn, version, name, path, log=log)
+            newly_applied.append((version, name))
+    finally:
+        try:
+            release_lock(conn)
+        except Exception as e:
+            # Closing the connection releases it too; don't mask the real error
+            log(f"  warning: could not release the {LOCK_NAME} lock: {e}")
+    if not newly_applied:
+        log("Schema is up to date.")
+    return newly_applied
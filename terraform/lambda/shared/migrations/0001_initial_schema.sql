@@ -1,22 +1,19 @@
-DROP TABLE IF EXISTS article_history;
-DROP TABLE IF EXISTS stock_history;
-DROP TABLE IF EXISTS watchlist;
-DROP TABLE IF EXISTS users;
-DROP TABLE IF EXISTS stocks;
+-- Baseline: the schema init_tables.sql used to create. IF NOT EXISTS so
+-- databases created before migrations existed adopt it unchanged.
 
-CREATE TABLE users (
-    id VARCHAR(255) PRIMARY KEY NOT NULL,  -- Changed to VARCHAR to store Cognito sub (UUID)
-    email VARCHAR(64) NOT NULL UNIQUE      -- Added UNIQUE constraint
+CREATE TABLE IF NOT EXISTS users (
+    id VARCHAR(255) PRIMARY KEY NOT NULL,  -- Cognito sub (UUID)
+    email VARCHAR(64) NOT NULL UNIQUE
 );
 
-CREATE TABLE stocks (
+CREATE TABLE IF NOT EXISTS stocks (
     id INT AUTO_INCREMENT PRIMARY KEY NOT NULL,
-    ticker VARCHAR(10) NOT NULL UNIQUE
+    ticker VARCHAR(10) NOT NULL UNIQUE     -- unique index also serves ticker lookups
 );
 
-CREATE TABLE watchlist (
+CREATE TABLE IF NOT EXISTS watchlist (
     id INT AUTO_INCREMENT PRIMARY KEY NOT NULL,
-    user_id VARCHAR(255) NOT NULL,  -- Changed to VARCHAR to match users.id
+    user_id VARCHAR(255) NOT NULL,
     stock_id INTEGER NOT NULL,
     FOREIGN KEY (user_id) REFERENCES users(id),
     FOREIGN KEY (stock_id) REFERENCES stocks(id),
@@ -24,7 +21,7 @@ CREATE TABLE watchlist (
 );
 
 -- Article history: individual articles with sentiment and keywords
-CREATE TABLE article_history (
+CREATE TABLE IF NOT EXISTS article_history (
     id INT AUTO_INCREMENT PRIMARY KEY NOT NULL,
     stock_id INT NOT NULL,
     title VARCHAR(500) NOT NULL,
@@ -35,11 +32,11 @@ CREATE TABLE article_history (
 );
 
 -- Stock history: price and average sentiment at a point in time
-CREATE TABLE stock_history (
+CREATE TABLE IF NOT EXISTS stock_history (
     id INT AUTO_INCREMENT PRIMARY KEY NOT NULL,
     stock_id INT NOT NULL,
     price DECIMAL(10, 2),
     avg_sentiment DECIMAL(10, 6),
     recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (stock_id) REFERENCES stocks(id)
-);
\ No newline at end of file
+);
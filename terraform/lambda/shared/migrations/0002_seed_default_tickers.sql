@@ -0,0 +1,10 @@
+-- Default tickers (was seed_data.sql); IGNORE keeps existing rows as they are
+INSERT IGNORE INTO stocks (ticker)
+    VALUES
+        ('AAPL'),
+        ('NFLX'),
+        ('AMZN'),
+        ('NVDA'),
+        ('META'),
+        ('MSFT'),
+        ('AMD');
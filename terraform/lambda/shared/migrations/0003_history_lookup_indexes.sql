@@ -0,0 +1,12 @@
+-- Per-ticker time lookups: latest snapshot, range scans and keyset paging on
+-- stock_history, and per-ticker article windows on article_history. Built
+-- online so the scheduler and API keep writing/reading during the build.
+-- stocks(ticker) is already covered by its UNIQUE index.
+
+ALTER TABLE stock_history
+    ADD INDEX idx_stock_history_stock_recorded (stock_id, recorded_at),
+    ALGORITHM=INPLACE, LOCK=NONE;
+
+ALTER TABLE article_history
+    ADD INDEX idx_article_history_stock_recorded (stock_id, recorded_at),
+    ALGORITHM=INPLACE, LOCK=NONE;
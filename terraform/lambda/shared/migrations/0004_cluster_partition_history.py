@@ -0,0 +1,121 @@
+"""
+Rebuild stock_history and article_history clustered on (stock_id, recorded_at, id),
+with BIGINT ids and monthly RANGE partitions on recorded_at.
+
+With the surrogate id primary key a ticker's rows are scattered across the
+clustered index and every range read does a secondary-index lookup per row;
+keyed on (stock_id, recorded_at) they sit next to each other in time order,
+and a time range only opens the partitions it overlaps.
+
+MySQL doesn't allow foreign keys on partitioned tables, so the stock_id FKs
+go (the application already only writes ids it read from stocks). id stays
+AUTO_INCREMENT with its own index: the data version and ?since= marks use it.
+
+Per table:
+  1. create <table>_new with the new layout (partitions from the oldest row's
+     month to three months ahead, plus pmax),
+  2. copy rows across in id order, CHUNK_ROWS per transaction; resumable,
+     since the copy restarts after MAX(id) already in <table>_new,
+  3. lock both tables, copy what arrived meanwhile, and swap names atomically.
+The original is kept as <table>_unpartitioned for rollback; drop it once
+the new layout has been verified.
+"""
+from datetime import datetime
+
+from partitions import add_months, month_start, partition_clause
+
+CHUNK_ROWS = 20000
+MONTHS_AHEAD = 3
+
+TABLES = {
+    "stock_history": ("""
+        CREATE TABLE IF NOT EXISTS stock_history_new (
+            id BIGINT NOT NULL AUTO_INCREMENT,
+            stock_id INT NOT NULL,
+            price DECIMAL(10, 2),
+            avg_sentiment DECIMAL(10, 6),
+            recorded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (stock_id, recorded_at, id),
+            KEY idx_stock_history_id (id)
+        )
+    """, "id, stock_id, price, avg_sentiment, recorded_at"),
+    "article_history": ("""
+        CREATE TABLE IF NOT EXISTS article_history_new (
+            id BIGINT NOT NULL AUTO_INCREMENT,
+            stock_id INT NOT NULL,
+            title VARCHAR(500) NOT NULL,
+            keywords TEXT,
+            sentiment_score DECIMAL(10, 6),
+            recorded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (stock_id, recorded_at, id),
+            KEY idx_article_history_id (id)
+        )
+    """, "id, stock_id, title, keywords, sentiment_score, recorded_at"),
+}
+
+
+def _scalar(conn, sql, params=None):
+    with conn.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    return next(iter(row.values())) if isinstance(row, dict) else row[0]
+
+
+def _is_partitioned(conn, table):
+    return bool(_scalar(conn, """
+        SELECT COUNT(*) FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+    """, (table,)))
+
+
+def _copy_after(conn, table, columns, log):
+    """Copy rows with id above what <table>_new already has; returns rows copied"""
+    copied = 0
+    while True:
+        last_id = _scalar(conn, f"SELECT COALESCE(MAX(id), 0) FROM {table}_new")
+        with conn.cursor() as cursor:
+            cursor.execute(f"""
+                INSERT INTO {table}_new ({columns})
+                SELECT {columns} FROM {table}
+                WHERE id > %s
+                ORDER BY id
+                LIMIT %s
+            """, (last_id, CHUNK_ROWS))
+            n = cursor.rowcount
+        conn.commit()
+        copied += n
+        if n:
+            log(f"  {table}: copied {copied} rows (through id > {last_id})")
+        if n < CHUNK_ROWS:
+            return copied
+
+
+def _rebuild(conn, table, ddl, columns, log):
+    if _is_partitioned(conn, table):
+        log(f"  {table}: already partitioned")
+        return
+
+    oldest = _scalar(conn, f"SELECT MIN(recorded_at) FROM {table}") or datetime.utcnow()
+    now = datetime.utcnow()
+    with conn.cursor() as cursor:
+        cursor.execute(ddl + partition_clause(month_start(oldest), add_months(month_start(now), MONTHS_AHEAD)))
+    conn.commit()
+
+    _copy_after(conn, table, columns, log)
+
+    # Writers wait only for the last delta and the rename
+    with conn.cursor() as cursor:
+        cursor.execute(f"LOCK TABLES {table} WRITE, {table}_new WRITE")
+        try:
+            _copy_after(conn, table, columns, log)
+            cursor.execute(f"RENAME TABLE {table} TO {table}_unpartitioned, {table}_new TO {table}")
+        finally:
+            cursor.execute("UNLOCK TABLES")
+    log(f"  {table}: swapped in; previous table kept as {table}_unpartitioned")
+
+
+def migrate(conn, log):
+    for table, (ddl, columns) in TABLES.items():
+        _rebuild(conn, table, ddl, columns, log)
@@ -0,0 +1,10 @@
+-- Progress markers for resumable maintenance jobs (the scheduler's daily
+-- retention run records how far compaction/trimming has got per table).
+
+CREATE TABLE IF NOT EXISTS maintenance_checkpoints (
+    job VARCHAR(64) NOT NULL,
+    item VARCHAR(64) NOT NULL,
+    value VARCHAR(255) NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (job, item)
+);
@@ -0,0 +1,10 @@
+-- SES verification status per address, cached by the notification Lambda so
+-- verified users aren't looked up every run and pending verifications aren't
+-- re-sent. verification_sent_at is when we last asked SES to send the link.
+
+CREATE TABLE IF NOT EXISTS ses_identity_status (
+    email VARCHAR(64) PRIMARY KEY NOT NULL,
+    status VARCHAR(32) NOT NULL,
+    checked_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    verification_sent_at TIMESTAMP NULL
+);
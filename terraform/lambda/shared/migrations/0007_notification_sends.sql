@@ -0,0 +1,11 @@
+-- Checkpoint for the watchlist digest dispatch: one row per address a digest
+-- run has delivered to, written as each send completes, so a run that times
+-- out can be re-invoked with the same run_id without double-sending.
+
+CREATE TABLE IF NOT EXISTS notification_sends (
+    run_id VARCHAR(64) NOT NULL,
+    email VARCHAR(64) NOT NULL,
+    message_id VARCHAR(255),
+    sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (run_id, email)
+);
@@ -0,0 +1,31 @@
+-- Per-user threshold alerts (scheduler/alerts.py). alert_rules is read only
+-- for tickers that just got a new snapshot, via idx_alert_rules_stock.
+-- alert_queue holds fired alerts until delivery; dedup_key (rule id + the
+-- stock_history row that tripped it) keeps a retried run from queueing twice.
+
+CREATE TABLE IF NOT EXISTS alert_rules (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY NOT NULL,
+    user_id VARCHAR(255) NOT NULL,
+    stock_id INT NOT NULL,
+    kind VARCHAR(32) NOT NULL,           -- sentiment_above | sentiment_below | price_move_pct | label_change
+    threshold DECIMAL(12, 6),            -- level or percent; unused for label_change
+    cooldown_minutes INT NOT NULL DEFAULT 60,
+    last_fired_at TIMESTAMP NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    KEY idx_alert_rules_stock (stock_id),
+    FOREIGN KEY (user_id) REFERENCES users(id),
+    FOREIGN KEY (stock_id) REFERENCES stocks(id)
+);
+
+CREATE TABLE IF NOT EXISTS alert_queue (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY NOT NULL,
+    rule_id BIGINT NOT NULL,
+    user_id VARCHAR(255) NOT NULL,
+    stock_id INT NOT NULL,
+    message VARCHAR(500) NOT NULL,
+    dedup_key VARCHAR(64) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    delivered_at TIMESTAMP NULL,
+    UNIQUE KEY uq_alert_queue_dedup (dedup_key),
+    KEY idx_alert_queue_pending (delivered_at, id)
+);
@@ -0,0 +1,82 @@
+"""
+Natural keys for the history tables, so the backfill can upsert instead of
+appending duplicates:
+
+  stock_history    UNIQUE (stock_id, recorded_at)
+  article_history  fingerprint column (SHA-1 of the normalized title) and
+                   UNIQUE (stock_id, recorded_at, fingerprint)
+
+Both keys include recorded_at, which partitioned tables require of every
+unique key. Existing duplicates (from backfills run more than once) are
+removed first, a stock at a time, keeping the newest row of each group;
+existing articles get their fingerprint computed in SQL, also per stock.
+Every step is safe to re-run.
+"""
+
+DUPLICATE_COLUMN = 1060
+DUPLICATE_KEY = 1061
+
+
+def _ddl(conn, sql, log):
+    with conn.cursor() as cursor:
+        try:
+            cursor.execute(sql)
+        except Exception as e:
+            if not (e.args and e.args[0] in (DUPLICATE_COLUMN, DUPLICATE_KEY)):
+                raise
+            log(f"  already applied, skipping: {e}")
+
+
+def _stock_ids(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT id FROM stocks ORDER BY id")
+        return [r["id"] if isinstance(r, dict) else r[0] for r in cursor.fetchall()]
+
+
+def _dedupe(conn, table, key, stock_ids, log):
+    """Delete all but the highest-id row of each duplicate key group, per stock"""
+    removed = 0
+    for stock_id in stock_ids:
+        with conn.cursor() as cursor:
+            cursor.execute(f"""
+                DELETE t FROM {table} t
+                JOIN (
+                    SELECT {key}, MAX(id) AS keep_id
+                    FROM {table}
+                    WHERE stock_id = %s
+                    GROUP BY {key}
+                    HAVING COUNT(*) > 1
+                ) d ON {" AND ".join(f"t.{c} = d.{c}" for c in key.split(", "))}
+                WHERE t.stock_id = %s AND t.id < d.keep_id
+            """, (stock_id, stock_id))
+            removed += cursor.rowcount
+        conn.commit()
+    log(f"  {table}: removed {removed} duplicate row(s)")
+
+
+def migrate(conn, log):
+    stock_ids = _stock_ids(conn)
+
+    _dedupe(conn, "stock_history", "stock_id, recorded_at", stock_ids, log)
+    _ddl(conn, """
+        ALTER TABLE stock_history
+            ADD UNIQUE KEY uq_stock_history_stock_recorded (stock_id, recorded_at),
+            ALGORITHM=INPLACE, LOCK=NONE
+    """, log)
+
+    _ddl(conn, "ALTER TABLE article_history ADD COLUMN fingerprint CHAR(40) NULL", log)
+    for stock_id in stock_ids:
+        with conn.cursor() as cursor:
+            # Same normalization as the backfill's article_fingerprint() for
+            # titles with single spaces; others just won't match, not collide
+            cursor.execute("""
+                UPDATE article_history SET fingerprint = SHA1(LOWER(TRIM(title)))
+                WHERE stock_id = %s AND fingerprint IS NULL
+            """, (stock_id,))
+        conn.commit()
+    _dedupe(conn, "article_history", "stock_id, recorded_at, fingerprint", stock_ids, log)
+    _ddl(conn, """
+        ALTER TABLE article_history
+            ADD UNIQUE KEY uq_article_history_fingerprint (stock_id, recorded_at, fingerprint),
+            ALGORITHM=INPLACE, LOCK=NONE
+    """, log)
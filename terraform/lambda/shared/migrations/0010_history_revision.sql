@@ -0,0 +1,13 @@
+-- Revision counter for in-place changes to stock_history. The API's data
+-- version is built from MAX(id)s, which only move on inserts; retention
+-- compaction/expiry and the backfill's upserts rewrite or delete existing
+-- rows and bump this instead, so ETags, cached responses and the warm
+-- per-ticker series notice.
+
+CREATE TABLE IF NOT EXISTS history_revision (
+    id TINYINT NOT NULL PRIMARY KEY,
+    revision BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+INSERT IGNORE INTO history_revision (id, revision) VALUES (1, 0);
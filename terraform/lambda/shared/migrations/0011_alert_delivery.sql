@@ -0,0 +1,7 @@
+-- Delivery bookkeeping for alert_queue (scheduler/alerts.py deliver_alerts):
+-- a failed send is counted and its error kept, and rows that have failed
+-- ALERTS_MAX_ATTEMPTS times are no longer picked up.
+
+ALTER TABLE alert_queue ADD COLUMN attempts INT NOT NULL DEFAULT 0;
+
+ALTER TABLE alert_queue ADD COLUMN last_error VARCHAR(500) NULL;
@@ -0,0 +1,95 @@
+"""
+Monthly RANGE partitions on recorded_at for the history tables.
+
+Partitions are named for the month they hold (p202401 holds January 2024,
+bounded by UNIX_TIMESTAMP('2024-02-01 00:00:00')) with a trailing pmax
+catch-all. ensure_future_partitions splits pmax ahead of time so new rows
+never land in it; old months can then be dropped whole.
+"""
+from datetime import datetime
+
+MAX_PARTITION = "pmax"
+
+
+def month_start(dt):
+    return datetime(dt.year, dt.month, 1)
+
+
+def add_months(month, n):
+    index = month.year * 12 + month.month - 1 + n
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"p{month:%Y%m}"
+
+
+def _less_than(month):
+    return f"UNIX_TIMESTAMP('{add_months(month, 1):%Y-%m-%d %H:%M:%S}')"
+
+
+def _definitions(first_month, last_month):
+    parts = []
+    month = first_month
+    while month <= last_month:
+        parts.append(f"PARTITION {partition_name(month)} VALUES LESS THAN ({_less_than(month)})")
+        month = add_months(month, 1)
+    return parts
+
+
+def partition_clause(first_month, last_month):
+    """PARTITION BY clause with one partition per month in [first_month, last_month] plus pmax"""
+    parts = _definitions(month_start(first_month), month_start(last_month))
+    parts.append(f"PARTITION {MAX_PARTITION} VALUES LESS THAN MAXVALUE")
+    return "PARTITION BY RANGE (UNIX_TIMESTAMP(recorded_at)) (\n    " + ",\n    ".join(parts) + "\n)"
+
+
+def list_partitions(conn, table):
+    """[(name, month or None for pmax, approximate rows)] in order; [] if table isn't partitioned"""
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT PARTITION_NAME AS name, TABLE_ROWS AS row_estimate
+            FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+            ORDER BY PARTITION_ORDINAL_POSITION
+        """, (table,))
+        rows = cursor.fetchall()
+    out = []
+    for r in rows:
+        name, row_estimate = (r["name"], r["row_estimate"]) if isinstance(r, dict) else r
+        month = datetime.strptime(name[1:], "%Y%m") if name != MAX_PARTITION else None
+        out.append((name, month, row_estimate or 0))
+    return out
+
+
+def ensure_future_partitions(conn, table, months_ahead=3, now=None):
+    """
+    Make sure months up to now + months_ahead have their own partition by
+    splitting pmax. pmax should be empty, so REORGANIZE only rewrites the
+    (empty) partition, which is quick and doesn't block the rest of the table.
+    Returns the partition names added.
+    """
+    partitions = list_partitions(conn, table)
+    months = [m for _, m, _ in partitions if m is not None]
+    if not months:
+        return []
+    target = add_months(month_start(now or datetime.utcnow()), months_ahead)
+    first_new = add_months(max(months), 1)
+    if first_new > target:
+        return []
+
+    parts = _definitions(first_new, target)
+    parts.append(f"PARTITION {MAX_PARTITION} VALUES LESS THAN MAXVALUE")
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f"ALTER TABLE {table} REORGANIZE PARTITION {MAX_PARTITION} INTO (" + ", ".join(parts) + ")"
+        )
+    return [p.split()[1] for p in parts[:-1]]
+
+
+def drop_partitions(conn, table, names):
+    """Drop whole monthly partitions; much cheaper than deleting their rows"""
+    if not names:
+        return
+    with conn.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {table} DROP PARTITION {', '.join(names)}")
@@ -0,0 +1,274 @@
+"""
+Query profiler for pymysql connections, shared by the Lambdas.
+
+Packaging copies this file next to each handler.py. Wrap a connection and
+every statement is fingerprinted (literals, placeholders and IN lists
+stripped) and aggregated by fingerprint: count, time, rows. A fingerprint
+that runs more than n_plus_one times in one request/run is flagged as a
+likely N+1 loop. Statements slower than explain_ms get an EXPLAIN, and plans
+doing full scans, filesorts or temp tables are called out.
+
+    profiler = QueryProfiler.from_env()
+    conn = profiler.wrap(get_db_connection())
+    ...
+    print(profiler.format_report())
+"""
+import os
+import re
+import time
+
+_COMMENT = re.compile(r"/\*.*?\*/|--[^\n]*|#[^\n]*", re.S)
+_STRING = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])")
+_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_ROWS = re.compile(r"\(\?\+\)(?:\s*,\s*\(\?\+\))+")
+_SPACE = re.compile(r"\s+")
+
+
+def fingerprint(sql):
+    """Normalized statement text: same query shape, same fingerprint"""
+    sql = _COMMENT.sub(" ", sql)
+    sql = _STRING.sub("?", sql)
+    sql = _PLACEHOLDER.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _SPACE.sub(" ", sql).strip().rstrip(";").strip()
+    sql = _LIST.sub("(?+)", sql)
+    return _ROWS.sub("(?+)", sql)
+
+
+def _plan_warnings(plan):
+    """Plan rows (EXPLAIN output as dicts) -> what is worth a look"""
+    warnings = []
+    for row in plan:
+        table = row.get("table")
+        extra = row.get("Extra") or ""
+        if row.get("type") == "ALL":
+            warnings.append(f"full table scan on {table} (~{row.get('rows')} rows)")
+        if "Using filesort" in extra:
+            warnings.append(f"filesort on {table}")
+        if "Using temporary" in extra:
+            warnings.append(f"temporary table for {table}")
+    return warnings
+
+
+class QueryProfiler:
+    def __init__(self, n_plus_one=5, explain_ms=100.0, explain=True):
+        self.n_plus_one = n_plus_one
+        self.explain_ms = explain_ms
+        self.explain = explain
+        self.stats = {}
+        self.explains = {}
+
+    @classmethod
+    def from_env(cls):
+        """QUERY_PROFILE_N_PLUS_ONE, QUERY_PROFILE_EXPLAIN_MS, QUERY_PROFILE_EXPLAIN (true/false)"""
+        return cls(
+            n_plus_one=int(os.environ.get("QUERY_PROFILE_N_PLUS_ONE", "5")),
+            explain_ms=float(os.environ.get("QUERY_PROFILE_EXPLAIN_MS", "100")),
+            explain=os.environ.get("QUERY_PROFILE_EXPLAIN", "true").lower() not in ("0", "false", "no"),
+        )
+
+    def wrap(self, conn):
+        return ProfiledConnection(conn, self)
+
+    def reset(self):
+        self.stats.clear()
+        self.explains.clear()
+
+    def _stat(self, fp, sql):
+        stat = self.stats.get(fp)
+        if stat is None:
+            stat = self.stats[fp] = {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": 0, "sql": sql}
+        return stat
+
+    def record(self, fp, sql, elapsed_ms):
+        stat = self._stat(fp, sql)
+        stat["count"] += 1
+        stat["total_ms"] += elapsed_ms
+        stat["max_ms"] = max(stat["max_ms"], elapsed_ms)
+
+    def record_fetch(self, fp, elapsed_ms, rows):
+        stat = self.stats.get(fp)
+        if stat is not None:
+            stat["total_ms"] += elapsed_ms
+            stat["rows"] += rows
+
+    def wants_explain(self, fp, sql, elapsed_ms):
+        return (
+            self.explain
+            and elapsed_ms >= self.explain_ms
+            and fp not in self.explains
+            and sql.lstrip().upper().startswith(("SELECT", "WITH"))
+        )
+
+    def capture_explain(self, conn, fp, sql, params, elapsed_ms):
+        """EXPLAIN the statement on conn; conn must not have an unread result pending"""
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("EXPLAIN " + sql, params)
+                rows = cursor.fetchall()
+                if rows and not isinstance(rows[0], dict):
+                    names = [d[0] for d in cursor.description]
+                    rows = [dict(zip(names, r)) for r in rows]
+        except Exception as e:
+            self.explains[fp] = {"ms": round(elapsed_ms, 2), "error": str(e), "plan": [], "warnings": []}
+            return
+        self.explains[fp] = {
+            "ms": round(elapsed_ms, 2),
+            "plan": rows,
+            "warnings": _plan_warnings(rows),
+        }
+
+    def flagged(self):
+        """Fingerprints that ran more than n_plus_one times, most frequent first"""
+        return sorted(
+            (fp for fp, s in self.stats.items() if s["count"] > self.n_plus_one),
+            key=lambda fp: -self.stats[fp]["count"],
+        )
+
+    def report(self, top=10):
+        ordered = sorted(self.stats.items(), key=lambda kv: -kv[1]["total_ms"])
+        return {
+            "queries": sum(s["count"] for s in self.stats.values()),
+            "fingerprints": len(self.stats),
+            "db_ms": round(sum(s["total_ms"] for s in self.stats.values()), 2),
+            "top": [
+                {
+                    "fingerprint": fp,
+                    "count": s["count"],
+                    "total_ms": round(s["total_ms"], 2),
+                    "avg_ms": round(s["total_ms"] / s["count"], 2) if s["count"] else 0.0,
+                    "max_ms": round(s["max_ms"], 2),
+                    "rows": s["rows"],
+                }
+                for fp, s in ordered[:top]
+            ],
+            "n_plus_one": [{"fingerprint": fp, "count": self.stats[fp]["count"]} for fp in self.flagged()],
+            "explains": [
+                {"fingerprint": fp, "ms": e["ms"], "warnings": e["warnings"], "error": e.get("error")}
+                for fp, e in self.explains.items()
+            ],
+        }
+
+    def format_report(self, top=10, width=100):
+        """Plain-text report for logs and local runs"""
+        r = self.report(top)
+        lines = [f"query profile: {r['queries']} queries, {r['fingerprints']} fingerprints, {r['db_ms']} ms"]
+        lines.append(f"{'count':>6} {'total ms':>9} {'avg ms':>8} {'max ms':>8} {'rows':>7}  fingerprint")
+        for q in r["top"]:
+            lines.append(
+                f"{q['count']:>6} {q['total_ms']:>9.2f} {q['avg_ms']:>8.2f} {q['max_ms']:>8.2f} "
+                f"{q['rows']:>7}  {q['fingerprint'][:width]}"
+            )
+        for q in r["n_plus_one"]:
+            lines.append(f"N+1? {q['count']}x  {q['fingerprint'][:width]}")
+        for e in r["explains"]:
+            detail = e["error"] or "; ".join(e["warnings"]) or "plan ok"
+            lines.append(f"EXPLAIN ({e['ms']} ms): {detail}  {e['fingerprint'][:width]}")
+        return "\n".join(lines)
+
+
+class ProfiledConnection:
+    """Connection proxy whose cursors report into a QueryProfiler"""
+
+    def __init__(self, conn, profiler):
+        self._conn = conn
+        self._profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args):
+        return ProfiledCursor(self._conn.cursor(*args), self._conn, self._profiler)
+
+
+class ProfiledCursor:
+    def __init__(self, cursor, conn, profiler):
+        self._cursor = cursor
+        self._conn = conn
+        self._profiler = profiler
+        self._fp = None
+        self._pending_explain = None
+
+    def __enter__(self):
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            return self._cursor.__exit__(*exc)
+        finally:
+            self._explain_pending()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def _explain_pending(self):
+        # Deferred until the cursor is done: an unbuffered cursor still owns
+        # the connection while its rows are being read
+        if self._pending_explain is not None:
+            pending, self._pending_explain = self._pending_explain, None
+            self._profiler.capture_explain(self._conn, *pending)
+
+    def close(self):
+        try:
+            return self._cursor.close()
+        finally:
+            self._explain_pending()
+
+    def execute(self, sql, params=None):
+        self._explain_pending()
+        fp = self._fp = fingerprint(sql)
+        t0 = time.perf_counter()
+        try:
+            return self._cursor.execute(sql, params)
+        finally:
+            elapsed_ms = (time.perf_counter() - t0) * 1000
+            self._profiler.record(fp, sql, elapsed_ms)
+            if self._profiler.wants_explain(fp, sql, elapsed_ms):
+                self._pending_explain = (fp, sql, params, elapsed_ms)
+
+    def executemany(self, sql, args):
+        fp = self._fp = fingerprint(sql)
+        t0 = time.perf_counter()
+        try:
+            return self._cursor.executemany(sql, args)
+        finally:
+            self._profiler.record(fp, sql, (time.perf_counter() - t0) * 1000)
+
+    def _fetched(self, t0, rows):
+        self._profiler.record_fetch(self._fp, (time.perf_counter() - t0) * 1000, rows)
+
+    def fetchone(self):
+        t0 = time.perf_counter()
+        row = self._cursor.fetchone()
+        self._fetched(t0, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, *args):
+        t0 = time.perf_counter()
+        rows = self._cursor.fetchmany(*args)
+        self._fetched(t0, len(rows))
+        return rows
+
+    def fetchall(self):
+        t0 = time.perf_counter()
+        rows = self._cursor.fetchall()
+        self._fetched(t0, len(rows))
+        return rows
+
+    def __iter__(self):
+        # Unbuffered cursors fetch while iterating; charge only the fetches,
+        # not the caller's work between rows, to the statement
+        it = iter(self._cursor)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                row = next(it)
+            except StopIteration:
+                return
+            finally:
+                self._fetched(t0, 0)
+            self._profiler.stats[self._fp]["rows"] += 1
+            yield row
@@ -0,0 +1,216 @@
+"""
+Concurrent, rate-governed SES dispatch for the watchlist digests.
+
+Sends go through a small thread pool; every request first takes tokens from
+a shared TokenBucket sized to the account's SES send rate (one token per
+recipient, so a 50-destination bulk send costs 50), which keeps the pool
+from tripping SES throttling in the first place. Throttled requests, and
+individual bulk destinations SES reports as transient failures, are retried
+with exponential backoff; permanent rejections are reported, not retried.
+
+Results are handed back on the calling thread (on_result), so the caller
+can checkpoint them on its DB connection as they complete. Given a deadline,
+nothing waits past it: a send whose tokens (or retry backoff) wouldn't come
+due in time is given up and its recipients reported with error NOT_SENT, to
+be picked up by the next run rather than counted as failures.
+"""
+import json
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+
+# SendBulkTemplatedEmail takes at most 50 destinations per call
+BULK_MAX_DESTINATIONS = 50
+
+THROTTLE_CODES = {"Throttling", "ThrottlingException", "TooManyRequestsException"}
+# Per-destination statuses in a bulk response that are worth another try
+# ("Failed" and the rejection statuses are permanent)
+RETRYABLE_STATUSES = {"AccountThrottled", "TransientFailure"}
+# Error for recipients given up on at the deadline: not attempted, not failed
+NOT_SENT = "not sent: out of time"
+
+
+def error_code(exc):
+    """AWS error code from a botocore ClientError (or anything with .code)"""
+    response = getattr(exc, "response", None) or {}
+    return response.get("Error", {}).get("Code") or getattr(exc, "code", None)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. acquire(n) reserves n tokens and sleeps until
+    they've accrued, so callers queue up in arrival order and n may exceed
+    the bucket's capacity (a bulk send larger than one second's quota).
+    With a deadline (on the bucket's clock), tokens that wouldn't accrue
+    before it aren't reserved at all and acquire returns None at once.
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, self.rate))
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, n=1, deadline=None):
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            delay = (n - self.tokens) / self.rate if self.tokens < n else 0.0
+            if deadline is not None and now + delay > deadline:
+                return None
+            self.tokens -= n
+        if delay:
+            self.sleep(delay)
+        return delay
+
+
+class Dispatcher:
+    def __init__(self, ses, bucket, workers=8, max_attempts=5, base_delay=0.5, sleep=time.sleep):
+        self.ses = ses
+        self.bucket = bucket
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.sleep = sleep
+        # Set by run(); a bucket.clock() time no send may wait past
+        self.deadline = None
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "throttled": 0, "retried_recipients": 0, "out_of_time": 0}
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.stats[key] += n
+
+    def _backoff(self, attempt):
+        """Sleep before a retry; False, without sleeping, if that would run past the deadline"""
+        # Full jitter, so retrying workers don't land on SES in lockstep
+        delay = random.uniform(0, self.base_delay * (2 ** attempt))
+        if self.deadline is not None and self.bucket.clock() + delay > self.deadline:
+            return False
+        self.sleep(delay)
+        return True
+
+    def _acquire(self, n):
+        if self.bucket.acquire(n, deadline=self.deadline) is None:
+            self._count("out_of_time", n)
+            return False
+        return True
+
+    def send_one(self, email, subject, text, html=None):
+        """[(email, message_id or None, error or None)] for one send_email"""
+        body = {"Text": {"Data": text}}
+        if html is not None:
+            body["Html"] = {"Data": html}
+        for attempt in range(self.max_attempts):
+            if not self._acquire(1):
+                return [(email, None, NOT_SENT)]
+            self._count("requests")
+            try:
+                response = self.ses.send_email(
+                    Source=email,
+                    Destination={"ToAddresses": [email]},
+                    Message={
+                        "Subject": {"Data": subject},
+                        "Body": body
+                    }
+                )
+                return [(email, response.get("MessageId"), None)]
+            except Exception as e:
+                if error_code(e) not in THROTTLE_CODES:
+                    return [(email, None, str(e))]
+                self._count("throttled")
+                if attempt + 1 < self.max_attempts and not self._backoff(attempt):
+                    return [(email, None, NOT_SENT)]
+        return [(email, None, "throttled: retries exhausted")]
+
+    def send_bulk(self, source, template, recipients, default_data=None):
+        """
+        One SendBulkTemplatedEmail for up to BULK_MAX_DESTINATIONS
+        (email, template_data) pairs; only the destinations that failed
+        transiently are retried. Returns [(email, message_id, error)].
+        """
+        results = []
+        pending = list(recipients)
+        for attempt in range(self.max_attempts):
+            if not self._acquire(len(pending)):
+                return results + [(email, None, NOT_SENT) for email, _ in pending]
+            self._count("requests")
+            try:
+                response = self.ses.send_bulk_templated_email(
+                    Source=source,
+                    Template=template,
+                    DefaultTemplateData=json.dumps(default_data or {}),
+                    Destinations=[
+                        {"Destination": {"ToAddresses": [email]}, "ReplacementTemplateData": json.dumps(data)}
+                        for email, data in pending
+                    ],
+                )
+            except Exception as e:
+                if error_code(e) not in THROTTLE_CODES:
+                    return results + [(email, None, str(e)) for email, _ in pending]
+                self._count("throttled")
+            else:
+                retry = []
+                statuses = response.get("Status", [])
+                for i, (email, data) in enumerate(pending):
+                    # Status is positional; a destination SES didn't report on
+                    # is neither delivered nor rejected, so send it again
+                    status = statuses[i] if i < len(statuses) else {"Status": "TransientFailure"}
+                    if status.get("Status") == "Success":
+                        results.append((email, status.get("MessageId"), None))
+                    elif status.get("Status") in RETRYABLE_STATUSES:
+                        retry.append((email, data))
+                    else:
+                        results.append((email, None, status.get("Error") or status.get("Status")))
+                if not retry:
+                    return results
+                self._count("retried_recipients", len(retry))
+                pending = retry
+            if attempt + 1 < self.max_attempts and not self._backoff(attempt):
+                return results + [(email, None, NOT_SENT) for email, _ in pending]
+        return results + [(email, None, "retries exhausted") for email, _ in pending]
+
+    def run(self, jobs, on_result, deadline=None):
+        """
+        Run jobs, (recipient_count, callable) pairs whose zero-argument
+        callable returns a result list, on the pool, at most 2 x workers in
+        flight. on_result(results) is called on this thread as each job
+        finishes. With a deadline (time.monotonic()), sends give up rather
+        than wait past it, and no job starts unless the recipients already in
+        flight plus its own fit in what the send rate allows before it.
+        Returns the number of recipients whose jobs never started; the
+        callables of those are not called, so nothing is rendered for them.
+        """
+        self.deadline = deadline
+        jobs = iter(jobs)
+        in_flight = {}
+        not_started = 0
+
+        def collect(done):
+            for future in done:
+                in_flight.pop(future)
+                on_result(future.result())
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for count, job in jobs:
+                if deadline is not None:
+                    # Tokens the rest of the run can still get (plus the bucket's burst)
+                    while in_flight and sum(in_flight.values()) + count > self._budget(deadline):
+                        collect(wait(in_flight, return_when=FIRST_COMPLETED).done)
+                    if count > self._budget(deadline):
+                        not_started = count + sum(n for n, _ in jobs)
+                        break
+                in_flight[pool.submit(job)] = count
+                if len(in_flight) >= self.workers * 2:
+                    collect(wait(in_flight, return_when=FIRST_COMPLETED).done)
+            # Checkpoint each straggler as it lands, not once they all have
+            collect(as_completed(list(in_flight)))
+        return not_started
+
+    def _budget(self, deadline):
+        return max(0.0, deadline - self.bucket.clock()) * self.bucket.rate + self.bucket.capacity
@@ -1,10 +1,44 @@
+import base64
 import json
 import boto3
+import html
 import os
 import pymysql
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from dispatch import BULK_MAX_DESTINATIONS, NOT_SENT, Dispatcher, TokenBucket
+try:
+    # lambda/shared/query_profiler.py, copied in at packaging time
+    from query_profiler import QueryProfiler
+except ImportError:
+    QueryProfiler = None
 
 ses = boto3.client("ses")
 
+# Log a query report (fingerprints, N+1 loops, EXPLAIN of slow statements) per run
+QUERY_PROFILE = os.environ.get("QUERY_PROFILE", "true").lower() not in ("0", "false", "no")
+
+# GetIdentityVerificationAttributes takes at most 100 identities per call
+SES_LOOKUP_BATCH = 100
+# Verified addresses are trusted from ses_identity_status for this long;
+# anything not yet verified is looked up again (in bulk) every run
+SES_VERIFIED_TTL = timedelta(hours=int(os.environ.get("SES_VERIFIED_TTL_HOURS", "168")))
+# SES verification links expire after 24 hours; don't re-send one sooner
+SES_RESEND_AFTER = timedelta(hours=int(os.environ.get("SES_VERIFY_RESEND_HOURS", "24")))
+
+# Templated bulk sends need one verified sender for the whole batch; without
+# SES_SENDER each digest goes out as its own send_email from the recipient
+SES_SENDER = os.environ.get("SES_SENDER", "")
+SES_TEMPLATE_NAME = os.environ.get("SES_TEMPLATE_NAME", "")
+# Messages per second; unset means ask SES (GetSendQuota) for the account's rate
+SES_MAX_SEND_RATE = float(os.environ.get("SES_MAX_SEND_RATE", "0"))
+SES_SEND_WORKERS = int(os.environ.get("SES_SEND_WORKERS", "8"))
+# Stop starting sends this long before the Lambda times out
+SEND_STOP_MARGIN_SECONDS = float(os.environ.get("SEND_STOP_MARGIN_SECONDS", "5"))
+EMAIL_SUBJECT = "Your Stock Watchlist Update"
+
 def get_connection():
     """Establish a connection to the RDS MySQL instance."""
     return pymysql.connect(
@@ -18,88 +52,278 @@ def get_connection():
         cursorclass=pymysql.cursors.DictCursor
     )
 
-def is_email_verified(email):
-    """Check if an email is verified in SES."""
-    try:
-        response = ses.get_identity_verification_attributes(
-            Identities=[email]
+def fetch_verification_status(emails):
+    """
+    SES verification status for each address, SES_LOOKUP_BATCH per call:
+    {email: "Success" | "Pending" | "Failed" | "TemporaryFailure" | "NotStarted" | "NotFound"}.
+    Addresses in a chunk whose lookup failed are left out.
+    """
+    statuses = {}
+    for start in range(0, len(emails), SES_LOOKUP_BATCH):
+        chunk = emails[start:start + SES_LOOKUP_BATCH]
+        try:
+            response = ses.get_identity_verification_attributes(Identities=chunk)
+        except Exception as e:
+            print(f"Error checking verification for {len(chunk)} addresses: {str(e)}")
+            continue
+        attrs = response.get("VerificationAttributes", {})
+        for email in chunk:
+            statuses[email] = attrs.get(email, {}).get("VerificationStatus", "NotFound")
+    return statuses
+
+def load_identity_status(conn):
+    """Cached rows from ses_identity_status, keyed by email"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT email, status, checked_at, verification_sent_at FROM ses_identity_status")
+        return {row["email"]: row for row in cur.fetchall()}
+
+def resolve_verification_status(conn, emails, now=None):
+    """
+    {email: status} for every address. Cached "Success" rows younger than
+    SES_VERIFIED_TTL are used as-is; the rest are looked up in bulk and the
+    results written back. Also returns the cache rows for the caller.
+    """
+    now = now or datetime.utcnow()
+    cache = load_identity_status(conn)
+    statuses = {}
+    stale = []
+    for email in emails:
+        row = cache.get(email)
+        if row and row["status"] == "Success" and row["checked_at"] > now - SES_VERIFIED_TTL:
+            statuses[email] = "Success"
+        else:
+            stale.append(email)
+
+    fetched = fetch_verification_status(stale)
+    if fetched:
+        with conn.cursor() as cur:
+            cur.executemany("""
+                INSERT INTO ses_identity_status (email, status, checked_at) VALUES (%s, %s, %s)
+                ON DUPLICATE KEY UPDATE status = VALUES(status), checked_at = VALUES(checked_at)
+            """, [(email, status, now) for email, status in fetched.items()])
+        conn.commit()
+    statuses.update(fetched)
+    return statuses, cache
+
+def request_verifications(conn, statuses, cache, now=None):
+    """
+    Send SES verification emails to addresses that have none outstanding:
+    never requested, or the last request failed/expired more than
+    SES_RESEND_AFTER ago. "Pending" addresses already have a live link.
+    Returns the addresses a verification email went to.
+    """
+    now = now or datetime.utcnow()
+    requested = []
+    for email, status in statuses.items():
+        if status in ("Success", "Pending"):
+            continue
+        sent_at = (cache.get(email) or {}).get("verification_sent_at")
+        if sent_at and sent_at > now - SES_RESEND_AFTER:
+            continue
+        try:
+            ses.verify_email_identity(EmailAddress=email)
+        except Exception as e:
+            print(f"Error requesting verification for {email}: {str(e)}")
+            continue
+        requested.append(email)
+
+    if requested:
+        with conn.cursor() as cur:
+            cur.executemany("""
+                INSERT INTO ses_identity_status (email, status, checked_at, verification_sent_at)
+                VALUES (%s, 'Pending', %s, %s)
+                ON DUPLICATE KEY UPDATE status = 'Pending', verification_sent_at = VALUES(verification_sent_at)
+            """, [(email, now, now) for email in requested])
+        conn.commit()
+    return requested
+
+def get_users_with_watchlists(cur):
+    """
+    Every user with their watchlist stocks, in one query:
+    [(email, [{"stock_id", "ticker"}, ...])] ordered by email, tickers sorted.
+    """
+    cur.execute("""
+        SELECT u.email, s.id AS stock_id, s.ticker
+        FROM users u
+        LEFT JOIN watchlist w ON w.user_id = u.id
+        LEFT JOIN stocks s ON s.id = w.stock_id
+        ORDER BY u.email, s.ticker
+    """)
+    users = {}
+    for row in cur.fetchall():
+        stocks = users.setdefault(row["email"], [])
+        if row["stock_id"] is not None:
+            stocks.append({"stock_id": row["stock_id"], "ticker": row["ticker"]})
+    return list(users.items())
+
+def get_latest_snapshots(cur):
+    """
+    Newest stock_history row for every watched stock, keyed by stock_id.
+    One probe of the (stock_id, recorded_at) key per stock, so the cost
+    follows the number of watched tickers, not the size of the history.
+    """
+    cur.execute("""
+        SELECT sh.stock_id, sh.price, sh.avg_sentiment, sh.recorded_at AS last_updated
+        FROM (SELECT DISTINCT stock_id FROM watchlist) w
+        JOIN stock_history sh ON sh.id = (
+            SELECT sh2.id
+            FROM stock_history sh2
+            WHERE sh2.stock_id = w.stock_id
+            ORDER BY sh2.recorded_at DESC, sh2.id DESC
+            LIMIT 1
         )
-        
-        verification_attrs = response.get('VerificationAttributes', {})
-        
-        if email in verification_attrs:
-            status = verification_attrs[email]['VerificationStatus']
-            return status == 'Success'
-        
-        return False
-    except Exception as e:
-        print(f"Error checking verification for {email}: {str(e)}")
-        return False
-
-def get_user_watchlist_data(cur):
-    """Get stocks from user's watchlist with latest price and sentiment."""
-    query = """
-        SELECT 
-            s.ticker,
-            sh.price,
-            sh.avg_sentiment,
-            sh.recorded_at as last_updated
-        FROM watchlist w
-        JOIN stocks s ON w.stock_id = s.id
-        LEFT JOIN (
-            SELECT stock_id, price, avg_sentiment, recorded_at
-            FROM stock_history sh1
-            WHERE recorded_at = (
-                SELECT MAX(recorded_at)
-                FROM stock_history sh2
-                WHERE sh2.stock_id = sh1.stock_id
-            )
-        ) sh ON s.id = sh.stock_id
-        ORDER BY s.ticker
+    """)
+    return {row["stock_id"]: row for row in cur.fetchall()}
+
+def _price_text(price):
+    return f"${price:.2f}" if price is not None else "N/A"
+
+def _sentiment_text(sentiment):
+    if sentiment is None:
+        return "N/A"
+    sentiment_label = "Positive" if sentiment > 0.1 else "Negative" if sentiment < -0.1 else "Neutral"
+    return f"{sentiment_label} ({sentiment:.3f})"
+
+DIGEST_TEXT_HEADER = "Hello,\n\nHere are your watchlist stocks and their latest updates:\n\n"
+DIGEST_TEXT_FOOTER = "Stay informed and happy investing!\n\nBest regards,\nStock News Analyzer"
+DIGEST_TEXT_EMPTY = (
+    "Hello,\n\n"
+    "You don't have any stocks in your watchlist yet.\n"
+    "Add some stocks to start receiving personalized updates!\n\n"
+    "Best regards,\n"
+    "Stock News Analyzer"
+)
+DIGEST_HTML_HEADER = (
+    "<p>Hello,</p>\n<p>Here are your watchlist stocks and their latest updates:</p>\n"
+    "<table>\n<tr><th>Ticker</th><th>Price</th><th>Sentiment</th></tr>\n"
+)
+DIGEST_HTML_FOOTER = "</table>\n<p>Stay informed and happy investing!</p>\n<p>Best regards,<br>Stock News Analyzer</p>"
+DIGEST_HTML_EMPTY = (
+    "<p>Hello,</p>\n"
+    "<p>You don't have any stocks in your watchlist yet.<br>"
+    "Add some stocks to start receiving personalized updates!</p>\n"
+    "<p>Best regards,<br>Stock News Analyzer</p>"
+)
+
+class DigestRenderer:
     """
-    
-    cur.execute(query)
-    return cur.fetchall()
+    Renders each ticker's digest block (text, HTML and template data) once
+    per run; every user's email is then a join of the shared blocks, since a
+    ticker's price and sentiment line is the same in everyone's digest.
+    """
+
+    def __init__(self, snapshots):
+        self.snapshots = snapshots
+        self._fragments = {}
 
-def format_watchlist_email(email, watchlist_data):
-    """Format watchlist data into email text."""
-    if not watchlist_data:
+    def fragment(self, stock):
+        fragment = self._fragments.get(stock["stock_id"])
+        if fragment is None:
+            snapshot = self.snapshots.get(stock["stock_id"]) or {}
+            ticker = stock["ticker"]
+            price = _price_text(snapshot.get("price"))
+            sentiment = _sentiment_text(snapshot.get("avg_sentiment"))
+            fragment = self._fragments[stock["stock_id"]] = {
+                "text": f"📊 {ticker}\n   Price: {price}\n   Sentiment: {sentiment}\n\n",
+                "html": (
+                    f"<tr><td>{html.escape(ticker)}</td><td>{html.escape(price)}</td>"
+                    f"<td>{html.escape(sentiment)}</td></tr>\n"
+                ),
+                "template": {"ticker": ticker, "price": price, "sentiment": sentiment},
+            }
+        return fragment
+
+    def render(self, stocks):
+        """(text, html) bodies for a user's [{"stock_id", "ticker"}]"""
+        if not stocks:
+            return DIGEST_TEXT_EMPTY, DIGEST_HTML_EMPTY
+        fragments = [self.fragment(stock) for stock in stocks]
         return (
-            f"Hello,\n\n"
-            "You don't have any stocks in your watchlist yet.\n"
-            "Add some stocks to start receiving personalized updates!\n\n"
-            "Best regards,\n"
-            "Stock News Analyzer"
+            DIGEST_TEXT_HEADER + "".join(f["text"] for f in fragments) + DIGEST_TEXT_FOOTER,
+            DIGEST_HTML_HEADER + "".join(f["html"] for f in fragments) + DIGEST_HTML_FOOTER,
         )
-    
-    message = f"Hello,\n\n"
-    message += "Here are your watchlist stocks and their latest updates:\n\n"
-    
-    for stock in watchlist_data:
-        ticker = stock['ticker']
-        price = stock['price']
-        sentiment = stock['avg_sentiment']
-        
-        message += f"📊 {ticker}\n"
-        
-        if price is not None:
-            message += f"   Price: ${price:.2f}\n"
-        else:
-            message += f"   Price: N/A\n"
-        
-        if sentiment is not None:
-            sentiment_label = "Positive" if sentiment > 0.1 else "Negative" if sentiment < -0.1 else "Neutral"
-            message += f"   Sentiment: {sentiment_label} ({sentiment:.3f})\n"
-        else:
-            message += f"   Sentiment: N/A\n"
-        
-        message += "\n"
-    
-    message += "Stay informed and happy investing!\n\n"
-    message += "Best regards,\n"
-    message += "Stock News Analyzer"
-    
-    return message
+
+    def template_data(self, stocks):
+        """ReplacementTemplateData for the SES digest template (digest_template.txt/.html)"""
+        return {"stocks": [self.fragment(stock)["template"] for stock in stocks]}
+
+def _request_body(event):
+    """Parse the JSON request body, decoding it first if API Gateway passed it as base64"""
+    raw = (event or {}).get("body")
+    if not raw:
+        return {}
+    if isinstance(raw, dict):
+        return raw
+    try:
+        if event.get("isBase64Encoded"):
+            raw = base64.b64decode(raw)
+        body = json.loads(raw)
+    except (ValueError, TypeError):
+        return {}
+    return body if isinstance(body, dict) else {}
+
+def _run_id(event):
+    """
+    Digest run the checkpoints belong to: the request's run_id when resuming
+    an unfinished run (the response returns it), else a new one, so every
+    plain /notify sends a fresh digest
+    """
+    run_id = _request_body(event).get("run_id")
+    return str(run_id)[:64] if run_id else f"digest-{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+
+def load_sent(conn, run_id):
+    """Addresses this run has already delivered to"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT email FROM notification_sends WHERE run_id = %s", (run_id,))
+        return {row["email"] for row in cur.fetchall()}
+
+def record_sent(conn, run_id, results):
+    """Checkpoint successful sends as soon as they complete, so a rerun skips them"""
+    sent = [(run_id, email, message_id) for email, message_id, error in results if error is None]
+    if sent:
+        with conn.cursor() as cur:
+            cur.executemany(
+                "INSERT IGNORE INTO notification_sends (run_id, email, message_id) VALUES (%s, %s, %s)",
+                sent,
+            )
+        conn.commit()
+    return sent
+
+def send_rate():
+    if SES_MAX_SEND_RATE > 0:
+        return SES_MAX_SEND_RATE
+    try:
+        return float(ses.get_send_quota()["MaxSendRate"])
+    except Exception as e:
+        # Sandbox accounts get 1/s; assume the least
+        print(f"Error reading SES send quota: {str(e)}")
+        return 1.0
+
+def dispatch_jobs(dispatcher, recipients, renderer, rate):
+    """
+    (recipient_count, send job) pairs for [(email, stocks)]: batches of
+    templated bulk sends when a sender and template are configured, one
+    send_email each otherwise. A bulk batch never exceeds one second's worth
+    of the send rate, since SES counts every destination against it. Digests
+    are rendered inside the job, so the ones a run never gets to cost nothing.
+    """
+    if SES_SENDER and SES_TEMPLATE_NAME:
+        batch_size = max(1, min(BULK_MAX_DESTINATIONS, int(rate)))
+
+        def bulk(chunk):
+            batch = [(email, renderer.template_data(stocks)) for email, stocks in chunk]
+            return dispatcher.send_bulk(SES_SENDER, SES_TEMPLATE_NAME, batch, {"stocks": []})
+
+        for start in range(0, len(recipients), batch_size):
+            chunk = recipients[start:start + batch_size]
+            yield len(chunk), lambda chunk=chunk: bulk(chunk)
+    else:
+        def one(email, stocks):
+            text, html_body = renderer.render(stocks)
+            return dispatcher.send_one(email, EMAIL_SUBJECT, text, html_body)
+
+        for email, stocks in recipients:
+            yield 1, lambda email=email, stocks=stocks: one(email, stocks)
 
 def lambda_handler(event, context):
     # CORS headers for all responses
@@ -110,45 +334,60 @@ def lambda_handler(event, context):
     }
     
     try:
+        profiler = QueryProfiler.from_env() if QUERY_PROFILE and QueryProfiler else None
         conn = get_connection()
+        if profiler:
+            conn = profiler.wrap(conn)
         
-        sent_count = 0
         skipped_count = 0
         skipped_emails = []
+        run_id = _run_id(event)
 
         with conn.cursor() as cur:
-            cur.execute("SELECT email FROM users;")
-            all_user_info = cur.fetchall()
-
-            for user in all_user_info:
-                email = user["email"]
-
-                if email.lower() == "demo-user-1@example.com":
-                    continue
-
-                # Check if email is verified before attempting to send
-                if not is_email_verified(email):
-                    print(f"Skipping {email} - not verified")
-                    skipped_count += 1
-                    skipped_emails.append(email)
-                    ses.verify_email_identity(EmailAddress=email)
-                    continue
-
-                # Get user's watchlist data
-                watchlist_data = get_user_watchlist_data(cur)
-                
-                # Format the email message
-                message_text = format_watchlist_email(email, watchlist_data)
-
-                ses.send_email(
-                    Source=email,
-                    Destination={"ToAddresses": [email]},
-                    Message={
-                        "Subject": {"Data": "Your Stock Watchlist Update"},
-                        "Body": {"Text": {"Data": message_text}}
-                    }
-                )
-                sent_count += 1
+            # Two set-based queries for the whole run; digests are grouped in memory
+            users = get_users_with_watchlists(cur)
+            snapshots = get_latest_snapshots(cur)
+
+        users = [(email, stocks) for email, stocks in users if email.lower() != "demo-user-1@example.com"]
+        # Verification status for everyone up front, from cache or in bulk
+        statuses, identity_cache = resolve_verification_status(conn, [email for email, _ in users])
+        verification_requested = request_verifications(conn, statuses, identity_cache)
+
+        already_sent = load_sent(conn, run_id)
+        recipients = []
+        for email, stocks in users:
+            # Check if email is verified before attempting to send
+            if statuses.get(email) != "Success":
+                print(f"Skipping {email} - not verified")
+                skipped_count += 1
+                skipped_emails.append(email)
+            elif email not in already_sent:
+                recipients.append((email, stocks))
+
+        rate = send_rate()
+        # No burst allowance: SES measures the rate over any one-second window
+        dispatcher = Dispatcher(ses, TokenBucket(rate, capacity=1), workers=SES_SEND_WORKERS)
+        sent = []
+        failed = []
+
+        def on_result(results):
+            sent.extend(record_sent(conn, run_id, results))
+            # NOT_SENT recipients were never attempted; they stay pending for the rerun
+            failed.extend(
+                {"email": email, "error": error}
+                for email, _, error in results
+                if error is not None and error != NOT_SENT
+            )
+
+        remaining_ms = context.get_remaining_time_in_millis() if context else None
+        deadline = time.monotonic() + remaining_ms / 1000 - SEND_STOP_MARGIN_SECONDS if remaining_ms else None
+        dispatcher.run(dispatch_jobs(dispatcher, recipients, DigestRenderer(snapshots), rate), on_result, deadline)
+        pending = len(recipients) - len(sent) - len(failed)
+        if pending:
+            print(f"Out of time with {pending} digests unsent; rerun with run_id {run_id} to resume")
+
+        if profiler:
+            print(profiler.format_report())
 
         return {
             "isBase64Encoded": False,
@@ -156,9 +395,16 @@ def lambda_handler(event, context):
             "headers": cors_headers,
             "body": json.dumps({
                 "status": "success",
-                "sent": sent_count,
+                "run_id": run_id,
+                "complete": pending == 0 and not failed,
+                "sent": len(sent),
+                "already_sent": len(already_sent),
+                "pending": pending,
+                "failed": failed,
                 "skipped": skipped_count,
-                "skipped_emails": skipped_emails
+                "skipped_emails": skipped_emails,
+                "verification_requested": verification_requested,
+                "dispatch": dispatcher.stats
             })
         }
     except Exception as e:
@@ -132,6 +132,7 @@ resource "null_resource" "package_lambda_stocks" {
       rm -rf ${path.module}/build/get_stocks
       mkdir -p ${path.module}/build/get_stocks
       cp ${path.module}/lambda/get_stocks/handler.py ${path.module}/build/get_stocks/
+      cp ${path.module}/lambda/shared/query_profiler.py ${path.module}/build/get_stocks/
       pip install -r ${path.module}/lambda/get_stocks/requirements.txt -t ${path.module}/build/get_stocks/
     EOT
   }
@@ -145,8 +146,9 @@ resource "null_resource" "package_lambda_init" {
   provisioner "local-exec" {
     command = <<EOT
       rm -rf ${path.module}/build/init_rds
-      mkdir -p ${path.module}/build/init_rds/sql
-      cp -r ${path.module}/lambda/init_rds/sql/* ${path.module}/build/init_rds/sql/
+      mkdir -p ${path.module}/build/init_rds/migrations
+      cp ${path.module}/lambda/shared/migrations/*.sql ${path.module}/lambda/shared/migrations/*.py ${path.module}/build/init_rds/migrations/
+      cp ${path.module}/lambda/shared/migrate.py ${path.module}/lambda/shared/partitions.py ${path.module}/build/init_rds/
       cp ${path.module}/lambda/init_rds/handler.py ${path.module}/build/init_rds/
       pip install -r ${path.module}/lambda/init_rds/requirements.txt -t ${path.module}/build/init_rds/
     EOT
@@ -261,6 +263,25 @@ resource "aws_s3_object" "backfill_script" {
   etag   = filemd5("${path.module}/scripts/backfill_data.py")
 }
 
+# Migration runner (+ the partition helpers migrations use) and files, shared with the init_rds Lambda
+resource "aws_s3_object" "backfill_migrate" {
+  for_each = toset(["migrate.py", "partitions.py"])
+
+  bucket = aws_s3_bucket.scripts_bucket.id
+  key    = each.value
+  source = "${path.module}/lambda/shared/${each.value}"
+  etag   = filemd5("${path.module}/lambda/shared/${each.value}")
+}
+
+resource "aws_s3_object" "backfill_migrations" {
+  for_each = fileset("${path.module}/lambda/shared/migrations", "*.{sql,py}")
+
+  bucket = aws_s3_bucket.scripts_bucket.id
+  key    = "migrations/${each.value}"
+  source = "${path.module}/lambda/shared/migrations/${each.value}"
+  etag   = filemd5("${path.module}/lambda/shared/migrations/${each.value}")
+}
+
 # Prepare user data script
 resource "aws_instance" "backfill_instance" {
   ami                    = data.aws_ami.amazonlinux.id
@@ -286,7 +307,11 @@ resource "aws_instance" "backfill_instance" {
 
   instance_initiated_shutdown_behavior = "terminate"
   
-  depends_on = [aws_s3_object.backfill_script]
+  depends_on = [
+    aws_s3_object.backfill_script,
+    aws_s3_object.backfill_migrate,
+    aws_s3_object.backfill_migrations,
+  ]
 }
 
 # Find your backfill IAM role policy and ensure it includes:
@@ -303,6 +328,12 @@ resource "aws_iam_role_policy" "backfill_s3_access" {
           "s3:GetObject"
         ]
         Resource = "${aws_s3_bucket.scripts_bucket.arn}/*"
+      },
+      {
+        # aws s3 cp --recursive of migrations/
+        Effect   = "Allow"
+        Action   = ["s3:ListBucket"]
+        Resource = aws_s3_bucket.scripts_bucket.arn
       }
     ]
   })
@@ -10,7 +10,9 @@ resource "aws_iam_role_policy" "lambda_ses_send" {
           "ses:VerifyEmailIdentity",
           "ses:GetIdentityVerificationAttributes",
           "ses:SendEmail",
-          "ses:SendRawEmail"
+          "ses:SendRawEmail",
+          "ses:SendBulkTemplatedEmail",
+          "ses:GetSendQuota"
         ]
         Resource = "*"
       }
@@ -18,12 +20,21 @@ resource "aws_iam_role_policy" "lambda_ses_send" {
   })
 }
 
+# Watchlist digest; rendered by SES from each recipient's ticker list
+resource "aws_ses_template" "watchlist_digest" {
+  name    = "stock-news-analyzer-watchlist-digest"
+  subject = "Your Stock Watchlist Update"
+  text    = file("${path.module}/lambda/test_notifs/digest_template.txt")
+  html    = file("${path.module}/lambda/test_notifs/digest_template.html")
+}
+
 resource "aws_lambda_function" "test_notifs_lambda" {
   function_name = "test-notifs-lambda"
   role          = aws_iam_role.lambda_role.arn
   handler       = "handler.lambda_handler"
   runtime       = "python3.12"
-  timeout = 15
+  # Just under API Gateway's 29s limit; sends checkpoint, so a re-POST resumes
+  timeout = 28
   filename         = data.archive_file.test_notifs_zip.output_path
   source_code_hash = data.archive_file.test_notifs_zip.output_base64sha256
 
@@ -33,6 +44,8 @@ resource "aws_lambda_function" "test_notifs_lambda" {
       DB_USER           = var.db_username
       DB_PASS           = var.db_password
       DB_NAME           = "stocknewsanalyzerdb"
+      SES_SENDER        = var.notification_sender
+      SES_TEMPLATE_NAME = aws_ses_template.watchlist_digest.name
     }
   }
 
@@ -49,6 +62,7 @@ resource "null_resource" "package_lambda_test_notifs" {
       mkdir -p ${path.module}/build/test_notifs/
       cp -r ${path.module}/lambda/test_notifs/* ${path.module}/build/test_notifs/
       cp ${path.module}/lambda/test_notifs/handler.py ${path.module}/build/test_notifs/
+      cp ${path.module}/lambda/shared/query_profiler.py ${path.module}/build/test_notifs/
       pip install -r ${path.module}/lambda/test_notifs/requirements.txt -t ${path.module}/build/test_notifs/
     EOT
   }
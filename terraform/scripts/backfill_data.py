@@ -1,11 +1,27 @@
+import hashlib
 import os
+import queue
+import random
 import sys
+import tempfile
+import threading
 import time
 import requests
 import pymysql
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 from decimal import Decimal
 
+# migrate.py and migrations/ sit next to this script on the backfill instance;
+# in a checkout they live in lambda/shared
+_HERE = os.path.dirname(os.path.abspath(__file__))
+_SHARED = _HERE if os.path.exists(os.path.join(_HERE, "migrate.py")) else os.path.join(_HERE, "..", "lambda", "shared")
+sys.path.insert(0, _SHARED)
+from migrate import run_migrations  # noqa: E402
+
+MIGRATIONS_DIR = os.path.join(_SHARED, "migrations")
+
 # Configuration from environment variables
 DB_HOST = os.environ.get('DB_HOST')
 DB_USER = os.environ.get('DB_USER')
@@ -15,6 +31,42 @@ TIINGO_API_KEY = os.environ.get('TIINGO_API_KEY')
 ALPHA_VANTAGE_KEY = os.environ.get('ALPHA_VANTAGE_KEY')  # Keep for news
 AWS_REGION = os.environ.get('AWS_REGION', 'us-east-1')
 
+# Provider quotas the backfill paces itself to (calls per window). Defaults
+# are the plans we run on: Tiingo free tier 50/hour, Alpha Vantage free tier
+# 5/minute, Comprehend Batch* APIs 10/second.
+TIINGO_CALLS_PER_HOUR = int(os.environ.get('TIINGO_CALLS_PER_HOUR', '50'))
+ALPHA_VANTAGE_CALLS_PER_MINUTE = int(os.environ.get('ALPHA_VANTAGE_CALLS_PER_MINUTE', '5'))
+COMPREHEND_BATCH_CALLS_PER_SECOND = int(os.environ.get('COMPREHEND_BATCH_CALLS_PER_SECOND', '10'))
+# Comprehend documents: byte limit per document (UTF-8) and attempts per
+# batch before the documents still failing are given up on
+COMPREHEND_MAX_BYTES = 5000
+COMPREHEND_MAX_ATTEMPTS = int(os.environ.get('COMPREHEND_MAX_ATTEMPTS', '4'))
+# Tickers in flight at once; the rate limiters, not this, bound throughput
+BACKFILL_WORKERS = int(os.environ.get('BACKFILL_WORKERS', '4'))
+# News fetched more recently than this isn't fetched again on a re-run
+NEWS_REFRESH = timedelta(hours=int(os.environ.get('BACKFILL_NEWS_REFRESH_HOURS', '24')))
+# News is fetched a window at a time, oldest first, so a long backfill streams
+# through bounded pages instead of holding the whole history (Alpha Vantage
+# returns at most 1000 articles per call)
+NEWS_WINDOW_DAYS = int(os.environ.get('BACKFILL_NEWS_WINDOW_DAYS', '90'))
+NEWS_PAGE_LIMIT = int(os.environ.get('BACKFILL_NEWS_PAGE_LIMIT', '1000'))
+# Articles per Comprehend Batch* call (the API maximum)
+NLP_BATCH_SIZE = 25
+# Batches buffered between pipeline stages; bounds memory per ticker
+PIPELINE_QUEUE_DEPTH = int(os.environ.get('BACKFILL_QUEUE_DEPTH', '4'))
+# Price rows per upsert statement (each chunk is committed on its own)
+WRITE_CHUNK_ROWS = int(os.environ.get('BACKFILL_WRITE_CHUNK_ROWS', '1000'))
+# How price rows reach stock_history: 'executemany' (per ticker, in
+# WRITE_CHUNK_ROWS statements), or the bulk modes 'load_data' (LOAD DATA
+# LOCAL INFILE) and 'insert' (multi-row INSERT), which buffer rows across
+# tickers and load BULK_LOAD_ROWS at a time. 'load_data' falls back to
+# 'insert' if the server refuses local infile.
+PRICE_LOAD_MODE = os.environ.get('BACKFILL_PRICE_LOAD', 'executemany')
+BULK_LOAD_ROWS = int(os.environ.get('BACKFILL_BULK_LOAD_ROWS', '50000'))
+BULK_INSERT_ROWS = int(os.environ.get('BACKFILL_BULK_INSERT_ROWS', '5000'))
+# maintenance_checkpoints job name (items are "<ticker>:<what>")
+CHECKPOINT_JOB = 'backfill'
+
 # Boto3 for Comprehend
 try:
     import boto3
@@ -23,6 +75,77 @@ except Exception as e:
     print(f"Warning: Could not initialize Comprehend client: {e}")
     comprehend = None
 
+class RateLimiter:
+    """
+    At most `calls` acquisitions in any `period` seconds (a sliding window,
+    which is how the providers count), shared by every worker thread.
+    acquire() blocks until a slot is free.
+    """
+
+    def __init__(self, name, calls, period, clock=time.monotonic, sleep=time.sleep):
+        self.name = name
+        self.calls = calls
+        self.period = period
+        self.clock = clock
+        self.sleep = sleep
+        self.count = 0
+        self.waited = 0.0
+        self._times = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = self.clock()
+                while self._times and self._times[0] <= now - self.period:
+                    self._times.popleft()
+                if len(self._times) < self.calls:
+                    self._times.append(now)
+                    self.count += 1
+                    return
+                delay = self._times[0] + self.period - now
+                self.waited += delay
+            self.sleep(delay)
+
+
+LIMITERS = {
+    'tiingo': RateLimiter('Tiingo', TIINGO_CALLS_PER_HOUR, 3600),
+    'alpha_vantage': RateLimiter('Alpha Vantage', ALPHA_VANTAGE_CALLS_PER_MINUTE, 60),
+    'comprehend': RateLimiter('Comprehend', COMPREHEND_BATCH_CALLS_PER_SECOND, 1),
+}
+
+
+class Progress:
+    """Tickers done / failed, throughput and ETA, printed as each ticker finishes"""
+
+    def __init__(self, total):
+        self.total = total
+        self.completed = 0
+        self.failed = 0
+        self.start = time.time()
+        self._lock = threading.Lock()
+
+    def done(self, ticker, ok):
+        with self._lock:
+            self.completed += 1
+            if not ok:
+                self.failed += 1
+            elapsed = time.time() - self.start
+            rate = self.completed / elapsed if elapsed > 0 else 0.0
+            remaining = self.total - self.completed
+            eta = remaining / rate if rate else 0.0
+            print(
+                f"[{self.completed}/{self.total}] {ticker} {'✓' if ok else '✗'} | "
+                f"{rate * 60:.1f} tickers/min | elapsed {_duration(elapsed)} | ETA {_duration(eta)}"
+            )
+
+
+def _duration(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m{seconds % 60:02d}s" if seconds >= 3600 \
+        else f"{seconds // 60}m{seconds % 60:02d}s"
+
+
 def wait_for_database(max_retries=20, retry_delay=15):
     """Wait for database to be initialized with schema"""
     print("Waiting for database to be ready...")
@@ -75,59 +198,10 @@ def wait_for_database(max_retries=20, retry_delay=15):
 
 DEFAULT_TICKERS = ["AAPL", "NFLX", "AMZN", "NVDA", "META", "MSFT", "AMD"]
 
-SCHEMA_SQL = [
-    """
-    CREATE TABLE IF NOT EXISTS users (
-        id VARCHAR(255) PRIMARY KEY NOT NULL,
-        email VARCHAR(64) NOT NULL UNIQUE
-    )
-    """,
-    """
-    CREATE TABLE IF NOT EXISTS stocks (
-        id INT AUTO_INCREMENT PRIMARY KEY NOT NULL,
-        ticker VARCHAR(10) NOT NULL UNIQUE
-    )
-    """,
-    """
-    CREATE TABLE IF NOT EXISTS watchlist (
-        id INT AUTO_INCREMENT PRIMARY KEY NOT NULL,
-        user_id VARCHAR(255) NOT NULL,
-        stock_id INT NOT NULL,
-        FOREIGN KEY (user_id) REFERENCES users(id),
-        FOREIGN KEY (stock_id) REFERENCES stocks(id),
-        UNIQUE KEY unique_user_stock (user_id, stock_id)
-    )
-    """,
-    """
-    CREATE TABLE IF NOT EXISTS article_history (
-        id INT AUTO_INCREMENT PRIMARY KEY NOT NULL,
-        stock_id INT NOT NULL,
-        title VARCHAR(500) NOT NULL,
-        keywords TEXT,
-        sentiment_score DECIMAL(10, 6),
-        recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (stock_id) REFERENCES stocks(id)
-    )
-    """,
-    """
-    CREATE TABLE IF NOT EXISTS stock_history (
-        id INT AUTO_INCREMENT PRIMARY KEY NOT NULL,
-        stock_id INT NOT NULL,
-        price DECIMAL(10, 2),
-        avg_sentiment DECIMAL(10, 6),
-        recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (stock_id) REFERENCES stocks(id)
-    )
-    """
-]
-
 
 def ensure_schema(conn):
-    """Create tables if they do not exist."""
-    with conn.cursor() as cursor:
-        for statement in SCHEMA_SQL:
-            cursor.execute(statement)
-    conn.commit()
+    """Bring the schema up to the latest migration (shared with the init_rds Lambda)."""
+    run_migrations(conn, MIGRATIONS_DIR)
     print("✓ Database schema ensured")
 
 
@@ -167,6 +241,7 @@ def get_db_connection():
         password=DB_PASS,
         database=DB_NAME,
         connect_timeout=10,
+        local_infile=PRICE_LOAD_MODE == 'load_data',
         cursorclass=pymysql.cursors.DictCursor
     )
 
@@ -176,8 +251,8 @@ def get_stocks(conn):
         cursor.execute("SELECT id, ticker FROM stocks ORDER BY ticker")
         return cursor.fetchall()
 
-def fetch_time_series_daily(ticker):
-    """Fetch daily time series data from Tiingo"""
+def fetch_time_series_daily(ticker, start_date, end_date):
+    """Fetch daily closes from Tiingo for [start_date, end_date]"""
     if not TIINGO_API_KEY:
         print("ERROR: TIINGO_API_KEY not set")
         return None
@@ -188,10 +263,6 @@ def fetch_time_series_daily(ticker):
         'Authorization': f'Token {TIINGO_API_KEY}'
     }
     
-    # Get last 3 months of data
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=90)
-    
     params = {
         'startDate': start_date.strftime('%Y-%m-%d'),
         'endDate': end_date.strftime('%Y-%m-%d'),
@@ -199,14 +270,16 @@ def fetch_time_series_daily(ticker):
     }
     
     try:
+        LIMITERS['tiingo'].acquire()
         print(f"  Fetching price data for {ticker} from Tiingo...")
         response = requests.get(url, headers=headers, params=params, timeout=30)
         response.raise_for_status()
         data = response.json()
         
         if not data or len(data) == 0:
+            # Not an error: e.g. only today is missing and the close isn't posted yet
             print(f"  ⚠ No time series data for {ticker}")
-            return None
+            return {}
         
         # Convert Tiingo format to Alpha Vantage-like format for compatibility
         time_series = {}
@@ -231,109 +304,627 @@ def fetch_time_series_daily(ticker):
         print(f"  ✗ Error fetching time series for {ticker}: {e}")
         return None
 
-def fetch_news(ticker):
-    """Fetch news articles for a ticker (last 3 months)"""
+def fetch_news(ticker, start_date, end_date=None):
+    """Fetch news articles for a ticker published in [start_date, end_date]; None if the request failed"""
     if not ALPHA_VANTAGE_KEY:
         return []
     
     url = 'https://www.alphavantage.co/query'
     
-    # Calculate 3 months ago
-    start_date = datetime.now() - timedelta(days=365)
-    
     params = {
         'function': 'NEWS_SENTIMENT',
         'tickers': ticker,
         'apikey': ALPHA_VANTAGE_KEY,
-        'time_from': start_date.strftime('%Y%m%dT0000'),
-        'limit': 200,
+        'time_from': start_date.strftime('%Y%m%dT%H%M'),
+        'limit': NEWS_PAGE_LIMIT,
         'sort': 'LATEST'
     }
+    if end_date:
+        params['time_to'] = end_date.strftime('%Y%m%dT%H%M')
     
     try:
-        print(f"  Fetching news for {ticker}...")
+        LIMITERS['alpha_vantage'].acquire()
+        print(f"  Fetching news for {ticker} from {start_date:%Y-%m-%d}...")
         response = requests.get(url, params=params, timeout=30)
         response.raise_for_status()
         data = response.json()
+        # Over-quota responses are 200s with a note instead of a feed; they
+        # are failures, or the window would be checkpointed as empty
+        if 'feed' not in data:
+            note = data.get('Note') or data.get('Information') or data.get('Error Message')
+            if note:
+                print(f"  ⚠ Alpha Vantage refused {ticker}: {note}")
+                return None
         return data.get('feed', [])
     
     except Exception as e:
         print(f"  ✗ Error fetching news for {ticker}: {e}")
-        return []
+        return None
+
+# Whole-call errors worth backing off and retrying, and per-document
+# ErrorList codes worth re-sending (anything else is permanent)
+COMPREHEND_THROTTLE_CODES = {"ThrottlingException", "TooManyRequestsException", "InternalServerException"}
+RETRYABLE_DOCUMENT_ERRORS = {"INTERNAL_SERVER_ERROR", "ThrottlingException", "InternalServerException"}
+
+def _error_code(exc):
+    response = getattr(exc, 'response', None) or {}
+    return response.get('Error', {}).get('Code')
+
+def truncate_utf8(text, max_bytes=COMPREHEND_MAX_BYTES):
+    """text cut to at most max_bytes of UTF-8, without splitting a character"""
+    encoded = text.encode('utf-8')
+    if len(encoded) <= max_bytes:
+        return text
+    return encoded[:max_bytes].decode('utf-8', errors='ignore')
+
+class NLPStats:
+    """Per-operation Comprehend batch counts, summed over every worker"""
+
+    def __init__(self):
+        self.ops = {}
+        self._lock = threading.Lock()
+
+    def add(self, op, documents, filled, retried, throttled):
+        with self._lock:
+            totals = self.ops.setdefault(op, {'batches': 0, 'documents': 0, 'filled': 0, 'retried': 0, 'throttled': 0})
+            totals['batches'] += 1
+            totals['documents'] += documents
+            totals['filled'] += filled
+            totals['retried'] += retried
+            totals['throttled'] += throttled
+
+    def summary(self):
+        return [
+            f"{op}: {t['batches']} batches, {t['filled']}/{t['documents']} documents filled "
+            f"({t['filled'] / t['documents'] * 100 if t['documents'] else 100:.1f}%), "
+            f"{t['retried']} re-sent, {t['throttled']} throttled call(s)"
+            for op, t in sorted(self.ops.items())
+        ]
+
+
+NLP_STATS = NLPStats()
+
+def comprehend_batch(op, call, texts, parse, stats=NLP_STATS, sleep=time.sleep):
+    """
+    One Comprehend Batch* request for up to 25 texts, robust to partial
+    failure. ResultList and ErrorList entries are mapped back to texts by
+    Index; only documents that failed transiently are re-sent, and a
+    throttled call is retried whole, both with jittered exponential backoff.
+    Returns a list aligned with texts: parse(result) or None for documents
+    that never succeeded.
+    """
+    documents = [truncate_utf8(text) for text in texts]
+    results = [None] * len(texts)
+    pending = list(range(len(texts)))
+    retried = throttled = 0
+    for attempt in range(COMPREHEND_MAX_ATTEMPTS):
+        LIMITERS['comprehend'].acquire()
+        try:
+            response = call(TextList=[documents[i] for i in pending], LanguageCode='en')
+        except Exception as e:
+            if _error_code(e) not in COMPREHEND_THROTTLE_CODES:
+                print(f"    ⚠ {op} batch error: {e}")
+                break
+            throttled += 1
+        else:
+            for result in response.get('ResultList', []):
+                results[pending[result['Index']]] = parse(result)
+            retry = []
+            for error in response.get('ErrorList', []):
+                if error.get('ErrorCode') in RETRYABLE_DOCUMENT_ERRORS:
+                    retry.append(pending[error['Index']])
+                else:
+                    print(f"    ⚠ {op}: document skipped ({error.get('ErrorCode')}: {error.get('ErrorMessage')})")
+            pending = retry
+            if not pending:
+                break
+        if attempt + 1 < COMPREHEND_MAX_ATTEMPTS:
+            retried += len(pending)
+            sleep(random.uniform(0, 0.5 * (2 ** attempt)))
+
+    filled = sum(1 for result in results if result is not None)
+    stats.add(op, len(texts), filled, retried, throttled)
+    if filled < len(texts) or retried:
+        print(f"    ⚠ {op}: {filled}/{len(texts)} filled ({filled / len(texts) * 100:.0f}%), "
+              f"{retried} re-sent, {throttled} throttled")
+    return results
+
+def _sentiment_score(result):
+    scores = result['SentimentScore']
+    return scores['Positive'] - scores['Negative']
+
+def _key_phrases(result):
+    return ', '.join(phrase['Text'] for phrase in result.get('KeyPhrases', [])[:10])
 
 def batch_analyze_sentiment(texts):
-    """Batch analyze sentiment for multiple texts"""
+    """
+    Sentiment (positive - negative) for each text; None where Comprehend
+    never returned one (or there's no client), so a failure isn't stored as
+    a neutral 0 and the next run with Comprehend analyzes it
+    """
     if not comprehend or not texts:
-        return [0.0] * len(texts)
+        return [None] * len(texts)
     
     results = []
-    
-    # Process in batches of 25 (Comprehend limit)
-    batch_size = 25
-    for i in range(0, len(texts), batch_size):
-        batch = texts[i:i+batch_size]
-        
-        # Truncate texts to 5000 bytes
-        truncated_batch = []
-        for text in batch:
-            if len(text.encode('utf-8')) > 5000:
-                text = text[:1200]
-            truncated_batch.append(text)
-        
-        try:
-            response = comprehend.batch_detect_sentiment(
-                TextList=truncated_batch,
-                LanguageCode='en'
-            )
-            
-            for result in response['ResultList']:
-                scores = result['SentimentScore']
-                sentiment_score = scores['Positive'] - scores['Negative']
-                results.append(sentiment_score)
-        
-        except Exception as e:
-            print(f"    ⚠ Batch sentiment error: {e}")
-            results.extend([0.0] * len(batch))
-    
+    for i in range(0, len(texts), NLP_BATCH_SIZE):
+        results.extend(comprehend_batch(
+            'sentiment', comprehend.batch_detect_sentiment, texts[i:i + NLP_BATCH_SIZE], _sentiment_score
+        ))
     return results
 
 def batch_extract_keywords(texts):
-    """Batch extract keywords for multiple texts"""
+    """Top key phrases for each text, comma-separated; "" where Comprehend never returned any"""
     if not comprehend or not texts:
         return [""] * len(texts)
     
     results = []
-    
-    # Process in batches of 25
-    batch_size = 25
-    for i in range(0, len(texts), batch_size):
-        batch = texts[i:i+batch_size]
+    for i in range(0, len(texts), NLP_BATCH_SIZE):
+        results.extend(
+            keywords or "" for keywords in comprehend_batch(
+                'key_phrases', comprehend.batch_detect_key_phrases, texts[i:i + NLP_BATCH_SIZE], _key_phrases
+            )
+        )
+    return results
+
+def get_checkpoint(conn, ticker, name):
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT value FROM maintenance_checkpoints WHERE job = %s AND item = %s",
+            (CHECKPOINT_JOB, f"{ticker}:{name}")
+        )
+        row = cursor.fetchone()
+    return row['value'] if row else None
+
+def set_checkpoint(conn, ticker, name, value):
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO maintenance_checkpoints (job, item, value) VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE value = VALUES(value)
+        """, (CHECKPOINT_JOB, f"{ticker}:{name}", value))
+    conn.commit()
+
+def article_fingerprint(title):
+    """Natural key for an article (with stock and publish time): SHA-1 of the normalized title"""
+    return hashlib.sha1(" ".join(title.lower().split()).encode('utf-8')).hexdigest()
+
+def find_missing_days(conn, stock_id, start_day, end_day, fetched=None):
+    """
+    Weekdays in [start_day, end_day] with no stock_history row, leaving out
+    any inside the (from, through) window an earlier run already fetched
+    (market holidays there are known to have no data).
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT DISTINCT DATE(recorded_at) AS day
+            FROM stock_history
+            WHERE stock_id = %s AND recorded_at >= %s AND recorded_at < %s
+        """, (stock_id, start_day, end_day + timedelta(days=1)))
+        stored = {row['day'] for row in cursor.fetchall()}
+
+    missing = []
+    day = start_day
+    while day <= end_day:
+        known = fetched and fetched[0] <= day <= fetched[1]
+        if day.weekday() < 5 and day not in stored and not known:
+            missing.append(day)
+        day += timedelta(days=1)
+    return missing
+
+def _price_window(conn, ticker):
+    value = get_checkpoint(conn, ticker, 'prices')
+    if not value:
+        return None
+    start, end = value.split('/')
+    return datetime.strptime(start, '%Y-%m-%d').date(), datetime.strptime(end, '%Y-%m-%d').date()
+
+def news_pages(ticker, window_start, window_end):
+    """
+    Parsed articles for one news window, a page at a time. Pages come
+    newest first (sort=LATEST), so a full page means older articles were
+    cut off: the next page asks for everything up to the oldest minute seen
+    (that minute's articles are repeated and dropped here). Raises if a
+    fetch fails, so the window isn't checkpointed.
+    """
+    page_end = window_end
+    previous = set()
+    while True:
+        articles = fetch_news(ticker, window_start, page_end)
+        if articles is None:
+            raise RuntimeError(f"news fetch failed for {window_start:%Y-%m-%d}..{page_end:%Y-%m-%d %H:%M}")
+        parsed = parse_articles(articles)
+        keys = {(item[0], item[1]) for item in parsed}
+        yield [item for item in parsed if (item[0], item[1]) not in previous]
+        if len(articles) < NEWS_PAGE_LIMIT or not parsed:
+            return
+        oldest = min(item[0] for item in parsed).replace(second=0, microsecond=0)
+        next_end = oldest + timedelta(minutes=1)
+        if next_end >= page_end:
+            # A whole page within the last minute: step past it regardless
+            print(f"  ⚠ {ticker}: over {NEWS_PAGE_LIMIT} articles in the minute before {page_end:%Y-%m-%d %H:%M}; "
+                  f"some of them are skipped")
+            next_end = page_end - timedelta(minutes=1)
+        if next_end <= window_start:
+            return
+        page_end, previous = next_end, keys
+
+def parse_articles(articles):
+    """(published_dt, fingerprint, title, text) for each usable article in a news feed"""
+    parsed = []
+    for article in articles:
+        title = article.get('title', '')
+        summary = article.get('summary', '')
+        time_published = article.get('time_published', '')
         
-        # Truncate texts
-        truncated_batch = []
-        for text in batch:
-            if len(text.encode('utf-8')) > 5000:
-                text = text[:1200]
-            truncated_batch.append(text)
+        if not title or not time_published:
+            continue
         
         try:
-            response = comprehend.batch_detect_key_phrases(
-                TextList=truncated_batch,
-                LanguageCode='en'
-            )
-            
-            for result in response['ResultList']:
-                keywords = [phrase['Text'] for phrase in result.get('KeyPhrases', [])[:10]]
-                results.append(', '.join(keywords))
+            published_dt = datetime.strptime(time_published, '%Y%m%dT%H%M%S')
+        except ValueError:
+            continue
         
-        except Exception as e:
-            print(f"    ⚠ Batch keywords error: {e}")
-            results.extend([""] * len(batch))
+        parsed.append((published_dt, article_fingerprint(title[:500]), title[:500], f"{title}. {summary}"))
+    return parsed
+
+def new_articles(conn, stock_id, parsed):
+    """
+    The parsed articles not already in article_history (matched on publish
+    time + fingerprint), so a re-run never pays Comprehend twice. Articles
+    stored without a sentiment (Comprehend failed on them) count as new,
+    so the next run retries just those.
+    """
+    if not parsed:
+        return []
     
-    return results
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT recorded_at, fingerprint FROM article_history
+            WHERE stock_id = %s AND recorded_at >= %s AND recorded_at <= %s
+              AND fingerprint IS NOT NULL AND sentiment_score IS NOT NULL
+        """, (stock_id, min(p[0] for p in parsed), max(p[0] for p in parsed)))
+        known = {(row['recorded_at'], row['fingerprint']) for row in cursor.fetchall()}
+    
+    new = []
+    seen = set()
+    for item in parsed:
+        key = (item[0], item[1])
+        if key not in known and key not in seen:
+            seen.add(key)
+            new.append(item)
+    return new
 
-def backfill_stock(conn, stock_id, ticker, months=12):
-    """Backfill historical data for a stock"""
+def news_windows(start_date, end_date, days=NEWS_WINDOW_DAYS):
+    """[start, end) windows of `days` covering [start_date, end_date], oldest first"""
+    window_start = start_date
+    while window_start < end_date:
+        window_end = min(window_start + timedelta(days=days), end_date)
+        yield window_start, window_end
+        window_start = window_end
+
+# Queue markers: end of stream, and "everything fetched up to here has been
+# handed on" (lets the writer checkpoint a window once its rows are committed)
+_DONE = object()
+
+class _WindowDone:
+    def __init__(self, end):
+        self.end = end
+
+def _put(q, item, stop):
+    """Blocking put that gives up once stop is set; False if it gave up"""
+    while True:
+        try:
+            q.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            if stop.is_set():
+                return False
+
+def _get(q, stop):
+    """Blocking get that returns _DONE once stop is set"""
+    while True:
+        try:
+            return q.get(timeout=0.5)
+        except queue.Empty:
+            if stop.is_set():
+                return _DONE
+
+def stream_articles(conn, stock_id, ticker, start_date, end_date, connect=None):
+    """
+    Fetch, analyze and store a ticker's news for [start_date, end_date] as a
+    three-stage pipeline joined by bounded queues:
+
+      fetch    one news window at a time, paged if it overflows a page (its
+               own DB connection to drop articles already stored), cut
+               into NLP_BATCH_SIZE batches
+      analyze  sentiment and key phrases for each batch, the two Comprehend
+               calls in parallel
+      write    (this thread, on conn) upsert and commit each batch, and
+               checkpoint news_through as each window is fully written
+
+    Fetching, Comprehend and the database all work at once, memory stays at
+    a few batches whatever the date range, and rows are visible as each
+    batch lands. Returns (articles stored, whether every window completed).
+    """
+    stop = threading.Event()
+    to_analyze = queue.Queue(maxsize=PIPELINE_QUEUE_DEPTH)
+    to_write = queue.Queue(maxsize=PIPELINE_QUEUE_DEPTH)
+    errors = []
+
+    def fetch_stage():
+        lookup = None
+        try:
+            lookup = (connect or get_db_connection)()
+            for window_start, window_end in news_windows(start_date, end_date):
+                if stop.is_set():
+                    return
+                for parsed in news_pages(ticker, window_start, window_end):
+                    new = new_articles(lookup, stock_id, parsed)
+                    print(f"  {ticker} {window_start:%Y-%m-%d}..{window_end:%Y-%m-%d}: "
+                          f"{len(new)} new article(s), {len(parsed) - len(new)} already stored")
+                    for i in range(0, len(new), NLP_BATCH_SIZE):
+                        if not _put(to_analyze, new[i:i + NLP_BATCH_SIZE], stop):
+                            return
+                    if stop.is_set():
+                        return
+                # Every page of the window is queued; the writer checkpoints it
+                # once they're stored
+                if not _put(to_analyze, _WindowDone(window_end), stop):
+                    return
+        except Exception as e:
+            errors.append(e)
+        finally:
+            if lookup is not None:
+                lookup.close()
+            _put(to_analyze, _DONE, stop)
+
+    def analyze_stage():
+        try:
+            with ThreadPoolExecutor(max_workers=2) as nlp:
+                while True:
+                    batch = _get(to_analyze, stop)
+                    if batch is _DONE:
+                        return
+                    if isinstance(batch, _WindowDone):
+                        if not _put(to_write, batch, stop):
+                            return
+                        continue
+                    texts = [item[3] for item in batch]
+                    sentiment_job = nlp.submit(batch_analyze_sentiment, texts)
+                    keyword_job = nlp.submit(batch_extract_keywords, texts)
+                    rows = [
+                        (stock_id, title, keywords, sentiment, published_dt, fingerprint)
+                        for (published_dt, fingerprint, title, _), sentiment, keywords
+                        in zip(batch, sentiment_job.result(), keyword_job.result())
+                    ]
+                    if not _put(to_write, rows, stop):
+                        return
+        except Exception as e:
+            errors.append(e)
+        finally:
+            _put(to_write, _DONE, stop)
+
+    stages = [threading.Thread(target=fetch_stage, daemon=True),
+              threading.Thread(target=analyze_stage, daemon=True)]
+    for stage in stages:
+        stage.start()
+
+    stored = 0
+    try:
+        while True:
+            rows = _get(to_write, stop)
+            if rows is _DONE:
+                break
+            if isinstance(rows, _WindowDone):
+                set_checkpoint(conn, ticker, 'news_through', rows.end.isoformat())
+                continue
+            with conn.cursor() as cursor:
+                cursor.executemany("""
+                    INSERT INTO article_history (stock_id, title, keywords, sentiment_score, recorded_at, fingerprint)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE
+                        sentiment_score = COALESCE(sentiment_score, VALUES(sentiment_score)),
+                        keywords = IF(keywords IS NULL OR keywords = '', VALUES(keywords), keywords)
+                """, rows)
+            conn.commit()
+            stored += len(rows)
+    finally:
+        # The stages have finished unless a write failed; if so, unblock them
+        stop.set()
+        for stage in stages:
+            stage.join()
+
+    for e in errors:
+        print(f"  ✗ News pipeline error for {ticker}: {e}")
+    return stored, not errors
+
+def daily_sentiments(conn, stock_id, start_day, end_day):
+    """{date: average article sentiment} from everything stored for the stock"""
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT DATE(recorded_at) AS day, AVG(sentiment_score) AS avg_sentiment
+            FROM article_history
+            WHERE stock_id = %s AND recorded_at >= %s AND recorded_at < %s
+            GROUP BY DATE(recorded_at)
+        """, (stock_id, start_day, end_day + timedelta(days=1)))
+        return {row['day']: float(row['avg_sentiment']) for row in cursor.fetchall() if row['avg_sentiment'] is not None}
+
+def bump_history_revision(conn):
+    """Tell the API's data version that stock_history changed in place (migration 0010)"""
+    with conn.cursor() as cursor:
+        cursor.execute("UPDATE history_revision SET revision = revision + 1 WHERE id = 1")
+    conn.commit()
+
+# Client or server refusing LOAD DATA LOCAL INFILE
+LOCAL_INFILE_REFUSED = {1148, 2068, 3948}
+
+class LoadStats:
+    """Rows and seconds spent writing prices, summed over every loader"""
+
+    def __init__(self):
+        self.rows = 0
+        self.seconds = 0.0
+        self.loads = 0
+        self.modes = set()
+        self._lock = threading.Lock()
+
+    def add(self, mode, rows, seconds):
+        with self._lock:
+            self.rows += rows
+            self.seconds += seconds
+            self.loads += 1
+            self.modes.add(mode)
+
+    def summary(self):
+        rate = self.rows / self.seconds if self.seconds else 0.0
+        return (f"{self.rows} rows in {self.loads} load(s), {self.seconds:.1f}s writing "
+                f"({rate:,.0f} rows/s, {'/'.join(sorted(self.modes)) or PRICE_LOAD_MODE})")
+
+
+LOAD_STATS = LoadStats()
+
+
+class PriceLoader:
+    """
+    Writes (stock_id, price, avg_sentiment, recorded_at) rows to stock_history
+    with upsert semantics on (stock_id, recorded_at), in one of three modes
+    (see PRICE_LOAD_MODE). One per connection; not thread-safe.
+
+    The bulk modes stage rows in an index-less temporary table (from a TSV
+    file via LOAD DATA LOCAL INFILE, or multi-row INSERTs), then merge it in
+    a single INSERT ... SELECT ordered by (stock_id, recorded_at). The
+    unique key and the id index are then maintained once per load, in
+    append order, instead of row by row as each statement arrives. (They
+    can't be disabled outright: DISABLE KEYS is MyISAM-only, and the upsert
+    needs the unique key.)
+
+    add() takes an on_loaded callback, called once the rows are committed,
+    so checkpoints only move past rows that are really stored. Each load
+    into stock_history bumps history_revision, since upserted rows keep
+    their ids and the API's MAX(id) data version wouldn't move.
+    """
+
+    def __init__(self, conn, mode=PRICE_LOAD_MODE, table='stock_history', flush_rows=BULK_LOAD_ROWS, stats=LOAD_STATS):
+        if mode not in ('executemany', 'load_data', 'insert'):
+            raise ValueError(f"unknown price load mode {mode!r}")
+        self.conn = conn
+        self.mode = mode
+        self.table = table
+        self.stage = f"{table}_load"
+        self.flush_rows = flush_rows if mode != 'executemany' else 0
+        self.stats = stats
+        self.rows = []
+        self.callbacks = []
+        self._staged = False
+
+    def add(self, rows, on_loaded=None):
+        """Queue rows; returns True if they (and anything buffered) were loaded now"""
+        self.rows.extend(rows)
+        if on_loaded:
+            self.callbacks.append(on_loaded)
+        if len(self.rows) >= self.flush_rows:
+            self.flush()
+            return True
+        return False
+
+    def flush(self):
+        rows, callbacks = self.rows, self.callbacks
+        self.rows, self.callbacks = [], []
+        if rows:
+            started = time.perf_counter()
+            try:
+                if self.mode == 'executemany':
+                    self._executemany(rows)
+                else:
+                    self._bulk(rows)
+            except Exception:
+                # Their checkpoints don't move, so the next run fetches them again
+                print(f"  ✗ Loading {len(rows)} price rows for {len(callbacks)} ticker(s) failed")
+                raise
+            if self.table == 'stock_history':
+                # Upserts rewrite existing rows without new ids
+                bump_history_revision(self.conn)
+            self.stats.add(self.mode, len(rows), time.perf_counter() - started)
+        for callback in callbacks:
+            callback()
+
+    def _executemany(self, rows):
+        for i in range(0, len(rows), WRITE_CHUNK_ROWS):
+            with self.conn.cursor() as cursor:
+                cursor.executemany(f"""
+                    INSERT INTO {self.table} (stock_id, price, avg_sentiment, recorded_at)
+                    VALUES (%s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE price = VALUES(price), avg_sentiment = VALUES(avg_sentiment)
+                """, rows[i:i + WRITE_CHUNK_ROWS])
+            self.conn.commit()
+
+    def _bulk(self, rows):
+        with self.conn.cursor() as cursor:
+            if not self._staged:
+                cursor.execute(f"""
+                    CREATE TEMPORARY TABLE IF NOT EXISTS {self.stage} (
+                        stock_id INT NOT NULL,
+                        price DECIMAL(10, 2),
+                        avg_sentiment DECIMAL(10, 6),
+                        recorded_at TIMESTAMP NOT NULL
+                    )
+                """)
+                self._staged = True
+            cursor.execute(f"TRUNCATE TABLE {self.stage}")
+        if self.mode == 'load_data':
+            try:
+                self._stage_load_data(rows)
+            except pymysql.err.MySQLError as e:
+                if not (e.args and e.args[0] in LOCAL_INFILE_REFUSED):
+                    raise
+                print(f"  ⚠ LOAD DATA LOCAL INFILE refused ({e}); falling back to multi-row INSERT")
+                self.mode = 'insert'
+        if self.mode == 'insert':
+            self._stage_insert(rows)
+        with self.conn.cursor() as cursor:
+            cursor.execute(f"""
+                INSERT INTO {self.table} (stock_id, price, avg_sentiment, recorded_at)
+                SELECT stock_id, price, avg_sentiment, recorded_at
+                FROM {self.stage}
+                ORDER BY stock_id, recorded_at
+                ON DUPLICATE KEY UPDATE price = VALUES(price), avg_sentiment = VALUES(avg_sentiment)
+            """)
+        self.conn.commit()
+
+    def _stage_load_data(self, rows):
+        with tempfile.NamedTemporaryFile('w', suffix='.tsv', delete=False) as f:
+            path = f.name
+            for stock_id, price, sentiment, recorded_at in rows:
+                f.write(f"{stock_id}\t{price:.2f}\t{sentiment:.6f}\t{recorded_at:%Y-%m-%d %H:%M:%S}\n")
+        try:
+            with self.conn.cursor() as cursor:
+                cursor.execute(f"""
+                    LOAD DATA LOCAL INFILE %s INTO TABLE {self.stage}
+                    FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n'
+                    (stock_id, price, avg_sentiment, recorded_at)
+                """, (path,))
+        finally:
+            os.unlink(path)
+
+    def _stage_insert(self, rows):
+        with self.conn.cursor() as cursor:
+            for i in range(0, len(rows), BULK_INSERT_ROWS):
+                chunk = rows[i:i + BULK_INSERT_ROWS]
+                cursor.execute(
+                    f"INSERT INTO {self.stage} (stock_id, price, avg_sentiment, recorded_at) VALUES "
+                    + ",".join(["(%s, %s, %s, %s)"] * len(chunk)),
+                    [value for row in chunk for value in row]
+                )
+
+def backfill_stock(conn, stock_id, ticker, months=12, loader=None):
+    """
+    Fill in what's missing for a stock over the last `months` months. Safe to
+    re-run: prices upsert on (stock_id, recorded_at), articles on their
+    fingerprint, and checkpoints skip windows an earlier run already fetched,
+    so a run after a failure only does the work that failed.
+
+    Prices go through loader (a PriceLoader on conn); a bulk-mode loader may
+    hold them until later tickers fill its buffer, and the caller flushes it.
+    """
     print(f"\n{'='*60}")
     print(f"Processing {ticker}")
     print(f"{'='*60}")
@@ -342,122 +933,126 @@ def backfill_stock(conn, stock_id, ticker, months=12):
     end_date = datetime.now()
     start_date = end_date - timedelta(days=months*30)
     
-    # 1. Fetch historical prices
-    time_series = fetch_time_series_daily(ticker)
-    
-    if not time_series:
-        print(f"  ✗ Skipping {ticker} - no price data")
-        return False
+    # 1. Coverage scan: which trading days are missing?
+    window = _price_window(conn, ticker)
+    missing = find_missing_days(conn, stock_id, start_date.date(), end_date.date(), window)
+    time_series = {}
+    if missing:
+        print(f"  {len(missing)} missing trading day(s) between {missing[0]} and {missing[-1]}")
+        time_series = fetch_time_series_daily(ticker, missing[0], missing[-1])
+        if time_series is None:
+            print(f"  ✗ Skipping {ticker} - no price data")
+            return False
+    else:
+        print(f"  ✓ Prices already complete")
     
-    # 2. Fetch and process news FIRST
-    articles = fetch_news(ticker)
-    print(f"  ✓ Found {len(articles)} articles")
+    # 2. News published since the last fetch
+    news_through = get_checkpoint(conn, ticker, 'news_through')
+    news_through = datetime.fromisoformat(news_through) if news_through else None
+    if news_through and news_through > end_date - NEWS_REFRESH:
+        print(f"  ✓ News fetched at {news_through:%Y-%m-%d %H:%M}, skipping")
+    else:
+        stored, complete = stream_articles(conn, stock_id, ticker, max(start_date, news_through or start_date), end_date)
+        print(f"  ✓ Stored {stored} articles" if complete else f"  ⚠ Stored {stored} articles, news incomplete")
     
-    # Process articles and build daily sentiment map
-    daily_sentiments = {}  # date -> avg sentiment
+    if not missing:
+        print(f"  ✓ Completed {ticker}")
+        return True
     
-    if articles:
-        article_texts = []
-        article_data = []
-        
-        for article in articles:
-            title = article.get('title', '')
-            summary = article.get('summary', '')
-            time_published = article.get('time_published', '')
-            
-            if not title or not time_published:
-                continue
-            
-            try:
-                published_dt = datetime.strptime(time_published, '%Y%m%dT%H%M%S')
-            except ValueError:
-                continue
-            
-            text = f"{title}. {summary}"
-            article_texts.append(text)
-            article_data.append({
-                'title': title[:500],
-                'published_dt': published_dt,
-                'published_date': published_dt.date()
-            })
-        
-        if article_texts:
-            print(f"  Processing {len(article_texts)} articles with Comprehend...")
-            
-            # Batch process sentiment and keywords
-            sentiments = batch_analyze_sentiment(article_texts)
-            keywords_list = batch_extract_keywords(article_texts)
-            
-            # Store articles and calculate daily averages
-            articles_to_store = []
-            daily_sentiment_lists = {}  # date -> list of scores
-            
-            for i, data in enumerate(article_data):
-                sentiment = sentiments[i]
-                keywords = keywords_list[i]
-                
-                articles_to_store.append((
-                    stock_id,
-                    data['title'],
-                    keywords,
-                    sentiment,
-                    data['published_dt']
-                ))
-                
-                # Track for daily average
-                date = data['published_date']
-                if date not in daily_sentiment_lists:
-                    daily_sentiment_lists[date] = []
-                daily_sentiment_lists[date].append(sentiment)
-            
-            # Calculate daily averages
-            for date, sentiment_list in daily_sentiment_lists.items():
-                daily_sentiments[date] = sum(sentiment_list) / len(sentiment_list)
-            
-            # Bulk insert articles
-            with conn.cursor() as cursor:
-                cursor.executemany("""
-                    INSERT INTO article_history (stock_id, title, keywords, sentiment_score, recorded_at)
-                    VALUES (%s, %s, %s, %s, %s)
-                """, articles_to_store)
-            conn.commit()
-            print(f"  ✓ Stored {len(articles_to_store)} articles")
-            print(f"  ✓ Calculated sentiment for {len(daily_sentiments)} unique days")
-    
-    # 3. Now insert prices WITH sentiment where available
+    # 3. Upsert the fetched days, with sentiment from every article stored for them
+    sentiments = daily_sentiments(conn, stock_id, missing[0], missing[-1])
     prices_to_store = []
     for date_str, daily_data in time_series.items():
         date_obj = datetime.strptime(date_str, '%Y-%m-%d')
         
-        if date_obj < start_date or date_obj > end_date:
+        if date_obj.date() < start_date.date() or date_obj > end_date:
             continue
         
         close_price = float(daily_data.get('4. close', 0))
         
         # Get sentiment for this date if available, otherwise 0
-        avg_sentiment = daily_sentiments.get(date_obj.date(), 0.0)
+        avg_sentiment = sentiments.get(date_obj.date(), 0.0)
         
         prices_to_store.append((stock_id, close_price, avg_sentiment, date_obj))
     
-    # Bulk insert prices with sentiment already calculated
-    with conn.cursor() as cursor:
-        cursor.executemany("""
-            INSERT INTO stock_history (stock_id, price, avg_sentiment, recorded_at)
-            VALUES (%s, %s, %s, %s)
-        """, prices_to_store)
-    conn.commit()
+    # Days from the first requested to the last one Tiingo returned are
+    # known once stored (gaps in between are holidays); later ones may just
+    # not be posted yet
+    on_loaded = None
+    if prices_to_store:
+        fetched_from, fetched_to = missing[0], max(row[3].date() for row in prices_to_store)
+        if window:
+            fetched_from, fetched_to = min(fetched_from, window[0]), max(fetched_to, window[1])
+        on_loaded = lambda: set_checkpoint(conn, ticker, 'prices', f"{fetched_from:%Y-%m-%d}/{fetched_to:%Y-%m-%d}")
+    
+    loader = loader or PriceLoader(conn, mode='executemany')
+    stored = loader.add(prices_to_store, on_loaded)
     
-    # Count how many had real sentiment vs default 0
-    sentiment_days = len(daily_sentiments)
+    sentiment_days = sum(1 for row in prices_to_store if row[3].date() in sentiments)
     total_days = len(prices_to_store)
     
-    print(f"  ✓ Stored {total_days} price records")
-    print(f"  ✓ {sentiment_days} days have article sentiment ({sentiment_days/total_days*100:.1f}%)")
-    print(f"  ✓ {total_days - sentiment_days} days default to 0 (no articles)")
+    print(f"  ✓ {'Stored' if stored else 'Staged for bulk load:'} {total_days} price records")
+    if total_days:
+        print(f"  ✓ {sentiment_days} days have article sentiment ({sentiment_days/total_days*100:.1f}%)")
+        print(f"  ✓ {total_days - sentiment_days} days default to 0 (no articles)")
     
     print(f"  ✓ Completed {ticker}")
     return True
 
+def run_backfill(stocks, workers=BACKFILL_WORKERS, months=3):
+    """
+    Backfill stocks on a pool of workers, each with its own DB connection.
+    Pacing comes from the shared per-provider RateLimiters, so the run takes
+    as long as the quotas require and no longer. Returns the success count.
+    """
+    local = threading.local()
+    loaders = []
+    loaders_lock = threading.Lock()
+    progress = Progress(len(stocks))
+
+    def backfill_one(stock):
+        loader = getattr(local, 'loader', None)
+        if loader is None:
+            loader = local.loader = PriceLoader(get_db_connection())
+            with loaders_lock:
+                loaders.append(loader)
+        return backfill_stock(loader.conn, stock['id'], stock['ticker'], months=months, loader=loader)
+
+    success_count = 0
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(backfill_one, stock): stock for stock in stocks}
+            for future in as_completed(futures):
+                ticker = futures[future]['ticker']
+                try:
+                    ok = future.result()
+                except Exception as e:
+                    print(f"  ✗ ERROR processing {ticker}: {e}")
+                    import traceback
+                    traceback.print_exc()
+                    ok = False
+                success_count += 1 if ok else 0
+                progress.done(ticker, ok)
+        # Whatever the bulk loaders still buffer
+        for loader in loaders:
+            pending = len(loader.callbacks)
+            try:
+                loader.flush()
+            except Exception as e:
+                print(f"  ✗ Final price load failed (re-run to fill): {e}")
+                success_count -= pending
+    finally:
+        for loader in loaders:
+            loader.conn.close()
+
+    print(f"  Prices: {LOAD_STATS.summary()}")
+    for line in NLP_STATS.summary():
+        print(f"  Comprehend {line}")
+    for limiter in LIMITERS.values():
+        print(f"  {limiter.name}: {limiter.count} calls, {limiter.waited:.0f}s waiting on quota "
+              f"({limiter.calls} per {limiter.period}s)")
+    return success_count
+
 def main():
     """Main backfill process"""
     start_time = time.time()
@@ -525,26 +1120,10 @@ def main():
     print("STARTING BACKFILL PROCESS")
     print("="*60)
     
-    success_count = 0
-    for i, stock in enumerate(stocks, 1):
-        print(f"\n[{i}/{len(stocks)}] Starting {stock['ticker']}...")
-        
-        try:
-            if backfill_stock(conn, stock['id'], stock['ticker'], months=3):
-                success_count += 1
-        except Exception as e:
-            print(f"  ✗ ERROR processing {stock['ticker']}: {e}")
-            import traceback
-            traceback.print_exc()
-            continue
-        
-        # Rate limit: Alpha Vantage free tier allows 5 calls per minute
-        # Wait 15 seconds between stocks to avoid rate limits
-        if i < len(stocks):
-            print(f"  Waiting 15 seconds to avoid rate limits...")
-            time.sleep(15)
-    
+    # Workers open their own connections
     conn.close()
+    print(f"  {BACKFILL_WORKERS} workers, paced by provider quotas; prices via {PRICE_LOAD_MODE}")
+    success_count = run_backfill(stocks)
     
     elapsed = time.time() - start_time
     
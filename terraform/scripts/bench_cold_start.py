@@ -0,0 +1,99 @@
+"""
+Cold-start profile for the get_stocks Lambda.
+
+Two reports, both from fresh interpreters so nothing is warm:
+
+  import profile  runs `python -X importtime -c "import handler"` and lists the
+                  slowest modules handler.py pulls in (cumulative us), so a new
+                  eager import shows up before it ships.
+  cold start      spawns N processes that import handler and serve one request
+                  that needs no database (OPTIONS), and reports init / first
+                  invoke times. Lambda bills init the same way.
+
+Needs no database or AWS credentials.
+
+Usage: python3 bench_cold_start.py [--runs N] [--top N]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HANDLER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda", "get_stocks")
+
+# Runs inside each fresh interpreter
+_COLD_START = """
+import json, time
+t0 = time.perf_counter()
+import handler
+t1 = time.perf_counter()
+handler.lambda_handler({"httpMethod": "OPTIONS", "path": "/stocks", "headers": {}}, None)
+t2 = time.perf_counter()
+print(json.dumps({"init_ms": (t1 - t0) * 1000, "invoke_ms": (t2 - t1) * 1000}))
+"""
+
+
+def _env():
+    env = dict(os.environ)
+    # handler.py reads these at import time
+    for name in ("DB_HOST", "DB_USER", "DB_PASS", "DB_NAME"):
+        env.setdefault(name, "bench")
+    env.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    return env
+
+
+def import_profile(top):
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import handler"],
+        cwd=HANDLER_DIR, env=_env(), capture_output=True, text=True, check=True,
+    )
+    # "import time: self [us] | cumulative | <indent>name"; everything after the
+    # interpreter's own startup imports belongs to handler
+    entries = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((int(cumulative_us), int(self_us), depth, name.strip()))
+    start = max((i for i, e in enumerate(entries) if e[3] == "site"), default=-1) + 1
+    entries = entries[start:]
+    total = next(e[0] for e in entries if e[3] == "handler")
+
+    print(f"import handler: {total / 1000:.1f} ms cumulative")
+    print(f"{'cum ms':>8} {'self ms':>8}  module")
+    for cumulative_us, self_us, depth, name in sorted(entries, reverse=True)[:top]:
+        print(f"{cumulative_us / 1000:>8.1f} {self_us / 1000:>8.1f}  {'  ' * max(depth - 1, 0)}{name}")
+
+
+def cold_start(runs):
+    samples = []
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, "-c", _COLD_START],
+            cwd=HANDLER_DIR, env=_env(), capture_output=True, text=True, check=True,
+        )
+        samples.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    print(f"\ncold start over {runs} fresh interpreters")
+    print(f"{'':>10} {'min':>8} {'median':>8} {'max':>8}")
+    for field in ("init_ms", "invoke_ms"):
+        values = [s[field] for s in samples]
+        print(f"{field:>10} {min(values):>8.2f} {statistics.median(values):>8.2f} {max(values):>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    import_profile(args.top)
+    cold_start(args.runs)
+
+
+if __name__ == "__main__":
+    main()
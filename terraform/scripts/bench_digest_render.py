@@ -0,0 +1,130 @@
+"""
+Benchmark digest rendering in the test_notifs Lambda.
+
+Builds a synthetic run (default 10k users x 20 watched tickers drawn from a
+500-ticker universe) and times three ways of producing the bodies:
+
+  per-user    every user's email formatted ticker by ticker, text and HTML
+              (how format_watchlist_email used to work)
+  shared      DigestRenderer: each ticker's blocks formatted once, each email
+              a join of the cached fragments
+  template    DigestRenderer.template_data + json.dumps, what the templated
+              bulk-send path builds per recipient
+
+and sets the result against the I/O the same run has to do anyway: sending
+N emails at the SES send rate, and at --send-latency-ms per request spread
+over the dispatcher's workers. Rendering should be a rounding error next to
+either.
+
+Needs no database or AWS credentials.
+
+Usage: python3 bench_digest_render.py [--users 10000] [--tickers 20] [--universe 500]
+                                      [--rate 14] [--send-latency-ms 25] [--workers 8]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from decimal import Decimal
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "lambda", "test_notifs"))
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import handler  # noqa: E402
+
+
+def synthetic_run(users, tickers_per_user, universe):
+    rng = random.Random(42)
+    stocks = [{"stock_id": i, "ticker": f"T{i:04d}"} for i in range(1, universe + 1)]
+    snapshots = {
+        s["stock_id"]: {
+            "stock_id": s["stock_id"],
+            "price": Decimal(f"{rng.uniform(5, 900):.2f}"),
+            "avg_sentiment": Decimal(f"{rng.uniform(-1, 1):.6f}"),
+        }
+        for s in stocks
+        if rng.random() > 0.02  # a few tickers with no history yet
+    }
+    recipients = [
+        (f"user{u}@example.com", sorted(rng.sample(stocks, tickers_per_user), key=lambda s: s["ticker"]))
+        for u in range(users)
+    ]
+    return recipients, snapshots
+
+
+def per_user(recipients, snapshots):
+    """Every block formatted again for every user, as before fragment caching"""
+    bodies = []
+    for _, stocks in recipients:
+        text = handler.DIGEST_TEXT_HEADER
+        rows = handler.DIGEST_HTML_HEADER
+        for stock in stocks:
+            snapshot = snapshots.get(stock["stock_id"]) or {}
+            price = handler._price_text(snapshot.get("price"))
+            sentiment = handler._sentiment_text(snapshot.get("avg_sentiment"))
+            text += f"📊 {stock['ticker']}\n"
+            text += f"   Price: {price}\n"
+            text += f"   Sentiment: {sentiment}\n"
+            text += "\n"
+            rows += (
+                f"<tr><td>{handler.html.escape(stock['ticker'])}</td><td>{handler.html.escape(price)}</td>"
+                f"<td>{handler.html.escape(sentiment)}</td></tr>\n"
+            )
+        bodies.append((text + handler.DIGEST_TEXT_FOOTER, rows + handler.DIGEST_HTML_FOOTER))
+    return bodies
+
+
+def shared(recipients, snapshots):
+    renderer = handler.DigestRenderer(snapshots)
+    return [renderer.render(stocks) for _, stocks in recipients]
+
+
+def template(recipients, snapshots):
+    renderer = handler.DigestRenderer(snapshots)
+    return [json.dumps(renderer.template_data(stocks)) for _, stocks in recipients]
+
+
+def timed(fn, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn(*args)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best, out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--tickers", type=int, default=20)
+    parser.add_argument("--universe", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=14, help="SES max send rate (production default is 14/s)")
+    parser.add_argument("--send-latency-ms", type=float, default=25)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    recipients, snapshots = synthetic_run(args.users, args.tickers, args.universe)
+    results = {name: timed(fn, recipients, snapshots) for name, fn in
+               (("per-user", per_user), ("shared", shared), ("template", template))}
+    assert results["per-user"][1] == results["shared"][1], "shared rendering changed the output"
+
+    n = len(recipients)
+    rate_floor = n / args.rate
+    latency_floor = n * args.send_latency_ms / 1000 / args.workers
+    io_floor = max(rate_floor, latency_floor)
+
+    print(f"{n} users x {args.tickers} tickers ({args.universe}-ticker universe)\n")
+    print(f"{'render':>10} {'total ms':>10} {'us/email':>9} {'% of I/O':>9}")
+    for name, (seconds, _) in results.items():
+        print(f"{name:>10} {seconds * 1000:>10.1f} {seconds / n * 1e6:>9.1f} {seconds / io_floor * 100:>8.3f}%")
+    print(f"\nI/O floor for the same run: {io_floor:.1f}s "
+          f"(send rate {args.rate:g}/s -> {rate_floor:.1f}s; "
+          f"{args.send_latency_ms:g}ms x {n} / {args.workers} workers -> {latency_floor:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Benchmark /stock-history response encoding: row dicts vs ?format=columnar.
+
+Builds synthetic stock_history rows shaped like the pymysql cursor output
+and times both paths end to end (the row format as one page of
+stream_stock_history_page, columnar through _resp's encoder). Needs no
+database.
+
+Usage: python3 bench_history_format.py [rows ...]
+"""
+import os
+import sys
+import time
+from decimal import Decimal
+from datetime import datetime, timedelta
+
+# handler.py reads these at import time
+for _name in ("DB_HOST", "DB_USER", "DB_PASS", "DB_NAME"):
+    os.environ.setdefault(_name, "bench")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lambda", "get_stocks"))
+import handler  # noqa: E402
+
+
+class _FakeCursor:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        pass
+
+    def fetchall(self):
+        return self._rows
+
+    def __iter__(self):
+        return iter(self._rows)
+
+
+class _FakeConn:
+    """Returns page rows for the streaming SSCursor and columnar tuple rows for pymysql.cursors.Cursor"""
+
+    def __init__(self, page_rows, tuple_rows):
+        self._page_rows = page_rows
+        self._tuple_rows = tuple_rows
+
+    def cursor(self, cursorclass=None):
+        return _FakeCursor(self._page_rows if cursorclass is handler.pymysql.cursors.SSCursor else self._tuple_rows)
+
+
+def make_rows(n):
+    start = datetime(2024, 1, 1)
+    page_rows, tuple_rows = [], []
+    for i in range(n):
+        recorded_at = start + timedelta(hours=i)
+        price = Decimal(f"{150 + (i % 500) / 10:.2f}")
+        sentiment = Decimal(f"{((i % 200) - 100) / 250:.6f}")
+        page_rows.append((i + 1, 1, "AAPL", price, sentiment, recorded_at))
+        tuple_rows.append((1, "AAPL", recorded_at, price, sentiment))
+    return page_rows, tuple_rows
+
+
+def row_format(conn):
+    return handler.stream_stock_history_page(
+        conn, ticker="AAPL", time_range="all", limit=len(conn._page_rows)
+    )
+
+
+def columnar_format(conn):
+    return handler._resp(200, handler.get_stock_history_columnar(
+        conn, ticker="AAPL", time_range="all"
+    ))["body"]
+
+
+def bench(fn, conn, repeat):
+    best = float("inf")
+    body = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        body = fn(conn)
+        best = min(best, time.perf_counter() - t0)
+    return best, len(body.encode("utf-8"))
+
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [168, 2160, 8760, 50000]
+    print(f"{'rows':>8} {'rows ms':>10} {'col ms':>10} {'speedup':>8} {'rows KB':>10} {'col KB':>10} {'ratio':>6}")
+    for n in sizes:
+        conn = _FakeConn(*make_rows(n))
+        repeat = max(3, 20000 // n)
+        row_s, row_b = bench(row_format, conn, repeat)
+        col_s, col_b = bench(columnar_format, conn, repeat)
+        print(
+            f"{n:>8} {row_s * 1000:>10.2f} {col_s * 1000:>10.2f} {row_s / col_s:>7.1f}x "
+            f"{row_b / 1024:>10.1f} {col_b / 1024:>10.1f} {row_b / col_b:>5.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Benchmark per-ticker range scans on the old and new stock_history layouts.
+
+  flat       id INT primary key + (stock_id, recorded_at) secondary index
+             (the layout after migration 0003)
+  clustered  primary key (stock_id, recorded_at, id), monthly RANGE
+             partitions on recorded_at (migration 0004)
+
+Loads the same synthetic hourly history into scratch tables in both layouts
+(rows arrive one hour at a time across all tickers, the way the scheduler
+writes them), then times the /stock-history range query for several ranges
+and reports latency plus InnoDB buffer pool page reads per query. Scratch
+tables are dropped afterwards unless --keep is given.
+
+Needs DB_HOST / DB_USER / DB_PASS / DB_NAME for a scratch or dev database.
+
+Usage: python3 bench_history_layout.py [--tickers 50] [--days 730] [--repeat 30] [--keep]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pymysql
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "lambda", "shared"))
+from partitions import add_months, month_start, partition_clause  # noqa: E402
+
+FLAT = "bench_history_flat"
+CLUSTERED = "bench_history_clustered"
+RANGES = {"24h": 1, "7d": 7, "30d": 30, "90d": 90, "1y": 365}
+
+
+def connect():
+    return pymysql.connect(
+        host=os.environ["DB_HOST"],
+        user=os.environ["DB_USER"],
+        password=os.environ["DB_PASS"],
+        database=os.environ.get("DB_NAME", "stocknewsanalyzerdb"),
+        connect_timeout=10,
+    )
+
+
+def create_tables(conn, start, end):
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {FLAT}, {CLUSTERED}")
+        cursor.execute(f"""
+            CREATE TABLE {FLAT} (
+                id INT AUTO_INCREMENT PRIMARY KEY NOT NULL,
+                stock_id INT NOT NULL,
+                price DECIMAL(10, 2),
+                avg_sentiment DECIMAL(10, 6),
+                recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_stock_recorded (stock_id, recorded_at)
+            )
+        """)
+        cursor.execute(f"""
+            CREATE TABLE {CLUSTERED} (
+                id BIGINT NOT NULL AUTO_INCREMENT,
+                stock_id INT NOT NULL,
+                price DECIMAL(10, 2),
+                avg_sentiment DECIMAL(10, 6),
+                recorded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (stock_id, recorded_at, id),
+                KEY idx_id (id)
+            )
+        """ + partition_clause(month_start(start), add_months(month_start(end), 1)))
+    conn.commit()
+
+
+def load(conn, tickers, start, hours, batch=5000):
+    rng = random.Random(42)
+    sql = "INSERT INTO {} (stock_id, price, avg_sentiment, recorded_at) VALUES (%s, %s, %s, %s)"
+    rows = []
+    loaded = 0
+    t0 = time.perf_counter()
+    for h in range(hours):
+        recorded_at = start + timedelta(hours=h)
+        for stock_id in range(1, tickers + 1):
+            rows.append((stock_id, round(rng.uniform(10, 500), 2), round(rng.uniform(-1, 1), 6), recorded_at))
+        if len(rows) >= batch or h == hours - 1:
+            with conn.cursor() as cursor:
+                cursor.executemany(sql.format(FLAT), rows)
+                cursor.executemany(sql.format(CLUSTERED), rows)
+            conn.commit()
+            loaded += len(rows)
+            rows = []
+    print(f"loaded {loaded} rows per table in {time.perf_counter() - t0:.1f}s")
+    with conn.cursor() as cursor:
+        cursor.execute(f"ANALYZE TABLE {FLAT}, {CLUSTERED}")
+        cursor.fetchall()
+
+
+def _page_reads(cursor):
+    cursor.execute("SHOW SESSION STATUS LIKE 'Innodb_buffer_pool_read_requests'")
+    return int(cursor.fetchone()[1])
+
+
+def bench_range(conn, table, tickers, end, days, repeat):
+    rng = random.Random(7)
+    sql = f"""
+        SELECT recorded_at, price, avg_sentiment
+        FROM {table}
+        WHERE stock_id = %s AND recorded_at >= %s
+        ORDER BY recorded_at ASC
+    """
+    times, pages = [], []
+    rows = 0
+    with conn.cursor() as cursor:
+        for _ in range(repeat):
+            params = (rng.randint(1, tickers), end - timedelta(days=days))
+            before = _page_reads(cursor)
+            t0 = time.perf_counter()
+            cursor.execute(sql, params)
+            rows = len(cursor.fetchall())
+            times.append((time.perf_counter() - t0) * 1000)
+            pages.append(_page_reads(cursor) - before)
+        cursor.execute("EXPLAIN " + sql, params)
+        names = [d[0] for d in cursor.description]
+        plan = dict(zip(names, cursor.fetchone()))
+    times.sort()
+    return {
+        "median_ms": statistics.median(times),
+        "p95_ms": times[int(len(times) * 0.95) - 1],
+        "pages": statistics.median(pages),
+        "rows": rows,
+        "key": plan.get("key"),
+        "partitions": len((plan.get("partitions") or "").split(",")) if plan.get("partitions") else "-",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tickers", type=int, default=50)
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--keep", action="store_true", help="keep the scratch tables")
+    args = parser.parse_args()
+
+    end = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    start = end - timedelta(days=args.days)
+    conn = connect()
+    try:
+        create_tables(conn, start, end)
+        load(conn, args.tickers, start, args.days * 24)
+
+        print(f"\n{'range':>6} {'layout':>10} {'median ms':>10} {'p95 ms':>8} {'pages':>7} {'rows':>6} {'parts':>6}  key")
+        for name, days in RANGES.items():
+            for label, table in (("flat", FLAT), ("clustered", CLUSTERED)):
+                r = bench_range(conn, table, args.tickers, end, days, args.repeat)
+                print(
+                    f"{name:>6} {label:>10} {r['median_ms']:>10.2f} {r['p95_ms']:>8.2f} "
+                    f"{r['pages']:>7} {r['rows']:>6} {r['partitions']:>6}  {r['key']}"
+                )
+    finally:
+        if not args.keep:
+            with conn.cursor() as cursor:
+                cursor.execute(f"DROP TABLE IF EXISTS {FLAT}, {CLUSTERED}")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Benchmark the backfill's ways of writing historical prices to stock_history.
+
+  executemany  per-ticker executemany upserts, committed per chunk (the
+               backfill's default, and how it has always written prices)
+  insert       rows buffered across tickers, staged with multi-row INSERTs
+               into an index-less temporary table, merged in one sorted
+               INSERT ... SELECT ... ON DUPLICATE KEY UPDATE
+  load_data    the same, staged with LOAD DATA LOCAL INFILE from a TSV file
+
+Each mode loads the same synthetic daily closes (default 500 tickers x 10
+years of weekdays, ~1.3M rows) into a fresh scratch copy of stock_history
+(CREATE TABLE ... LIKE, so same partitions and keys), then loads them again
+to time the all-duplicates upsert a re-run does. Reports rows/s for both.
+The scratch table is dropped afterwards unless --keep is given.
+
+load_data needs local_infile enabled on the server (SET GLOBAL local_infile
+= 1, or the RDS parameter group); without it the loader falls back to
+insert, which the output shows.
+
+Needs DB_HOST / DB_USER / DB_PASS / DB_NAME for a scratch or dev database
+with the migrations applied.
+
+Usage: python3 bench_price_load.py [--tickers 500] [--years 10] [--modes executemany,insert,load_data] [--keep]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pymysql
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import backfill_data  # noqa: E402
+
+TABLE = "bench_price_load"
+
+
+def connect():
+    return pymysql.connect(
+        host=os.environ["DB_HOST"],
+        user=os.environ["DB_USER"],
+        password=os.environ["DB_PASS"],
+        database=os.environ.get("DB_NAME", "stocknewsanalyzerdb"),
+        connect_timeout=10,
+        local_infile=True,
+    )
+
+
+def synthetic_prices(tickers, years):
+    """[(stock_id, rows)] of weekday closes, the shape backfill_stock produces"""
+    rng = random.Random(42)
+    end = datetime(2026, 1, 1)
+    start = end - timedelta(days=365 * years)
+    days = [start + timedelta(days=d) for d in range((end - start).days) if (start + timedelta(days=d)).weekday() < 5]
+    out = []
+    for stock_id in range(1, tickers + 1):
+        price = rng.uniform(5, 500)
+        rows = []
+        for day in days:
+            price = max(1.0, price * (1 + rng.gauss(0, 0.02)))
+            rows.append((stock_id, round(price, 2), round(rng.uniform(-1, 1), 6), day))
+        out.append((stock_id, rows))
+    return out
+
+
+def reset_table(conn):
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        cursor.execute(f"CREATE TABLE {TABLE} LIKE stock_history")
+    conn.commit()
+
+
+def load(conn, mode, prices):
+    """Seconds to write every ticker's rows through a PriceLoader in this mode"""
+    stats = backfill_data.LoadStats()
+    loader = backfill_data.PriceLoader(conn, mode=mode, table=TABLE, stats=stats)
+    started = time.perf_counter()
+    for _, rows in prices:
+        loader.add(rows)
+    loader.flush()
+    return time.perf_counter() - started, loader.mode
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tickers", type=int, default=500)
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--modes", default="executemany,insert,load_data")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch table")
+    args = parser.parse_args()
+
+    prices = synthetic_prices(args.tickers, args.years)
+    total = sum(len(rows) for _, rows in prices)
+    print(f"{args.tickers} tickers x {args.years} years = {total} rows "
+          f"(bulk buffer {backfill_data.BULK_LOAD_ROWS} rows, insert chunk {backfill_data.BULK_INSERT_ROWS})\n")
+    print(f"{'mode':>12} {'fresh s':>9} {'rows/s':>10} {'re-run s':>9} {'rows/s':>10}")
+
+    conn = connect()
+    try:
+        for mode in args.modes.split(","):
+            reset_table(conn)
+            fresh, used = load(conn, mode, prices)
+            rerun, _ = load(conn, used, prices)
+            with conn.cursor() as cursor:
+                cursor.execute(f"SELECT COUNT(*) FROM {TABLE}")
+                stored = cursor.fetchone()[0]
+            assert stored == total, f"{mode}: {stored} rows stored, expected {total}"
+            label = mode if used == mode else f"{mode}->{used}"
+            print(f"{label:>12} {fresh:>9.1f} {total / fresh:>10,.0f} {rerun:>9.1f} {total / rerun:>10,.0f}")
+    finally:
+        if not args.keep:
+            with conn.cursor() as cursor:
+                cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+            conn.commit()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Profile the SQL behind each get_stocks route against a real database.
+
+Runs a set of representative API requests through handler.lambda_handler with
+the query profiler on and caches off, then prints the per-fingerprint report
+for each route. Every SELECT is EXPLAINed by default (dev data is too small
+for the latency threshold to trip), so a full-table sort on stock_history
+shows up here before it shows up in production.
+
+Needs DB_HOST / DB_USER / DB_PASS / DB_NAME for a dev or staging database.
+
+Usage: python3 profile_queries.py [--tickers AAPL,MSFT] [--user-id 1] [--strict]
+  --strict  exit 1 if any route has an N+1 loop or a full scan/filesort
+"""
+import argparse
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "lambda", "shared"))
+sys.path.insert(0, os.path.join(HERE, "..", "lambda", "get_stocks"))
+
+# Read by handler.py at import time: always hit SQL, never sample
+os.environ["CACHE_ENABLED"] = "false"
+os.environ["SERIES_ENABLED"] = "false"
+os.environ["METRICS_SAMPLE_RATE"] = "0"
+os.environ.setdefault("QUERY_PROFILE_EXPLAIN_MS", "0")
+
+import handler  # noqa: E402
+from query_profiler import QueryProfiler  # noqa: E402
+
+
+def requests_for(tickers, user_id):
+    joined = ",".join(tickers)
+    return [
+        ("GET", "/stocks", {}),
+        ("GET", "/quotes", {"tickers": joined}),
+        ("GET", "/quotes", {"tickers": joined, "since": "v0"}),
+        ("GET", "/watchlist", {"user_id": user_id}),
+        ("GET", "/watchlist", {"user_id": user_id, "include": "quotes"}),
+        ("GET", "/stock-history", {"ticker": tickers[0], "range": "30d"}),
+        ("GET", "/stock-history", {"ticker": tickers[0], "range": "all", "format": "columnar"}),
+        ("GET", "/stock-history/batch", {"tickers": joined, "range": "30d"}),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tickers", default="AAPL,MSFT,GOOGL")
+    parser.add_argument("--user-id", default="1")
+    parser.add_argument("--strict", action="store_true")
+    args = parser.parse_args()
+
+    tickers = [t.strip().upper() for t in args.tickers.split(",") if t.strip()]
+    problems = 0
+    for method, path, qs in requests_for(tickers, args.user_id):
+        profiler = QueryProfiler.from_env()
+        event = {"httpMethod": method, "path": path, "queryStringParameters": qs, "headers": {}}
+        # Fresh data version per request so the version query is profiled too
+        handler._data_version["value"] = None
+        resp = handler._handle(event, profiler=profiler)
+
+        print(f"\n== {method} {path} {qs} -> {resp['statusCode']}")
+        print(profiler.format_report())
+        report = profiler.report()
+        problems += len(report["n_plus_one"]) + sum(len(e["warnings"]) for e in report["explains"])
+
+    print(f"\n{problems} finding(s)")
+    if args.strict and problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Local stand-in for the SES client used by the test_notifs Lambda.
+
+LocalSES implements the calls the Lambda makes (identity lookups,
+verification requests, send quota, send_email and templated bulk sends) in
+memory, enforces the same request limits SES does, and counts every call, so
+the number of SES round trips per run can be checked without touching AWS.
+With max_send_rate set it throttles like SES does when more recipients than
+that are sent to within a second, which exercises the dispatcher's retries:
+
+    ses = LocalSES(verified=["a@example.com"])
+    handler.ses = ses
+    handler.lambda_handler({}, None)
+    ses.calls  # Counter({"get_identity_verification_attributes": 1, ...})
+
+Run directly, it replays the Lambda against a dev database a few times with
+the stand-in swapped in and prints the call counts per run (the second run
+should find verified addresses in ses_identity_status and skip the lookup).
+Needs DB_HOST / DB_USER / DB_PASS / DB_NAME.
+
+Usage: python3 ses_standin.py [--verified a@x.com,b@x.com] [--runs 2] [--rate 14]
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+MAX_IDENTITIES_PER_LOOKUP = 100
+MAX_BULK_DESTINATIONS = 50
+
+
+class LocalSESError(Exception):
+    """Raised where SES would return an error response"""
+
+    def __init__(self, code, message):
+        super().__init__(f"{code}: {message}")
+        self.code = code
+
+
+class LocalSES:
+    def __init__(self, verified=(), pending=(), max_send_rate=None, clock=time.monotonic):
+        self.identities = {email: "Success" for email in verified}
+        self.identities.update({email: "Pending" for email in pending})
+        self.max_send_rate = max_send_rate
+        self.clock = clock
+        self.calls = Counter()
+        self.sent = []
+        self._recent = deque()  # send times within the last second
+        self._lock = threading.Lock()
+
+    def _call(self, name):
+        with self._lock:
+            self.calls[name] += 1
+
+    def _take_send_rate(self, n):
+        """Raise Throttling if n more recipients would exceed max_send_rate this second"""
+        if not self.max_send_rate:
+            return
+        with self._lock:
+            now = self.clock()
+            while self._recent and self._recent[0] <= now - 1.0:
+                self._recent.popleft()
+            if len(self._recent) + n > self.max_send_rate:
+                self.calls["throttled"] += 1
+                raise LocalSESError("Throttling", "Maximum sending rate exceeded.")
+            self._recent.extend([now] * n)
+
+    def _check_verified(self, addresses):
+        # Sandbox rules: sender and every recipient must be verified
+        for address in addresses:
+            if self.identities.get(address) != "Success":
+                raise LocalSESError("MessageRejected", f"Email address is not verified: {address}")
+
+    def verify(self, email):
+        """Simulate the recipient clicking the verification link"""
+        self.identities[email] = "Success"
+
+    def reset_counts(self):
+        with self._lock:
+            self.calls = Counter()
+            self.sent = []
+
+    def get_identity_verification_attributes(self, Identities):
+        self._call("get_identity_verification_attributes")
+        if len(Identities) > MAX_IDENTITIES_PER_LOOKUP:
+            raise LocalSESError("ValidationError", f"at most {MAX_IDENTITIES_PER_LOOKUP} identities per request")
+        return {
+            "VerificationAttributes": {
+                email: {"VerificationStatus": self.identities[email]}
+                for email in Identities if email in self.identities
+            }
+        }
+
+    def verify_email_identity(self, EmailAddress):
+        self._call("verify_email_identity")
+        if self.identities.get(EmailAddress) != "Success":
+            self.identities[EmailAddress] = "Pending"
+        return {}
+
+    def get_send_quota(self):
+        self._call("get_send_quota")
+        return {"Max24HourSend": 200.0, "MaxSendRate": float(self.max_send_rate or 1), "SentLast24Hours": 0.0}
+
+    def send_email(self, Source, Destination, Message, **kwargs):
+        self._call("send_email")
+        self._take_send_rate(1)
+        self._check_verified([Source] + Destination.get("ToAddresses", []))
+        with self._lock:
+            self.sent.append({"Source": Source, "Destination": Destination, "Message": Message})
+            return {"MessageId": f"local-{len(self.sent)}"}
+
+    def send_bulk_templated_email(self, Source, Template, Destinations, DefaultTemplateData=None, **kwargs):
+        self._call("send_bulk_templated_email")
+        if len(Destinations) > MAX_BULK_DESTINATIONS:
+            raise LocalSESError("ValidationError", f"at most {MAX_BULK_DESTINATIONS} destinations per request")
+        self._take_send_rate(len(Destinations))
+        self._check_verified([Source])
+        status = []
+        for destination in Destinations:
+            to = destination["Destination"]["ToAddresses"]
+            if any(self.identities.get(address) != "Success" for address in to):
+                status.append({"Status": "MessageRejected", "Error": f"Email address is not verified: {to[0]}"})
+                continue
+            with self._lock:
+                self.sent.append({
+                    "Source": Source,
+                    "Destination": destination["Destination"],
+                    "Template": Template,
+                    "TemplateData": json.loads(destination.get("ReplacementTemplateData") or DefaultTemplateData or "{}"),
+                })
+                status.append({"Status": "Success", "MessageId": f"local-{len(self.sent)}"})
+        return {"Status": status}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--verified", default="", help="comma-separated addresses to treat as verified")
+    parser.add_argument("--runs", type=int, default=2)
+    parser.add_argument("--rate", type=float, default=None, help="simulated SES max send rate (per second)")
+    args = parser.parse_args()
+
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.setdefault("QUERY_PROFILE", "false")
+    sys.path.insert(0, os.path.join(HERE, "..", "lambda", "shared"))
+    sys.path.insert(0, os.path.join(HERE, "..", "lambda", "test_notifs"))
+    import handler
+
+    ses = LocalSES(verified=[e.strip() for e in args.verified.split(",") if e.strip()], max_send_rate=args.rate)
+    handler.ses = ses
+    for run in range(1, args.runs + 1):
+        ses.reset_counts()
+        resp = handler.lambda_handler({}, None)
+        body = json.loads(resp["body"])
+        print(f"run {run}: status {resp['statusCode']}, sent {body.get('sent')}, skipped {body.get('skipped')}")
+        for name, count in sorted(ses.calls.items()):
+            print(f"  {name:<40} {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -20,6 +20,9 @@ cd /home/ec2-user/backfill
 # Download the backfill script from S3
 echo "Downloading backfill script from S3..."
 aws s3 cp s3://${SCRIPT_BUCKET}/backfill_data.py ./backfill_data.py
+aws s3 cp s3://${SCRIPT_BUCKET}/migrate.py ./migrate.py
+aws s3 cp s3://${SCRIPT_BUCKET}/partitions.py ./partitions.py
+aws s3 cp s3://${SCRIPT_BUCKET}/migrations/ ./migrations/ --recursive
 
 cat > requirements.txt << 'REQUIREMENTS'
 pymysql
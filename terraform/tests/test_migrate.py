@@ -0,0 +1,167 @@
+"""
+Concurrent runs of lambda/shared/migrate.py against an in-memory stand-in for
+MySQL: init_rds and the backfill's ensure_schema starting at the same time
+must apply each migration once, the second runner finding nothing to do.
+
+    python -m unittest discover terraform/tests
+"""
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda", "shared"))
+
+import migrate  # noqa: E402
+
+
+class FakeServer:
+    """The bits of MySQL run_migrations touches: named locks, schema_migrations, DDL"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.lock_owner = None
+        self.versions = {}
+        self.tables = []
+        self.waiting = threading.Event()
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.server = conn.server
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        server = self.server
+        if sql.startswith("SELECT GET_LOCK"):
+            if not server.lock.acquire(blocking=False):
+                server.waiting.set()
+                if not server.lock.acquire(timeout=params[1]):
+                    self.rows = [{"GET_LOCK": 0}]
+                    return
+            server.lock_owner = self.conn
+            self.rows = [{"GET_LOCK": 1}]
+        elif sql.startswith("SELECT RELEASE_LOCK"):
+            released = server.lock_owner is self.conn
+            if released:
+                server.lock_owner = None
+                server.lock.release()
+            self.rows = [{"RELEASE_LOCK": int(released)}]
+        elif "CREATE TABLE IF NOT EXISTS schema_migrations" in sql:
+            pass
+        elif sql.startswith("SELECT version, checksum FROM schema_migrations"):
+            self.rows = [{"version": v, "checksum": c} for v, c in sorted(server.versions.items())]
+        elif sql.startswith("INSERT INTO schema_migrations"):
+            version, _, checksum = params
+            if version in server.versions:
+                raise Exception(1062, f"Duplicate entry '{version}' for key 'PRIMARY'")
+            server.versions[version] = checksum
+        elif sql.startswith("CREATE TABLE"):
+            name = sql.split()[2]
+            if name in server.tables:
+                raise Exception(1050, f"Table '{name}' already exists")
+            server.tables.append(name)
+        else:
+            raise AssertionError(f"unexpected SQL: {sql}")
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakeConn:
+    def __init__(self, server):
+        self.server = server
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+# Holds the first runner inside its last migration until the second is queued on the lock
+SLOW_MIGRATION = '''
+import time
+
+def migrate(conn, log):
+    with conn.cursor() as cursor:
+        cursor.execute("CREATE TABLE slow_copy (id INT)")
+    conn.server.waiting.wait(5)
+    time.sleep(0.05)
+'''
+
+
+class ConcurrentRunTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.dir.name, "0001_first.sql"), "w") as f:
+            f.write("CREATE TABLE first (id INT);\nCREATE TABLE second (id INT);\n")
+        with open(os.path.join(self.dir.name, "0002_slow_copy.py"), "w") as f:
+            f.write(SLOW_MIGRATION)
+        self.server = FakeServer()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def run_both(self):
+        results, errors = {}, []
+
+        def runner(label):
+            try:
+                results[label] = migrate.run_migrations(
+                    FakeConn(self.server), self.dir.name, log=lambda msg: None, lock_timeout=5
+                )
+            except Exception as e:
+                errors.append(e)
+
+        first = threading.Thread(target=runner, args=("first",))
+        first.start()
+        # The second starts once the first is holding the lock
+        while self.server.lock_owner is None and first.is_alive():
+            pass
+        second = threading.Thread(target=runner, args=("second",))
+        second.start()
+        first.join(10)
+        second.join(10)
+        return results, errors
+
+    def test_second_runner_is_a_no_op(self):
+        results, errors = self.run_both()
+        self.assertEqual(errors, [])
+        self.assertEqual(results["first"], [(1, "first"), (2, "slow_copy")])
+        self.assertEqual(results["second"], [])
+        self.assertEqual(sorted(self.server.versions), [1, 2])
+        self.assertEqual(self.server.tables, ["first", "second", "slow_copy"])
+        self.assertIsNone(self.server.lock_owner)
+
+    def test_lock_released_when_a_migration_fails(self):
+        with open(os.path.join(self.dir.name, "0003_broken.sql"), "w") as f:
+            f.write("DROP EVERYTHING;\n")
+        self.server.waiting.set()
+        with self.assertRaises(migrate.MigrationError):
+            migrate.run_migrations(FakeConn(self.server), self.dir.name, log=lambda msg: None)
+        self.assertIsNone(self.server.lock_owner)
+
+    def test_lock_timeout_raises(self):
+        self.server.lock.acquire()
+        with self.assertRaises(migrate.MigrationError):
+            migrate.run_migrations(FakeConn(self.server), self.dir.name, log=lambda msg: None, lock_timeout=0.1)
+        self.assertEqual(self.server.versions, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
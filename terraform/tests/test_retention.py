@@ -0,0 +1,153 @@
+"""
+Monthly partition compaction in scheduler/retention.py against an in-memory
+stand-in for MySQL: a snapshot written to the month while it is being
+compacted must survive the EXCHANGE PARTITION swap.
+
+    python -m unittest discover terraform/tests
+"""
+import os
+import sys
+import threading
+import unittest
+from datetime import datetime, timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "lambda", "shared"))
+sys.path.insert(0, os.path.join(HERE, "..", "lambda", "scheduler"))
+
+import retention  # noqa: E402
+
+PARTITION = "p202401"
+
+
+class FakeServer:
+    """One stock_history partition, the side table, and LOCK TABLES on stock_history"""
+
+    def __init__(self, rows):
+        self.partition = list(rows)
+        self.compact = None
+        self.table_lock = threading.Lock()
+        self.lock_owner = None
+        self.writer_blocked = threading.Event()
+        self.after_copy = None
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.server = conn.server
+        self.rowcount = 0
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        server = self.server
+        sql = " ".join(sql.split())
+        if sql.startswith("DROP TABLE"):
+            server.compact = None
+        elif sql.startswith("CREATE TABLE stock_history_compact LIKE") or "REMOVE PARTITIONING" in sql:
+            server.compact = []
+        elif sql.startswith("LOCK TABLES"):
+            server.table_lock.acquire()
+            server.lock_owner = self.conn
+        elif sql.startswith("UNLOCK TABLES"):
+            if server.lock_owner is self.conn:
+                server.lock_owner = None
+                server.table_lock.release()
+        elif sql.startswith("INSERT INTO stock_history_compact"):
+            days = {}
+            for row in server.partition:
+                days.setdefault((row["stock_id"], row["recorded_at"].date()), []).append(row)
+            for rows in days.values():
+                last = max(rows, key=lambda r: r["recorded_at"])
+                avg = sum(r["avg_sentiment"] for r in rows) / len(rows)
+                server.compact.append(dict(last, avg_sentiment=avg))
+            self.rowcount = len(server.compact)
+            if server.after_copy:
+                server.after_copy()
+        elif sql.startswith("ALTER TABLE stock_history EXCHANGE PARTITION"):
+            server.partition, server.compact = server.compact, server.partition
+        elif sql.startswith("SELECT COUNT(*) FROM stock_history_compact"):
+            self.rows = [(len(server.compact),)]
+        elif sql.startswith("INSERT INTO stock_history "):
+            # Another session's write: waits while someone else holds the table lock
+            if server.lock_owner not in (None, self.conn):
+                server.writer_blocked.set()
+            with server.table_lock:
+                server.partition.append(dict(zip(("id", "stock_id", "price", "avg_sentiment", "recorded_at"), params)))
+        else:
+            raise AssertionError(f"unexpected SQL: {sql}")
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+
+class FakeConn:
+    def __init__(self, server):
+        self.server = server
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+
+def raw_month():
+    start = datetime(2024, 1, 1)
+    rows = []
+    for hour in range(48):
+        rows.append({
+            "id": hour + 1, "stock_id": 1, "price": 100.0 + hour,
+            "avg_sentiment": 0.1, "recorded_at": start + timedelta(hours=hour),
+        })
+    return rows
+
+
+class CompactPartitionTest(unittest.TestCase):
+    def test_write_during_compaction_is_kept(self):
+        server = FakeServer(raw_month())
+        late = (1000, 1, 150.0, 0.5, datetime(2024, 1, 20, 12))
+        writer = threading.Thread(
+            target=lambda: FakeConn(server).cursor().execute(
+                "INSERT INTO stock_history (id, stock_id, price, avg_sentiment, recorded_at) VALUES (%s, %s, %s, %s, %s)",
+                late,
+            )
+        )
+
+        def write_between_copy_and_exchange():
+            writer.start()
+            # Either the write waits on the lock or it has already landed
+            while not server.writer_blocked.is_set() and writer.is_alive():
+                writer.join(0.01)
+
+        server.after_copy = write_between_copy_and_exchange
+        removed = retention._compact_partition(FakeConn(server), PARTITION, log=lambda msg: None)
+        writer.join(5)
+
+        self.assertFalse(writer.is_alive())
+        self.assertEqual(removed, 48 - 2)
+        self.assertIn(1000, [row["id"] for row in server.partition])
+        self.assertEqual(len(server.partition), 3)
+        self.assertIsNone(server.lock_owner)
+
+    def test_lock_released_when_the_copy_fails(self):
+        server = FakeServer(raw_month())
+
+        def fail():
+            raise RuntimeError("copy failed")
+
+        server.after_copy = fail
+        with self.assertRaises(RuntimeError):
+            retention._compact_partition(FakeConn(server), PARTITION, log=lambda msg: None)
+        self.assertIsNone(server.lock_owner)
+        self.assertEqual(len(server.partition), 48)
+
+
+if __name__ == "__main__":
+    unittest.main()
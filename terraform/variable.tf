@@ -35,3 +35,9 @@ variable "api_stage" {
   default     = "prod" # change if stage is different
   description = "API Gateway stage name"
 }
+
+variable "notification_sender" {
+  type        = string
+  default     = ""
+  description = "Verified SES address digests are sent from; enables templated bulk sends (empty = one send_email per recipient)"
+}